@@ -13,4 +13,24 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
-app.conf.result_backend = 'redis://redis:6379/0'
\ No newline at end of file
+app.conf.result_backend = 'redis://redis:6379/0'
+
+# Periodic tasks, run with: celery -A app beat
+app.conf.beat_schedule = {
+    'flush-inventory': {
+        'task': 'core.tasks.flush_inventory',
+        'schedule': 2.0,
+    },
+    'expire-holds': {
+        'task': 'core.tasks.expire_holds',
+        'schedule': 15.0,
+    },
+    'purge-outbox': {
+        'task': 'core.tasks.purge_outbox',
+        'schedule': 60 * 60,
+    },
+    'purge-idempotency-keys': {
+        'task': 'core.tasks.purge_idempotency_keys',
+        'schedule': 60 * 60,
+    },
+}
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -48,6 +49,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so they see the whole request
+    'core.metrics.MetricsMiddleware',
+    'core.profiling.QueryProfileMiddleware',
+    # Before anything that reads the database
+    'core.db.replicas.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +63,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Send each request's query count and timings in a Server-Timing header
+# (see core/profiling.py)
+SERVER_TIMING = os.environ.get('SERVER_TIMING', str(int(DEBUG))) == '1'
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -81,16 +91,98 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Connections per process in the pool, 0 for no pool (see core/db/base.py)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # django.db.backends.postgresql with health checks and pooling
+        'ENGINE': 'core.db',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # Seconds a connection is kept for the next requests. With a pool it
+        # goes back to the pool after each request instead
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        # Ping a kept connection before reusing it
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
+        'POOL': {
+            'SIZE': DB_POOL_SIZE,
+            'TIMEOUT': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        } if DB_POOL_SIZE else None,
+        # pgbouncer in transaction mode can't keep a cursor open between
+        # transactions, set DB_PGBOUNCER=1 when connecting through it
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_PGBOUNCER') == '1',
     }
 }
 
+# Read replicas, DB_REPLICA_HOSTS is a comma separated list of hosts with the
+# primary's database and credentials. Safe requests read from one of them
+# unless the client wrote within REPLICA_PIN_SECONDS (see core/db/replicas.py)
+DATABASE_REPLICAS = []
+for number, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        # Never a test database of its own, run the tests without replicas
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['core.db.replicas.ReplicaRouter']
+# Longer than replicas take to catch up, bounds how stale a cached response
+# built from a replica can be after a write
+REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+
+# Hash partitions of the booking table on event_id, 0 for one table. Applied by
+# migrate, or later by the partition_bookings command (see core/db/partitioning.py)
+BOOKING_PARTITIONS = int(os.environ.get('BOOKING_PARTITIONS', 0))
+
+
+# Cache
+# Redis when CACHE_URL is set, in-process otherwise (tests, local runs)
+
+if os.environ.get('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.environ.get('CACHE_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a cached public response is kept, entries are invalidated through
+# version counters (see core/caching.py) so this only bounds memory use
+RESPONSE_CACHE_TIMEOUT = 300
+
+
+# Email, printed to the console unless another backend is configured
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = 'events@example.com'
+
+# Event update notifications: updates to one event within the window are
+# merged into a single fan-out, recipients are streamed and sent in chunks
+NOTIFICATION_COALESCE_WINDOW = 30
+NOTIFICATION_CHUNK_SIZE = 500
+
+# How long a held booking keeps its tickets before the sweeper releases them
+BOOKING_HOLD_SECONDS = int(os.environ.get('BOOKING_HOLD_SECONDS', 10 * 60))
+HOLD_SWEEP_BATCH_SIZE = 500
+
+# Rows fetched from the database, and written out, per chunk of a booking export
+EXPORT_CHUNK_SIZE = 2000
+
+# Token authentication cache (see core/authentication.py), entries are kept
+# TOKEN_CACHE_TTL seconds in a per-process LRU and, when shared, in the cache
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 30
+TOKEN_CACHE_SHARED = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -139,11 +231,48 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Token bucket sizes per throttle_scope, per user (or IP) (see core/throttling.py)
+    'DEFAULT_THROTTLE_RATES': {
+        'token': os.environ.get('THROTTLE_RATE_TOKEN', '10/min'),
+        'booking': os.environ.get('THROTTLE_RATE_BOOKING', '60/min'),
+    },
     # 'DEFAULT_AUTHENTICATION_CLASSES': (
     #     'rest_framework.authentication.TokenAuthentication',
     # )
 }
 CELERY_BROKER_URL = 'redis://redis:6379/0'
 
+# Ticket inventory: 'db' keeps availability on the Ticket row, 'redis' keeps it
+# in Redis and writes it back in batches (see core/inventory.py)
+INVENTORY_BACKEND = os.environ.get('INVENTORY_BACKEND', 'db')
+INVENTORY_REDIS_URL = os.environ.get('INVENTORY_REDIS_URL', 'redis://redis:6379/1')
+
+# Admission queue for events with an admission_rate: 'redis' shares it between
+# processes, 'memory' keeps it in one process (see core/admission.py)
+ADMISSION_QUEUE_BACKEND = os.environ.get('ADMISSION_QUEUE_BACKEND', 'redis')
+ADMISSION_REDIS_URL = os.environ.get('ADMISSION_REDIS_URL', 'redis://redis:6379/2')
+# How long an admitted customer may book before queueing again
+ADMISSION_PASS_SECONDS = 5 * 60
+
+# Throttle buckets are shared in Redis when set, per process otherwise
+THROTTLE_REDIS_URL = os.environ.get('THROTTLE_REDIS_URL')
+
+# Idempotency-Key responses are kept in Redis when set, in the database
+# otherwise (see core/idempotency.py). IDEMPOTENCY_LOCK_SECONDS is how long a
+# key stays claimed by a request that never finished
+IDEMPOTENCY_REDIS_URL = os.environ.get('IDEMPOTENCY_REDIS_URL')
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_LOCK_SECONDS = 60
+
+# Route the catalogue and booking endpoints to their async views, for ASGI
+# workers (see core/async_views.py). Each worker runs up to
+# ASYNC_VIEW_THREADS of them at once, one database connection each
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+ASYNC_VIEW_THREADS = int(os.environ.get('ASYNC_VIEW_THREADS', 10))
+
+# Build the event, ticket and booking lists from .values() rows and render
+# them with orjson instead of through their serializers (see core/fast_lists.py)
+FAST_LIST_VIEWS = os.environ.get('FAST_LIST_VIEWS') == '1'
+
 
 # ALLOWED_HOSTS = ['0.0.0.0'] : this will allow you to access the app on '0.0.0.0:8000' too in addition to 127.0.0.1:8000
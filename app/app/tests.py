@@ -1,6 +1,12 @@
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
 from django.test import TestCase
 from unittest.mock import patch
-from core.tasks import send_booking_confirmation_email, send_event_update_notification
+from core.tasks import (
+    send_booking_confirmation_email, send_event_update_notification, fan_out_event_update,
+    send_batch_booking_confirmation_email, send_event_deleted_notification,
+)
 
 
 class TestCeleryTasks(TestCase):
@@ -21,3 +27,86 @@ class TestCeleryTasks(TestCase):
 
         # Assert that the task was called with the correct argument
         # mock_task.assert_called_once_with(456)
+
+
+class TestEventUpdateNotifications(TestCase):
+
+    def setUp(self):
+        from core.models import User, EventOrganizer, Customer, Event, Ticket, Booking
+
+        cache.clear()
+        organizer_user = User.objects.create_user('org@example.com', 'pass123', role='organizer')
+        self.event = Event.objects.create(organizer=EventOrganizer.objects.create(user=organizer_user))
+        ticket = Ticket.objects.create(event=self.event, availability=100)
+        for i in range(5):
+            user = User.objects.create_user(f'customer{i}@example.com', 'pass123', role='customer')
+            customer = Customer.objects.create(user=user)
+            # Two bookings for one customer still means one email
+            Booking.objects.create(customer=customer, event=self.event, ticket=ticket, quantity=1)
+            Booking.objects.create(customer=customer, event=self.event, ticket=ticket, quantity=1)
+
+    @patch('core.tasks.fan_out_event_update.apply_async')
+    def test_updates_within_window_are_coalesced(self, apply_async):
+        results = [
+            send_event_update_notification(self.event.id, 'event updated'),
+            send_event_update_notification(self.event.id, 'venue changed'),
+            send_event_update_notification(self.event.id, 'time changed'),
+        ]
+
+        self.assertEqual(results, ['scheduled', 'coalesced', 'coalesced'])
+        apply_async.assert_called_once_with((self.event.id,), countdown=settings.NOTIFICATION_COALESCE_WINDOW)
+
+    @patch('core.tasks.fan_out_event_update.apply_async')
+    def test_fan_out_sends_latest_message_once_per_customer(self, apply_async):
+        send_event_update_notification(self.event.id, 'event updated')
+        send_event_update_notification(self.event.id, 'venue changed')
+
+        stats = fan_out_event_update(self.event.id)
+
+        self.assertEqual(stats['sent'], 5)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [f'customer{i}@example.com' for i in range(5)])
+        self.assertTrue(all('venue changed' in message.body for message in mail.outbox))
+
+        # The window is over, the next update schedules a new fan-out
+        self.assertEqual(send_event_update_notification(self.event.id, 'time changed'), 'scheduled')
+
+    @patch('core.tasks.get_connection')
+    def test_fan_out_uses_one_connection_in_chunks(self, get_connection):
+        connection = get_connection.return_value
+        connection.send_messages.side_effect = len
+
+        with self.settings(NOTIFICATION_CHUNK_SIZE=2):
+            stats = fan_out_event_update(self.event.id)
+
+        get_connection.assert_called_once_with()
+        self.assertEqual([len(call.args[0]) for call in connection.send_messages.call_args_list], [2, 2, 1])
+        self.assertEqual(stats['sent'], 5)
+
+    def test_batch_confirmation_is_one_email_to_the_customer(self):
+        from core.models import Booking
+
+        booking_ids = list(
+            Booking.objects.filter(customer__user__email='customer0@example.com').values_list('id', flat=True)
+        )
+
+        stats = send_batch_booking_confirmation_email(booking_ids, 'bookings created')
+
+        self.assertEqual(stats['sent'], 1)
+        self.assertEqual(mail.outbox[0].to, ['customer0@example.com'])
+        self.assertEqual(mail.outbox[0].subject, f'Booking information for {booking_ids[0]}, {booking_ids[1]}')
+        self.assertIn('bookings created', mail.outbox[0].body)
+
+    def test_deleted_event_is_announced_to_its_customers(self):
+        from core.models import OutboxMessage
+
+        event_id = self.event.id
+        self.event.delete()
+        message = OutboxMessage.objects.get(dedup_key=f'event-deleted:{event_id}')
+        self.assertEqual(message.task, send_event_deleted_notification.name)
+
+        stats = send_event_deleted_notification(*message.args)
+
+        self.assertEqual(stats['sent'], 5)
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), [f'customer{i}@example.com' for i in range(5)])
+        self.assertTrue(all('deleted event' in email.body for email in mail.outbox))
@@ -19,6 +19,7 @@ from drf_spectacular.views import (
 )
 from django.contrib import admin
 from django.urls import path, include
+from core import views as core_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -31,4 +32,5 @@ urlpatterns = [
     path('api/user/', include('user.urls')),
     path('api/event/', include('events.urls')),
     path('api/booking/', include('booking.urls')),
+    path('metrics', core_views.metrics, name='metrics'),
 ]
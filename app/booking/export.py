@@ -0,0 +1,63 @@
+"""
+Streaming writers for booking exports
+
+Both take an iterator of row tuples and yield the output a chunk of rows at a
+time, so only one chunk is ever held in memory.
+"""
+import csv
+import io
+import json
+
+from django.db import connections
+
+
+def iterate(queryset, chunk_size):
+    """Yield the rows of a values_list queryset ordered by id, id first
+
+    From a server-side cursor when the database allows them. Without them
+    (pgbouncer in transaction mode) iterator() would fetch every row at once,
+    so rows are read a page at a time by id instead.
+    """
+    if not connections[queryset.db].settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+        yield from queryset.iterator(chunk_size=chunk_size)
+        return
+    page = list(queryset[:chunk_size])
+    while page:
+        yield from page
+        if len(page) < chunk_size:
+            return
+        page = list(queryset.filter(pk__gt=page[-1][0])[:chunk_size])
+
+
+def csv_stream(header, rows, chunk_size):
+    """Yield CSV text, the header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_stream(header, rows, chunk_size):
+    """Yield one JSON object per line"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(header, row))))
+        if len(lines) == chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+FORMATS = {
+    'csv': (csv_stream, 'text/csv'),
+    'ndjson': (ndjson_stream, 'application/x-ndjson'),
+}
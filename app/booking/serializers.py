@@ -7,7 +7,12 @@ from django.contrib.auth import (
 from django.utils.translation import gettext as _
 from rest_framework import serializers
 from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from core import caching, inventory, outbox
 from core.models import EventOrganizer, Customer, Booking, Event, Ticket
+from core.tasks import send_batch_booking_confirmation_email
 
 
 class BookingSerializer(serializers.ModelSerializer):
@@ -24,9 +29,9 @@ class BookingSerializer(serializers.ModelSerializer):
         event_id = self.context['view'].kwargs['event_id']
         ticket_id = self.context['view'].kwargs['ticket_id']
 
-        # Get event and ticket objects
-        event = Event.objects.get(pk=event_id)
-        ticket = Ticket.objects.get(pk=ticket_id)
+        # Get event and ticket objects, the ticket has to be one of the event's
+        event = get_object_or_404(Event, pk=event_id)
+        ticket = get_object_or_404(Ticket, pk=ticket_id, event_id=event_id)
 
         # Check if the ticket is available
         if ticket.availability < validated_data['quantity']:
@@ -36,8 +41,14 @@ class BookingSerializer(serializers.ModelSerializer):
         # Set customer based on authenticated user
         customer = self.context['request'].user.customer
 
-        # Create booking
-        booking = Booking.objects.create(event=event, ticket=ticket, customer=customer, quantity=validated_data['quantity'])
+        # Create booking, availability is re-checked atomically by Booking.save
+        try:
+            booking = Booking.objects.create(
+                event=event, ticket=ticket, customer=customer, quantity=validated_data['quantity'],
+                status=validated_data.get('status', Booking.CONFIRMED),
+            )
+        except ValidationError:
+            raise serializers.ValidationError("Requested quantity exceeds available tickets.")
 
         return booking
 
@@ -54,26 +65,106 @@ class BookingUpdateSerializer(serializers.ModelSerializer):
         if not quantity:
             raise serializers.ValidationError("Quantity is required.")
 
+        self.check_status(self.instance)
         return data
 
+    def check_status(self, booking):
+        # Only confirmed bookings change quantity, a hold is confirmed as booked
+        expired = booking.status == Booking.HELD and booking.expires_at <= timezone.now()
+        if booking.status == Booking.EXPIRED or expired:
+            raise serializers.ValidationError("Booking has expired.")
+        if booking.status != Booking.CONFIRMED:
+            raise serializers.ValidationError("Booking is not confirmed.")
+
     def update(self, instance, validated_data):
-        # Retrieve the previous quantity
-        previous_quantity = instance.quantity
-        print(previous_quantity)
-        # Update the quantity of the booking
+        # Update the quantity of the booking, Booking.save takes or gives back
+        # the difference with a single conditional UPDATE on the ticket
         instance.quantity = validated_data.get('quantity', instance.quantity)
-        print(instance.quantity)
-        instance.save()
-
-        # Calculate the difference in quantity
-        # quantity_difference = instance.quantity - previous_quantity
+        try:
+            instance.save()
+        except ValidationError:
+            # Booking.save reads the status again under lock, it may have changed since validate
+            self.check_status(instance)
+            raise serializers.ValidationError("Requested quantity exceeds available tickets.")
 
-        # Update the ticket availability accordingly
-        # instance.ticket.availability -= quantity_difference
-        # instance.ticket.save()
         return instance
 
 class BookingListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+class AdmissionSerializer(serializers.Serializer):
+    token = serializers.CharField()
+    admitted = serializers.BooleanField()
+    position = serializers.IntegerField(allow_null=True)
+    expires_at = serializers.FloatField(allow_null=True, help_text='Unix time the admission ends')
+    retry_after = serializers.IntegerField(allow_null=True, help_text='Seconds to wait before polling again')
+
+
+class BookingLineSerializer(serializers.Serializer):
+    ticket_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class BatchBookingSerializer(serializers.Serializer):
+    """Book several ticket types of one event, all or nothing"""
+    lines = BookingLineSerializer(many=True, allow_empty=False)
+
+    def validate_lines(self, lines):
+        # Merge repeated ticket types into one line each
+        quantities = {}
+        for line in lines:
+            quantities[line['ticket_id']] = quantities.get(line['ticket_id'], 0) + line['quantity']
+        return quantities
+
+    def create(self, validated_data):
+        event_id = self.context['view'].kwargs['event_id']
+        customer = self.context['request'].user.customer
+        quantities = validated_data['lines']
+        reserved = []
+
+        try:
+            with transaction.atomic():
+                # Lock every ticket in id order up front, two overlapping
+                # batches then always wait on each other in the same order
+                # and can't deadlock
+                prices = dict(
+                    Ticket.objects.select_for_update().filter(event_id=event_id, pk__in=quantities)
+                    .order_by('pk').values_list('pk', 'price')
+                )
+                ticket_ids = list(prices)
+                if len(ticket_ids) != len(quantities):
+                    raise serializers.ValidationError("Ticket not found for this event.")
+
+                for ticket_id in ticket_ids:
+                    try:
+                        Ticket.objects.reserve(ticket_id, quantities[ticket_id], unit_price=prices[ticket_id])
+                    except ValidationError:
+                        raise serializers.ValidationError(
+                            f"Requested quantity exceeds available tickets for ticket {ticket_id}."
+                        )
+                    reserved.append(ticket_id)
+
+                bookings = Booking.objects.bulk_create(
+                    Booking(
+                        customer=customer, event_id=event_id, ticket_id=ticket_id, quantity=quantities[ticket_id],
+                        unit_price=prices[ticket_id],
+                    )
+                    for ticket_id in ticket_ids
+                )
+                caching.bump_event(event_id)
+                booking_ids = [booking.id for booking in bookings]
+                outbox.enqueue(
+                    send_batch_booking_confirmation_email, booking_ids, "bookings created",
+                    dedup_key=f'batch-booking-created:{booking_ids[0]}',
+                )
+        except Exception:
+            # Redis isn't rolled back with the transaction
+            if inventory.is_enabled():
+                for ticket_id in reserved:
+                    Ticket.objects.release(ticket_id, quantities[ticket_id], unit_price=prices[ticket_id])
+            raise
+
+        return bookings
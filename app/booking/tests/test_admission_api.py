@@ -0,0 +1,95 @@
+"""Tests for booking through the admission queue"""
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core import admission
+from core.models import User, Customer, Event, Ticket, EventOrganizer, Booking
+
+
+@override_settings(ADMISSION_QUEUE_BACKEND='memory')
+class AdmissionQueueTestCase(TestCase):
+
+    def setUp(self):
+        admission.get_queue().clear()
+        self.client = APIClient()
+        organizer_user = User.objects.create_user('organizer@example.com', 'password', role='organizer')
+        self.event = Event.objects.create(
+            organizer=EventOrganizer.objects.create(user=organizer_user), admission_rate=1
+        )
+        self.ticket = Ticket.objects.create(event=self.event, availability=10)
+        self.customers = []
+        for i in range(2):
+            user = User.objects.create_user(f'customer{i}@example.com', 'password', role='customer')
+            Customer.objects.create(user=user)
+            self.customers.append(user)
+        self.join_url = reverse('booking:admission-join', kwargs={'event_id': self.event.pk})
+        self.book_url = reverse('booking:booking-book', kwargs={'event_id': self.event.pk, 'ticket_id': self.ticket.pk})
+
+    def join(self, user):
+        self.client.force_authenticate(user=user)
+        return self.client.post(self.join_url)
+
+    def book(self, user, token=None):
+        self.client.force_authenticate(user=user)
+        headers = {'HTTP_X_ADMISSION_TOKEN': token} if token else {}
+        return self.client.post(self.book_url, {'quantity': 1}, format='json', **headers)
+
+    def test_booking_needs_admission(self):
+        response = self.book(self.customers[0])
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_admitted_customer_books(self):
+        token = self.join(self.customers[0]).data['token']
+
+        response = self.book(self.customers[0], token)
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_waiting_customer_is_told_when_to_retry(self):
+        """Test the second customer of a 1/sec queue waits its turn"""
+        self.join(self.customers[0])
+        response = self.join(self.customers[1])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.data['admitted'])
+        self.assertEqual(response.data['position'], 1)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.book(self.customers[1], response.data['token']).status_code, 403)
+
+        status_url = reverse(
+            'booking:admission-status', kwargs={'event_id': self.event.pk, 'token': response.data['token']}
+        )
+        self.assertEqual(self.client.get(status_url).data['position'], 1)
+
+    def test_token_is_personal(self):
+        token = self.join(self.customers[0]).data['token']
+        status_url = reverse('booking:admission-status', kwargs={'event_id': self.event.pk, 'token': token})
+
+        self.assertEqual(self.book(self.customers[1], token).status_code, 403)
+        self.assertEqual(self.client.get(status_url).status_code, 404)
+
+    def test_event_without_queue(self):
+        self.event.admission_rate = None
+        self.event.save()
+
+        self.assertEqual(self.join(self.customers[0]).status_code, 400)
+        self.assertEqual(self.book(self.customers[0]).status_code, 201)
+
+    def test_ticket_of_another_event(self):
+        """Test a ticket can't be booked under another event's url, past its own event's queue"""
+        other = Event.objects.create(organizer=self.event.organizer)
+        url = reverse('booking:booking-book', kwargs={'event_id': other.pk, 'ticket_id': self.ticket.pk})
+        self.client.force_authenticate(user=self.customers[0])
+
+        self.assertEqual(self.client.post(url, {'quantity': 3}, format='json').status_code, 403)
+
+        token = self.join(self.customers[0]).data['token']
+        for name in ('booking:booking-book', 'booking:booking-hold'):
+            url = reverse(name, kwargs={'event_id': other.pk, 'ticket_id': self.ticket.pk})
+            response = self.client.post(url, {'quantity': 3}, format='json', HTTP_X_ADMISSION_TOKEN=token)
+            self.assertEqual(response.status_code, 404)
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).availability, 10)
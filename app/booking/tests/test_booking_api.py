@@ -3,10 +3,11 @@
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APIClient
+from core.testing import QueryBudgetTestMixin
 from core.models import User, Customer, Event, Ticket, EventOrganizer, Booking
 from rest_framework.authtoken.models import Token
 
-class BookingTestCase(TestCase):
+class BookingTestCase(QueryBudgetTestMixin, TestCase):
 
     def setUp(self):
         self.client = APIClient()
@@ -164,3 +165,177 @@ class BookingTestCase(TestCase):
         # Check booking record created
         self.assertTrue(Booking.objects.filter(customer=self.customer1, event=self.event, ticket=self.ticket, quantity=2).exists())
 
+    def test_event_bookings_only_for_the_organizer(self):
+        Booking.objects.create(customer=self.customer1, event=self.event, ticket=self.ticket, quantity=2)
+        url = reverse('booking:event-bookings', kwargs={'event_id': self.event.pk})
+
+        self.client.force_authenticate(user=self.organizer_user)
+        self.assertEqual(len(self.client.get(url).data), 1)
+
+        other_user = User.objects.create_user(email='other@example.com', password='password', role='organizer')
+        EventOrganizer.objects.create(user=other_user)
+        self.client.force_authenticate(user=other_user)
+        self.assertEqual(self.client.get(url).data, [])
+
+
+class BatchBookingTestCase(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+        self.organizer_user = User.objects.create_user(email='organizer@example.com', password='password', role='organizer')
+        self.organizer = EventOrganizer.objects.create(user=self.organizer_user)
+        self.event = Event.objects.create(organizer=self.organizer, title='Test Event', venue='Test Venue')
+        self.general = Ticket.objects.create(event=self.event, ticket_type='GA', price=10.00, availability=10)
+        self.vip = Ticket.objects.create(event=self.event, ticket_type='VIP', price=50.00, availability=2)
+
+        self.customer_user = User.objects.create_user(email='customer1@example.com', password='password', role='customer')
+        self.customer = Customer.objects.create(user=self.customer_user)
+        self.client.force_authenticate(user=self.customer_user)
+        self.url = reverse('booking:booking-batch', kwargs={'event_id': self.event.pk})
+
+    def assertTicketAvailability(self, ticket, expected_availability):
+        self.assertEqual(Ticket.objects.get(pk=ticket.pk).availability, expected_availability)
+
+    def test_batch_books_every_line(self):
+        """Book GA and VIP in one call"""
+        payload = {'lines': [
+            {'ticket_id': self.vip.pk, 'quantity': 2},
+            {'ticket_id': self.general.pk, 'quantity': 3},
+        ]}
+
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 2)
+        self.assertTicketAvailability(self.general, 7)
+        self.assertTicketAvailability(self.vip, 0)
+        self.assertEqual(Booking.objects.filter(customer=self.customer).count(), 2)
+
+    def test_batch_merges_repeated_ticket_lines(self):
+        """Repeated ticket types become one booking"""
+        payload = {'lines': [
+            {'ticket_id': self.general.pk, 'quantity': 1},
+            {'ticket_id': self.general.pk, 'quantity': 2},
+        ]}
+
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Booking.objects.get(customer=self.customer).quantity, 3)
+        self.assertTicketAvailability(self.general, 7)
+
+    def test_batch_is_all_or_nothing(self):
+        """One line over availability rolls back every line"""
+        payload = {'lines': [
+            {'ticket_id': self.general.pk, 'quantity': 3},
+            {'ticket_id': self.vip.pk, 'quantity': 3},
+        ]}
+
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTicketAvailability(self.general, 10)
+        self.assertTicketAvailability(self.vip, 2)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_batch_rejects_ticket_of_another_event(self):
+        """Tickets must belong to the event in the url"""
+        other_event = Event.objects.create(organizer=self.organizer)
+        other_ticket = Ticket.objects.create(event=other_event, availability=10)
+        payload = {'lines': [
+            {'ticket_id': self.general.pk, 'quantity': 1},
+            {'ticket_id': other_ticket.pk, 'quantity': 1},
+        ]}
+
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTicketAvailability(self.general, 10)
+        self.assertTicketAvailability(other_ticket, 10)
+
+    def test_batch_requires_lines(self):
+        response = self.client.post(self.url, {'lines': []}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_organizer_forbidden(self):
+        self.client.force_authenticate(user=self.organizer_user)
+        payload = {'lines': [{'ticket_id': self.general.pk, 'quantity': 1}]}
+
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, 403)
+
+
+class HoldBookingTestCase(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        organizer_user = User.objects.create_user('organizer@example.com', 'password', role='organizer')
+        self.event = Event.objects.create(organizer=EventOrganizer.objects.create(user=organizer_user))
+        self.ticket = Ticket.objects.create(event=self.event, price=10.00, availability=10)
+        self.customer_user = User.objects.create_user('customer@example.com', 'password', role='customer')
+        Customer.objects.create(user=self.customer_user)
+        self.client.force_authenticate(user=self.customer_user)
+        self.hold_url = reverse('booking:booking-hold', kwargs={'event_id': self.event.pk, 'ticket_id': self.ticket.pk})
+
+    def test_hold_then_confirm(self):
+        response = self.client.post(self.hold_url, {'quantity': 4}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], Booking.HELD)
+        self.assertIsNotNone(response.data['expires_at'])
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).availability, 6)
+
+        confirm_url = reverse('booking:booking-confirm', kwargs={'pk': response.data['id']})
+        response = self.client.post(confirm_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], Booking.CONFIRMED)
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).sold, 4)
+
+    def test_confirm_expired_hold(self):
+        booking_id = self.client.post(self.hold_url, {'quantity': 4}, format='json').data['id']
+        Booking.objects.filter(pk=booking_id).update(expires_at='2000-01-01T00:00:00Z')
+        Booking.objects.expire_holds()
+
+        response = self.client.post(reverse('booking:booking-confirm', kwargs={'pk': booking_id}))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).availability, 10)
+
+    def test_update_expired_hold(self):
+        booking_id = self.client.post(self.hold_url, {'quantity': 4}, format='json').data['id']
+        Booking.objects.filter(pk=booking_id).update(expires_at='2000-01-01T00:00:00Z')
+        update_url = reverse('booking:booking-update', kwargs={'pk': booking_id})
+
+        response = self.client.patch(update_url, {'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['non_field_errors'], ['Booking has expired.'])
+
+        Booking.objects.expire_holds()
+        response = self.client.patch(update_url, {'quantity': 2}, format='json')
+        self.assertEqual(response.data['non_field_errors'], ['Booking has expired.'])
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).availability, 10)
+
+    def test_update_unconfirmed_hold(self):
+        booking_id = self.client.post(self.hold_url, {'quantity': 4}, format='json').data['id']
+
+        response = self.client.patch(
+            reverse('booking:booking-update', kwargs={'pk': booking_id}), {'quantity': 2}, format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['non_field_errors'], ['Booking is not confirmed.'])
+        self.assertEqual(Booking.objects.get(pk=booking_id).quantity, 4)
+
+    def test_confirm_someone_elses_hold(self):
+        booking_id = self.client.post(self.hold_url, {'quantity': 1}, format='json').data['id']
+        other = User.objects.create_user('other@example.com', 'password', role='customer')
+        Customer.objects.create(user=other)
+        self.client.force_authenticate(user=other)
+
+        response = self.client.post(reverse('booking:booking-confirm', kwargs={'pk': booking_id}))
+
+        self.assertEqual(response.status_code, 404)
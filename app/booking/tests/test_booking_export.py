@@ -0,0 +1,108 @@
+"""Tests for the streaming booking export"""
+
+import csv
+import io
+import json
+import tracemalloc
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core.models import User, Customer, Event, Ticket, EventOrganizer, Booking
+
+
+def export_url(event_id, output=None):
+    url = reverse('booking:event-bookings-export', kwargs={'event_id': event_id})
+    return f'{url}?output={output}' if output else url
+
+
+class BookingExportTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.organizer_user = User.objects.create_user('organizer@example.com', 'password', role='organizer')
+        self.event = Event.objects.create(organizer=EventOrganizer.objects.create(user=self.organizer_user))
+        self.ticket = Ticket.objects.create(event=self.event, ticket_type='VIP', availability=10)
+        self.customer_user = User.objects.create_user('customer@example.com', 'password', role='customer')
+        self.customer = Customer.objects.create(user=self.customer_user)
+        self.client.force_authenticate(user=self.organizer_user)
+
+    def add_bookings(self, count):
+        Booking.objects.bulk_create(
+            Booking(customer=self.customer, event=self.event, ticket=self.ticket, quantity=1 + i % 3)
+            for i in range(count)
+        )
+
+    def consume(self, response):
+        return ''.join(
+            chunk.decode() if isinstance(chunk, bytes) else chunk for chunk in response.streaming_content
+        )
+
+    def test_export_csv(self):
+        """Test the CSV has a header and one line per booking"""
+        self.add_bookings(3)
+
+        response = self.client.get(export_url(self.event.id))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(self.consume(response))))
+        self.assertEqual(rows[0], ['id', 'customer', 'email', 'ticket', 'ticket_type', 'quantity', 'status'])
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][2:], ['customer@example.com', str(self.ticket.id), 'VIP', '1', 'confirmed'])
+
+    def test_export_ndjson(self):
+        """Test NDJSON has one object per booking, in id order"""
+        self.add_bookings(5)
+
+        response = self.client.get(export_url(self.event.id, 'ndjson'))
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in self.consume(response).splitlines()]
+        self.assertEqual([line['id'] for line in lines], sorted(Booking.objects.values_list('id', flat=True)))
+        self.assertEqual(lines[0]['email'], 'customer@example.com')
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_export_without_server_side_cursors(self):
+        """Test pages read by id (pgbouncer mode) give the same rows"""
+        self.add_bookings(5)
+
+        with patch.dict(connection.settings_dict, {'DISABLE_SERVER_SIDE_CURSORS': True}):
+            response = self.client.get(export_url(self.event.id, 'ndjson'))
+            lines = [json.loads(line) for line in self.consume(response).splitlines()]
+
+        self.assertEqual([line['id'] for line in lines], sorted(Booking.objects.values_list('id', flat=True)))
+
+    def test_unknown_output_is_rejected(self):
+        response = self.client.get(export_url(self.event.id, 'xml'))
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_the_organizer_can_export(self):
+        self.client.force_authenticate(user=self.customer_user)
+
+        response = self.client.get(export_url(self.event.id))
+
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(EXPORT_CHUNK_SIZE=500)
+    def test_memory_is_flat(self):
+        """Test peak memory of an export doesn't grow with the number of bookings"""
+        def peak_memory():
+            tracemalloc.start()
+            try:
+                response = self.client.get(export_url(self.event.id))
+                size = sum(len(chunk) for chunk in response.streaming_content)
+                return size, tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        self.add_bookings(2000)
+        small_size, small_peak = peak_memory()
+        self.add_bookings(18000)
+        large_size, large_peak = peak_memory()
+
+        self.assertGreater(large_size, 9 * small_size)
+        self.assertLess(large_peak, 2 * small_peak)
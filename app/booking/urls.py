@@ -2,13 +2,20 @@
 from django.urls import path
 
 from booking.views import *
+from core.async_views import as_view
 
 app_name = 'booking'
 
 urlpatterns = [
-    path('<int:event_id>/<int:ticket_id>/book/', BookingCreateView.as_view(), name='booking-book'),
+    path('<int:event_id>/<int:ticket_id>/book/', as_view(BookingCreateView), name='booking-book'),
+    path('<int:event_id>/<int:ticket_id>/hold/', as_view(BookingHoldView), name='booking-hold'),
+    path('<int:pk>/confirm/', BookingConfirmView.as_view(), name='booking-confirm'),
+    path('<int:event_id>/queue/', AdmissionJoinView.as_view(), name='admission-join'),
+    path('<int:event_id>/queue/<str:token>/', AdmissionStatusView.as_view(), name='admission-status'),
+    path('<int:event_id>/batch/', BookingBatchCreateView.as_view(), name='booking-batch'),
     path('<int:pk>/update/', BookingUpdateView.as_view(), name='booking-update'),
     path('<int:pk>/delete/', BookingDeleteView.as_view(), name='booking-delete'),
     path('mybookings/', BookingListView.as_view(), name='booking-list'),
     path('myeventbookings/<int:event_id>/', EventBookingListView.as_view(), name='event-bookings'),
+    path('myeventbookings/<int:event_id>/export/', EventBookingExportView.as_view(), name='event-bookings-export'),
 ]
\ No newline at end of file
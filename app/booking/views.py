@@ -1,19 +1,38 @@
 """
 Booking Views
 """
-
-from rest_framework import generics
-from core.models import Booking, Ticket
+import math
+
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, status
+from rest_framework.response import Response
+from core.models import Booking, Event, Ticket
+from booking import export
+from core import admission
+from core.permissions import HasAdmission, IsCustomer
+from core.fast_lists import FastListMixin
+from core.idempotency import IdempotentMixin
+from core.throttling import TokenBucketThrottle
 from booking.serializers import *
-from rest_framework import authentication, permissions
+from rest_framework import permissions
+from core.authentication import CachedTokenAuthentication
+from django.core.exceptions import ValidationError
 from django.db import transaction
 
 
-class BookingCreateView(generics.CreateAPIView):
+class BookingCreateView(IdempotentMixin, generics.CreateAPIView):
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
-    authentication_classes = [authentication.TokenAuthentication]
-    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated, HasAdmission]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'booking'
+    # Token, admission, event and ticket lookups, then the reservation with
+    # its savepoint and the booking and outbox rows, and claiming and storing
+    # an Idempotency-Key when keys are kept in the database
+    query_budget = 11
 
     def perform_create(self, serializer):
         # Set customer based on authenticated user
@@ -27,10 +46,102 @@ class BookingCreateView(generics.CreateAPIView):
         except Ticket.DoesNotExist:
             raise serializers.ValidationError("Ticket not found.")
 
-class BookingUpdateView(generics.UpdateAPIView):
+class BookingHoldView(BookingCreateView):
+    """Hold tickets for BOOKING_HOLD_SECONDS, confirm them with BookingConfirmView"""
+
+    def perform_create(self, serializer):
+        try:
+            serializer.save(
+                customer=self.request.user.customer, event_id=self.kwargs['event_id'],
+                ticket_id=self.kwargs['ticket_id'], status=Booking.HELD,
+            )
+        except Ticket.DoesNotExist:
+            raise serializers.ValidationError("Ticket not found.")
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return Response(BookingListSerializer(serializer.instance).data, status=status.HTTP_201_CREATED)
+
+class BookingConfirmView(generics.GenericAPIView):
+    """Confirm a held booking before it expires"""
+    serializer_class = BookingListSerializer
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Booking.objects.filter(customer__user=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        booking = self.get_object()
+        try:
+            booking.confirm()
+        except ValidationError as e:
+            raise serializers.ValidationError(e.messages)
+        return Response(self.get_serializer(booking).data)
+
+class AdmissionView(generics.GenericAPIView):
+    """Base for the admission queue endpoints of an event"""
+    serializer_class = AdmissionSerializer
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated, IsCustomer]
+
+    def get_rate(self):
+        event = get_object_or_404(Event, pk=self.kwargs['event_id'])
+        if not event.admission_rate:
+            raise serializers.ValidationError("This event has no admission queue, book it directly.")
+        return event.admission_rate
+
+    def respond(self, queue_status, rate, status_code=status.HTTP_200_OK):
+        retry_after = None if queue_status['admitted'] else math.ceil(queue_status['position'] / rate)
+        response = Response(
+            self.get_serializer(dict(queue_status, retry_after=retry_after)).data, status=status_code
+        )
+        if retry_after is not None:
+            response['Retry-After'] = str(retry_after)
+        return response
+
+class AdmissionJoinView(AdmissionView):
+    """Join the admission queue of an event, or get your place if already in it
+
+    Poll AdmissionStatusView with the token, once admitted send it as the
+    X-Admission-Token header when booking.
+    """
+
+    def post(self, request, event_id):
+        rate = self.get_rate()
+        queue_status = admission.get_queue().join(event_id, request.user.pk, rate)
+        return self.respond(queue_status, rate, status.HTTP_201_CREATED)
+
+class AdmissionStatusView(AdmissionView):
+    """Place of a token in the admission queue"""
+
+    def get(self, request, event_id, token):
+        rate = self.get_rate()
+        queue_status = admission.get_queue().status(event_id, token, rate)
+        if queue_status is None or queue_status['user_id'] != request.user.pk:
+            raise Http404
+        return self.respond(queue_status, rate)
+
+class BookingBatchCreateView(generics.GenericAPIView):
+    """Book several ticket types of an event in one transaction"""
+    serializer_class = BatchBookingSerializer
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated, IsCustomer, HasAdmission]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'booking'
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        bookings = serializer.save()
+        return Response(BookingListSerializer(bookings, many=True).data, status=status.HTTP_201_CREATED)
+
+class BookingUpdateView(IdempotentMixin, generics.UpdateAPIView):
     queryset = Booking.objects.all()
     serializer_class = BookingUpdateSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     def get_queryset(self):
         # Filter bookings associated with the authenticated customer
@@ -41,10 +152,10 @@ class BookingUpdateView(generics.UpdateAPIView):
             # Event organizers or other roles may have different permissions
             return Booking.objects.none()
 
-class BookingDeleteView(generics.DestroyAPIView):
+class BookingDeleteView(IdempotentMixin, generics.DestroyAPIView):
     queryset = Booking.objects.all()
     serializer_class = BookingUpdateSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     def get_queryset(self):
         # Filter bookings associated with the authenticated customer
@@ -57,11 +168,12 @@ class BookingDeleteView(generics.DestroyAPIView):
 
 
 
-class BookingListView(generics.ListAPIView):
+class BookingListView(FastListMixin, generics.ListAPIView):
     queryset = Booking.objects.all()
     serializer_class = BookingListSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 2
 
     def get_queryset(self):
         # Filter bookings based on authenticated user
@@ -70,21 +182,47 @@ class BookingListView(generics.ListAPIView):
 
 class EventBookingListView(generics.ListAPIView):
     serializer_class = BookingListSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 2
 
     def get_queryset(self):
         event_id = self.kwargs.get('event_id')
         user = self.request.user
-        try:
-            event = Event.objects.get(pk=event_id)
-        except Event.DoesNotExist:
-            return Booking.objects.none()
 
-        # Check if the event is created by the Event Organizer corresponding to the user
-        if user.is_authenticated and user.role == 'organizer' and event.organizer.user == user:
-            # Return bookings for the event
-            return Booking.objects.filter(event=event)
+        # Only the Event Organizer of the event sees its bookings, checked in
+        # the same query instead of loading the event, organizer and user
+        if user.is_authenticated and user.role == 'organizer':
+            return Booking.objects.filter(event_id=event_id, event__organizer__user=user)
 
         return Booking.objects.none()
 
+
+class EventBookingExportView(generics.GenericAPIView):
+    """Stream every booking of an event as CSV (default) or NDJSON (?output=ndjson)
+
+    Rows come as tuples a chunk at a time (see export.iterate), no model
+    instances are built, so memory stays flat however many bookings the
+    event has.
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    columns = ['id', 'customer_id', 'customer__user__email', 'ticket_id', 'ticket__ticket_type', 'quantity', 'status']
+    header = ['id', 'customer', 'email', 'ticket', 'ticket_type', 'quantity', 'status']
+
+    def get(self, request, event_id):
+        output = request.query_params.get('output', 'csv')
+        if output not in export.FORMATS:
+            return Response(
+                {'output': f'Choose one of: {", ".join(export.FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        event = get_object_or_404(Event, pk=event_id, organizer__user=request.user)
+
+        chunk_size = settings.EXPORT_CHUNK_SIZE
+        rows = export.iterate(
+            Booking.objects.filter(event=event).order_by('id').values_list(*self.columns), chunk_size
+        )
+        stream, content_type = export.FORMATS[output]
+        response = StreamingHttpResponse(stream(self.header, rows, chunk_size), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="event-{event.pk}-bookings.{output}"'
+        return response
@@ -72,3 +72,4 @@ admin.site.register(models.Ticket)
 admin.site.register(models.Event)
 admin.site.register(models.EventOrganizer)
 admin.site.register(models.Customer)
+admin.site.register(models.OutboxMessage)
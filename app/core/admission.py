@@ -0,0 +1,215 @@
+"""
+Admission queue (virtual waiting room) for on-sale spikes
+
+Bookings for an Event with an admission_rate are only taken from customers
+the queue has admitted, so the Ticket row sees a steady trickle instead of
+the whole crowd at once. A customer joins and gets a token. Waiting tokens
+are admitted in arrival order at admission_rate per second, with up to one
+second of burst, and an admitted token is valid for ADMISSION_PASS_SECONDS.
+The queue advances whenever it is joined or polled, there is no worker.
+
+With ADMISSION_QUEUE_BACKEND = 'redis' the state lives in Redis sorted sets
+and every operation is one Lua script. 'memory' keeps it in this process,
+for tests and single process development.
+"""
+import math
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+
+
+# Queue state is dropped this long after the last join
+STATE_SECONDS = 60 * 60 * 24
+
+KEYS = ('waiting', 'admitted', 'clock', 'users', 'tokens', 'seq')
+
+# KEYS: waiting, admitted, clock. ARGV: now, rate, pass seconds.
+# Moves as many waiting tokens as the accumulated credit allows to admitted.
+ADVANCE = """
+local function advance(now, rate, pass_seconds)
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+    local last = tonumber(redis.call('HGET', KEYS[3], 'ts') or now)
+    local credit = tonumber(redis.call('HGET', KEYS[3], 'credit') or rate)
+    credit = math.min(rate, credit + (now - last) * rate)
+    local admit = math.min(math.floor(credit), redis.call('ZCARD', KEYS[1]))
+    if admit > 0 then
+        for _, token in ipairs(redis.call('ZRANGE', KEYS[1], 0, admit - 1)) do
+            redis.call('ZADD', KEYS[2], now + pass_seconds, token)
+        end
+        redis.call('ZREMRANGEBYRANK', KEYS[1], 0, admit - 1)
+        credit = credit - admit
+    end
+    redis.call('HMSET', KEYS[3], 'ts', tostring(now), 'credit', tostring(credit))
+end
+
+-- {1, 0, expires} when admitted, {0, position} when waiting, {-1} when unknown
+local function status(token)
+    local expires = redis.call('ZSCORE', KEYS[2], token)
+    if expires then
+        return {1, 0, expires}
+    end
+    local rank = redis.call('ZRANK', KEYS[1], token)
+    if rank then
+        return {0, rank + 1}
+    end
+    return {-1}
+end
+"""
+
+# KEYS: all of KEYS. ARGV: now, rate, pass seconds, user id, new token, state seconds
+JOIN_SCRIPT = ADVANCE + """
+local now, rate, pass_seconds = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+advance(now, rate, pass_seconds)
+local token = redis.call('HGET', KEYS[4], ARGV[4])
+if not token or status(token)[1] == -1 then
+    token = ARGV[5]
+    redis.call('ZADD', KEYS[1], redis.call('INCR', KEYS[6]), token)
+    redis.call('HSET', KEYS[4], ARGV[4], token)
+    redis.call('HSET', KEYS[5], token, ARGV[4])
+    advance(now, rate, pass_seconds)
+end
+for _, key in ipairs(KEYS) do
+    redis.call('EXPIRE', key, ARGV[6])
+end
+local result = status(token)
+table.insert(result, 1, token)
+return result
+"""
+
+# KEYS: all of KEYS. ARGV: now, rate, pass seconds, token
+STATUS_SCRIPT = ADVANCE + """
+advance(tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]))
+local result = status(ARGV[4])
+table.insert(result, 1, redis.call('HGET', KEYS[5], ARGV[4]) or '')
+return result
+"""
+
+
+def _status(admitted, position=None, expires_at=None, token=None, user_id=None):
+    return {
+        'token': token,
+        'user_id': user_id,
+        'admitted': admitted,
+        'position': position,
+        'expires_at': expires_at,
+    }
+
+
+class RedisAdmissionQueue:
+    """Admission queue in Redis, safe to share between processes"""
+
+    def __init__(self, client):
+        self.client = client
+        self.join_script = client.register_script(JOIN_SCRIPT)
+        self.status_script = client.register_script(STATUS_SCRIPT)
+
+    def keys(self, event_id):
+        return [f'admission:{event_id}:{name}' for name in KEYS]
+
+    def join(self, event_id, user_id, rate):
+        token, admitted, *rest = self.join_script(
+            keys=self.keys(event_id),
+            args=[time.time(), rate, settings.ADMISSION_PASS_SECONDS, user_id, secrets.token_urlsafe(16),
+                  STATE_SECONDS],
+        )
+        return self._result(token, user_id, admitted, rest)
+
+    def status(self, event_id, token, rate):
+        user_id, admitted, *rest = self.status_script(
+            keys=self.keys(event_id), args=[time.time(), rate, settings.ADMISSION_PASS_SECONDS, token],
+        )
+        if admitted == -1:
+            return None
+        return self._result(token, int(user_id), admitted, rest)
+
+    def _result(self, token, user_id, admitted, rest):
+        if isinstance(token, bytes):
+            token = token.decode()
+        if admitted == 1:
+            return _status(True, expires_at=float(rest[1]), token=token, user_id=user_id)
+        return _status(False, position=rest[0], token=token, user_id=user_id)
+
+
+class MemoryAdmissionQueue:
+    """Admission queue in this process, same behaviour as RedisAdmissionQueue"""
+
+    def __init__(self):
+        self.events = {}
+        self.lock = threading.Lock()
+
+    def _event(self, event_id, rate):
+        if event_id not in self.events:
+            self.events[event_id] = {
+                'waiting': OrderedDict(), 'admitted': {}, 'users': {}, 'tokens': {},
+                'ts': None, 'credit': float(rate),
+            }
+        return self.events[event_id]
+
+    def _advance(self, state, now, rate):
+        state['admitted'] = {token: expires for token, expires in state['admitted'].items() if expires > now}
+        last = now if state['ts'] is None else state['ts']
+        credit = min(rate, state['credit'] + (now - last) * rate)
+        admit = min(math.floor(credit), len(state['waiting']))
+        for _ in range(admit):
+            token, _ = state['waiting'].popitem(last=False)
+            state['admitted'][token] = now + settings.ADMISSION_PASS_SECONDS
+        state['ts'], state['credit'] = now, credit - admit
+
+    def _status(self, state, token):
+        user_id = state['tokens'].get(token)
+        if token in state['admitted']:
+            return _status(True, expires_at=state['admitted'][token], token=token, user_id=user_id)
+        if token in state['waiting']:
+            position = list(state['waiting']).index(token) + 1
+            return _status(False, position=position, token=token, user_id=user_id)
+        return None
+
+    def join(self, event_id, user_id, rate):
+        with self.lock:
+            now = time.time()
+            state = self._event(event_id, rate)
+            self._advance(state, now, rate)
+            token = state['users'].get(user_id)
+            if token is None or self._status(state, token) is None:
+                token = secrets.token_urlsafe(16)
+                state['waiting'][token] = None
+                state['users'][user_id] = token
+                state['tokens'][token] = user_id
+                self._advance(state, now, rate)
+            return self._status(state, token)
+
+    def status(self, event_id, token, rate):
+        with self.lock:
+            state = self._event(event_id, rate)
+            self._advance(state, time.time(), rate)
+            return self._status(state, token)
+
+    def clear(self):
+        with self.lock:
+            self.events.clear()
+
+
+_queues = {}
+
+
+def get_queue():
+    """Return the admission queue for ADMISSION_QUEUE_BACKEND"""
+    backend = settings.ADMISSION_QUEUE_BACKEND
+    if backend not in _queues:
+        if backend == 'redis':
+            _queues[backend] = RedisAdmissionQueue(redis.Redis.from_url(settings.ADMISSION_REDIS_URL))
+        else:
+            _queues[backend] = MemoryAdmissionQueue()
+    return _queues[backend]
+
+
+def is_admitted(event_id, user_id, token, rate):
+    """Whether token is an admitted token of user_id for the event"""
+    if not token:
+        return False
+    status = get_queue().status(event_id, token, rate)
+    return status is not None and status['admitted'] and status['user_id'] == user_id
@@ -0,0 +1,61 @@
+"""
+Async views for the ASGI stack
+
+Django 3.2 has no async ORM and DRF views are sync. Under ASGI Django runs
+every sync view of a worker on one shared thread, so a worker serves one
+request at a time however many connections it holds. as_async_view wraps a
+DRF view in a coroutine that runs it, ORM and cache calls included, in a
+pool of ASYNC_VIEW_THREADS threads. The event loop keeps serving the other
+connections meanwhile, a slow client only costs a socket, and a worker never
+has more than ASYNC_VIEW_THREADS views (and database connections) busy.
+
+Under WSGI the wrapper only adds work, so urls route to the async views only
+when ASYNC_VIEWS is set, see as_view.
+"""
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(settings.ASYNC_VIEW_THREADS, thread_name_prefix='async-view')
+    return _executor
+
+
+def as_async_view(view_class, **initkwargs):
+    """Return an async view running view_class in the bounded thread pool"""
+    view = view_class.as_view(**initkwargs)
+
+    def run(request, *args, **kwargs):
+        # Django only manages the connections of its own request thread, pool
+        # threads drop their expired or broken connections themselves
+        close_old_connections()
+        try:
+            response = view(request, *args, **kwargs)
+            # Rendered here, Django would render on its shared thread
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+        finally:
+            close_old_connections()
+
+    # Keeps csrf_exempt and view_class of the DRF view
+    @functools.wraps(view)
+    async def async_view(request, *args, **kwargs):
+        return await sync_to_async(run, thread_sensitive=False, executor=get_executor())(request, *args, **kwargs)
+
+    return async_view
+
+
+def as_view(view_class, **initkwargs):
+    """The async view when ASYNC_VIEWS is set, the plain DRF view otherwise"""
+    if settings.ASYNC_VIEWS:
+        return as_async_view(view_class, **initkwargs)
+    return view_class.as_view(**initkwargs)
@@ -0,0 +1,124 @@
+"""
+Authentication classes
+"""
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import authentication, exceptions
+from core import caching
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with a TTL per entry"""
+
+    def __init__(self, size):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_tokens = LRUCache(settings.TOKEN_CACHE_SIZE)
+
+# Moves with every revoked token, entries cached before it moved are stale
+REVOCATIONS_KEY = 'auth:token:revocations'
+
+
+def _cache_key(key):
+    # Never store raw tokens as cache keys
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate_token(key):
+    """Drop a token from this process and the shared tier, and from every other process's LRU
+
+    Call once the change is committed, or a concurrent request can cache
+    the old rows again.
+    """
+    cache_key = _cache_key(key)
+    local_tokens.delete(cache_key)
+    cache.delete(cache_key)
+    try:
+        cache.incr(REVOCATIONS_KEY)
+    except ValueError:
+        cache.add(REVOCATIONS_KEY, caching.initial_version(), None)
+
+
+class CachedTokenAuthentication(authentication.TokenAuthentication):
+    """Drop-in TokenAuthentication that caches the Token/User lookup
+
+    Lookups go to a bounded in-process LRU, then to the shared cache (Redis in
+    production, when TOKEN_CACHE_SHARED is on), then to the database. The
+    database lookup also loads customer/eventorganizer so views can use
+    request.user.customer without another query. Entries live for
+    TOKEN_CACHE_TTL seconds.
+
+    Entries carry the revocation counter read before the database lookup.
+    Deleting a token or saving its user moves the counter once committed, and
+    every process then treats the entries from before as misses, at the cost
+    of reading the counter on each request.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = _cache_key(key)
+        revocations = caching.get_versions([REVOCATIONS_KEY])[0]
+        entry = local_tokens.get(cache_key)
+        if entry is None and settings.TOKEN_CACHE_SHARED:
+            entry = cache.get(cache_key)
+            if entry is not None:
+                local_tokens.set(cache_key, entry, settings.TOKEN_CACHE_TTL)
+        if entry is not None and entry[0] != revocations:
+            entry = None
+
+        if entry is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related(
+                    'user', 'user__customer', 'user__eventorganizer'
+                ).get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+            # Cached pickled, every request gets its own copy to modify
+            entry = (revocations, pickle.dumps(token, pickle.HIGHEST_PROTOCOL))
+            local_tokens.set(cache_key, entry, settings.TOKEN_CACHE_TTL)
+            if settings.TOKEN_CACHE_SHARED:
+                cache.set(cache_key, entry, settings.TOKEN_CACHE_TTL)
+
+        token = pickle.loads(entry[1])
+        return (token.user, token)
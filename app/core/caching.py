@@ -0,0 +1,126 @@
+"""
+Versioned response cache for public reads
+
+Every event has a version counter in the cache and the catalogue as a whole
+has one more. Writes bump the counters instead of deleting cached entries,
+responses are cached under the versions they were built from, so a cached
+response is only found again while nothing it shows has changed.
+
+With read replicas a response may be built from rows from before the last
+write, it is then kept only as long as replicas may lag, and clients pinned
+to the primary (see core/db/replicas.py) don't read cached responses.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponseNotModified
+from rest_framework.response import Response
+from core import metrics
+from core.db import replicas
+
+
+CATALOGUE_VERSION_KEY = 'version:catalogue'
+EVENT_VERSION_KEY = 'version:event:{}'
+# When a bump last committed, kept only with read replicas
+LAST_WRITE_KEY = 'version:last-write'
+
+
+def event_version_key(event_id):
+    return EVENT_VERSION_KEY.format(event_id)
+
+
+def initial_version():
+    # Counters start from the clock, not 1, so an evicted counter never comes
+    # back at a version some old response was cached under
+    return time.time_ns()
+
+
+def get_versions(keys):
+    """Return the current value of each version counter, creating missing ones"""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, initial_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, initial_version(), None)
+
+
+def _bump_committed(keys):
+    _bump(keys)
+    if settings.DATABASE_REPLICAS:
+        cache.set(LAST_WRITE_KEY, time.time(), None)
+
+
+def bump_event(event_id):
+    """Invalidate cached responses showing the event"""
+    keys = [event_version_key(event_id), CATALOGUE_VERSION_KEY]
+    _bump(keys)
+    # Bump again once the write is visible, a read that raced with the
+    # transaction may have cached the old rows under the first bump
+    transaction.on_commit(lambda: _bump_committed(keys))
+
+
+def bump_tickets(ticket_ids):
+    """Invalidate cached responses showing the tickets' events"""
+    from core.models import Ticket
+
+    event_ids = Ticket.objects.filter(pk__in=list(ticket_ids)).values_list('event_id', flat=True).distinct()
+    for event_id in event_ids:
+        bump_event(event_id)
+
+
+class VersionedCacheMixin:
+    """Cache successful GET responses of a DRF view
+
+    Views return the version keys the response depends on from
+    get_cache_version_keys. The ETag is derived from the same versions, so a
+    matching If-None-Match is answered with 304 before the cache is read.
+    """
+    cache_timeout = None
+
+    def get_cache_version_keys(self):
+        raise NotImplementedError('Views using VersionedCacheMixin must define get_cache_version_keys')
+
+    def get(self, request, *args, **kwargs):
+        versions = get_versions(self.get_cache_version_keys())
+        digest = hashlib.md5(f'{request.build_absolute_uri()}|{versions}'.encode()).hexdigest()
+        etag = f'"{digest}"'
+
+        if etag in request.headers.get('If-None-Match', ''):
+            metrics.RESPONSE_CACHE.labels('not_modified').inc()
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        key = f'response:{digest}'
+        data = None if replicas.pinned_to_primary() else cache.get(key)
+        if data is None:
+            metrics.RESPONSE_CACHE.labels('miss').inc()
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cache.set(key, response.data, self.get_cache_timeout())
+        else:
+            metrics.RESPONSE_CACHE.labels('hit').inc()
+            response = Response(data)
+        response['ETag'] = etag
+        return response
+
+    def get_cache_timeout(self):
+        if replicas.reads_from_replica():
+            last_write = cache.get(LAST_WRITE_KEY)
+            if last_write is not None and time.time() - last_write < settings.REPLICA_PIN_SECONDS:
+                # The replica may not have the write yet
+                return settings.REPLICA_PIN_SECONDS
+        return self.cache_timeout or settings.RESPONSE_CACHE_TIMEOUT
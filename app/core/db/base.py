@@ -0,0 +1,171 @@
+"""
+PostgreSQL backend with connection health checks and an optional pool
+
+Set ENGINE to 'core.db'. On top of django.db.backends.postgresql:
+
+CONN_HEALTH_CHECKS, as in Django 4.1: a connection kept between requests
+(CONN_MAX_AGE) is pinged before it is first used in a request and replaced
+if the server dropped it, instead of failing the request's first query.
+
+POOL = {'SIZE': n, 'TIMEOUT': seconds}: connections are taken from a pool of
+at most n per process and go back to it whenever Django closes them, which
+with CONN_MAX_AGE = 0 is at the end of every request or Celery task. Threads
+then share a few warm connections instead of each opening its own, and a
+process never holds more than n. Waiting longer than TIMEOUT for one raises
+OperationalError. Pools belong to the process that made them, a forked child
+(gunicorn preload, Celery prefork) starts its own and leaves the sockets it
+inherited alone, closing them would end the parent's connections too.
+"""
+import os
+import threading
+
+import psycopg2
+from psycopg2 import extensions
+from django.db.backends.postgresql import base, creation
+
+
+class ConnectionPool:
+    """Up to size connections, idle ones are reused newest first"""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self.idle = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def get(self):
+        """Take a slot and return an idle connection, None when the caller has to open one
+
+        A caller that then fails to open one gives the slot back with release.
+        """
+        if not self.slots.acquire(timeout=self.timeout):
+            raise psycopg2.OperationalError(
+                f'No database connection free in the pool of {self.size} after {self.timeout}s'
+            )
+        with self.lock:
+            connection = self.idle.pop() if self.idle else None
+        if connection is not None and connection.closed:
+            return None
+        return connection
+
+    def release(self):
+        self.slots.release()
+
+    def put(self, connection):
+        """Take a connection back, a broken one is dropped"""
+        if os.getpid() != self.pid:
+            # Inherited from the parent process, see the module docs
+            _inherited.append(connection)
+            return
+        try:
+            status = connection.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                connection.close()
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except psycopg2.Error:
+            connection.close()
+        if not connection.closed:
+            with self.lock:
+                self.idle.append(connection)
+        self.release()
+
+    def close(self):
+        """Close the idle connections"""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+# Connections of a parent process, kept referenced so they are never closed here
+_inherited = []
+
+
+def get_pool(alias, database, options):
+    # By database too, tests switch an alias to the test database
+    key = (alias, database)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[key] = ConnectionPool(options['SIZE'], options.get('TIMEOUT', 10))
+        return pool
+
+
+def close_pool(alias, database):
+    """Close the idle connections of a pool, those in use go on"""
+    with _pools_lock:
+        pool = _pools.pop((alias, database), None)
+    if pool is not None:
+        pool.close()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # A database with connections open can't be dropped
+        close_pool(self.connection.alias, test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.health_check_done = False
+
+    def get_new_connection(self, conn_params):
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return super().get_new_connection(conn_params)
+
+        pool = get_pool(self.alias, conn_params.get('database'), options)
+        connection = pool.get()
+        if connection is None:
+            try:
+                connection = super().get_new_connection(conn_params)
+            except BaseException:
+                pool.release()
+                raise
+        else:
+            # What get_new_connection sets up for a new connection
+            self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+            # It may have been dropped while idle
+            self.health_check_done = False
+        self.pool = pool
+        return connection
+
+    def connect(self):
+        self.health_check_done = True
+        super().connect()
+
+    def _close(self):
+        if self.pool is None:
+            return super()._close()
+        pool, self.pool = self.pool, None
+        pool.put(self.connection)
+
+    def close_if_unusable_or_obsolete(self):
+        # Called as each request and Celery task starts and ends
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
+
+    def close_if_health_check_failed(self):
+        """Replace a connection the server dropped, checked before the first query of a request"""
+        # Not within a transaction, replacing the connection would lose it
+        if (self.connection is None or self.health_check_done or self.in_atomic_block
+                or not self.settings_dict.get('CONN_HEALTH_CHECKS')):
+            return
+        self.health_check_done = True
+        if not self.is_usable():
+            self.close()
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
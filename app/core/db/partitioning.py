@@ -0,0 +1,97 @@
+"""
+Booking table partitioned by event
+
+With BOOKING_PARTITIONS = n the core_booking table is hash partitioned on
+event_id into n tables, core_booking_p0 to core_booking_p<n-1>. A query on
+one event's bookings (EventBookingListView, the export, the cascade when an
+event is deleted) reads a single partition and its smaller indexes, and
+autovacuum works through the partitions one at a time instead of the whole
+table.
+
+Postgres wants the partition key in every unique constraint, so the primary
+key becomes (id, event_id). The sequence keeps ids unique and Django still
+treats id as the primary key. No other table may reference a booking.
+
+partition_bookings rebuilds the table with the same columns, indexes and
+constraints under the same names, and moves the rows. It holds an exclusive
+lock on the table while it copies them.
+"""
+from django.db import transaction
+
+TABLE = 'core_booking'
+KEY = 'event_id'
+
+
+def booking_partitions(connection):
+    """Number of partitions of the booking table, 0 when it is a plain table"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind = 'p', (SELECT COUNT(*) FROM pg_inherits WHERE inhparent = pg_class.oid) "
+            "FROM pg_class WHERE oid = %s::regclass",
+            [TABLE],
+        )
+        partitioned, partitions = cursor.fetchone()
+    return partitions if partitioned else 0
+
+
+def partition_bookings(connection, partitions):
+    """Rebuild the booking table hash partitioned on event_id, or as one table for 0"""
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+        if booking_partitions(connection) == partitions:
+            return
+        # A table with foreign key checks still to run can't be altered
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+        cursor.execute('SELECT conname FROM pg_constraint WHERE confrelid = %s::regclass', [TABLE])
+        references = [row[0] for row in cursor.fetchall()]
+        if references:
+            raise ValueError(f'{TABLE} is referenced by {", ".join(references)}')
+
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass ORDER BY contype, conname",
+            [TABLE],
+        )
+        constraints = cursor.fetchall()
+        for name, kind, definition in constraints:
+            if kind == 'u' and partitions and KEY not in definition:
+                raise ValueError(f'Unique constraint {name} has to include {KEY} to partition {TABLE}')
+        # Indexes of constraints come back with the constraints
+        cursor.execute(
+            "SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %s::regclass "
+            "AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = indexrelid)",
+            [TABLE],
+        )
+        # Indexes of a partitioned table are defined ON ONLY it, made that way
+        # they wouldn't cover the partitions
+        indexes = [row[0].replace(' ON ONLY ', ' ON ') for row in cursor.fetchall()]
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [TABLE, 'id'])
+        sequence = cursor.fetchone()[0]
+
+        cursor.execute('SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass', [TABLE])
+        old_partitions = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_old')
+        for partition in old_partitions:
+            cursor.execute(f'ALTER TABLE {partition} RENAME TO {partition}_old')
+        partition_by = f' PARTITION BY HASH ({KEY})' if partitions else ''
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {TABLE}_old INCLUDING DEFAULTS){partition_by}')
+        for remainder in range(partitions):
+            cursor.execute(
+                f'CREATE TABLE {TABLE}_p{remainder} PARTITION OF {TABLE} '
+                f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+            )
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {TABLE}_old')
+        # Or it goes with the old table
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id')
+        cursor.execute(f'DROP TABLE {TABLE}_old')
+
+        for name, kind, definition in constraints:
+            if kind == 'p':
+                definition = f'PRIMARY KEY (id, {KEY})' if partitions else 'PRIMARY KEY (id)'
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {connection.ops.quote_name(name)} {definition}')
+        for definition in indexes:
+            cursor.execute(definition)
+        cursor.execute(f'ANALYZE {TABLE}')
+        cursor.execute('SET CONSTRAINTS ALL DEFERRED')
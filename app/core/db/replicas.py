@@ -0,0 +1,141 @@
+"""
+Read replicas with read-your-writes
+
+ReplicaRouter sends the reads of safe requests (GET, HEAD, OPTIONS) to one of
+settings.DATABASE_REPLICAS. Everything else reads from the primary: requests
+that write, Celery tasks and commands, which may depend on what they just
+wrote, and select_for_update, which Django routes as a write.
+
+Replicas lag behind the primary. Once a request writes, its later reads go to
+the primary, and ReplicaPinningMiddleware keeps the client on the primary for
+REPLICA_PIN_SECONDS more: the response sets a primary_until cookie and an
+X-Primary-Until header, which clients without cookies send back. So a
+customer who just booked finds the booking in their list straight away.
+"""
+import asyncio
+import contextvars
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'primary_until'
+PIN_HEADER = 'X-Primary-Until'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_reads = contextvars.ContextVar('replica_reads', default=None)
+
+
+class RequestReads:
+    """Where the request in progress reads from, shared with the threads it runs in"""
+
+    def __init__(self, replica, pinned):
+        self.replica = replica
+        self.pinned = pinned
+        self.wrote = False
+
+
+def reads_from_replica():
+    """Whether the reads of the request in progress go to a replica"""
+    reads = _reads.get()
+    return reads is not None and reads.replica is not None
+
+
+def pinned_to_primary():
+    """Whether the client of the request in progress wrote within REPLICA_PIN_SECONDS"""
+    reads = _reads.get()
+    return reads is not None and (reads.pinned or reads.wrote)
+
+
+def _pinned_until(request):
+    """The pin the client sent back, if it is still running"""
+    now = time.time()
+    for value in (request.COOKIES.get(PIN_COOKIE), request.headers.get(PIN_HEADER)):
+        try:
+            until = int(value)
+        except (TypeError, ValueError):
+            continue
+        # Never longer than a pin this server would have set
+        if now < until <= now + settings.REPLICA_PIN_SECONDS + 1:
+            return until
+    return None
+
+
+class ReplicaRouter:
+    """Route reads as described in the module docs, writes to the primary"""
+
+    def db_for_read(self, model, **hints):
+        reads = _reads.get()
+        if reads is not None and reads.replica is not None:
+            return reads.replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        reads = _reads.get()
+        if reads is not None:
+            reads.wrote = True
+            reads.replica = None
+        # Also for instances read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas follow the primary's schema
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """Decide where each request reads from and pin clients that wrote"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Tells Django this instance is a coroutine function
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        reads, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _reads.reset(token)
+        return self.finish(response, reads)
+
+    async def __acall__(self, request):
+        reads, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _reads.reset(token)
+        return self.finish(response, reads)
+
+    def start(self, request):
+        pinned = _pinned_until(request) is not None
+        replica = None
+        if settings.DATABASE_REPLICAS and request.method in SAFE_METHODS and not pinned:
+            # One replica for the whole request, they may lag by different amounts
+            replica = random.choice(settings.DATABASE_REPLICAS)
+        reads = RequestReads(replica, pinned)
+        return reads, _reads.set(reads)
+
+    def finish(self, response, reads):
+        if reads.wrote and settings.DATABASE_REPLICAS:
+            until = int(time.time()) + settings.REPLICA_PIN_SECONDS + 1
+            response.set_cookie(PIN_COOKIE, str(until), max_age=settings.REPLICA_PIN_SECONDS + 1, samesite='Lax')
+            response[PIN_HEADER] = str(until)
+        return response
@@ -0,0 +1,169 @@
+"""
+Serializer-free list endpoints
+
+A ModelSerializer builds every field of every row through its own Field
+objects, which is most of the CPU of a list endpoint once its queries are
+few. With FAST_LIST_VIEWS set, views using FastListMixin read their rows with
+.values() instead and build the response dicts straight from them, then
+render them with orjson (core/renderers.py). The response is the same, byte
+for byte.
+
+ValuesRepresentation works out from the view's serializer class which
+columns to read and how to turn each into its output: integers, strings,
+choices and primary keys pass through as read, decimals already at the
+field's places and aware datetimes take a shortcut to the same string, any
+other value goes through its field's to_representation. A nested serializer
+of a reverse foreign key (an event's tickets) is read with one more query, as
+prefetch_related would. Serializers with other fields are refused.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from core import profiling
+from core.renderers import ORJSONRenderer
+
+# Fields whose to_representation gives back what .values() read
+PASS_THROUGH = (
+    serializers.IntegerField, serializers.CharField, serializers.EmailField, serializers.BooleanField,
+    serializers.ChoiceField, serializers.PrimaryKeyRelatedField,
+)
+
+_representations = {}
+
+
+def converter(field):
+    """Function giving field.to_representation of a value read by .values(), None to pass it through
+
+    Datetimes are output in the current timezone, build the converters again
+    for each response.
+    """
+    if type(field) in PASS_THROUGH:
+        return None
+    if type(field) is serializers.DecimalField and not field.localize \
+            and getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING):
+        exponent = -field.decimal_places
+
+        def decimal(value):
+            digits = value.as_tuple()
+            # What quantizing to the field's places would give
+            if digits.exponent == exponent and (field.max_digits is None or len(digits.digits) <= field.max_digits):
+                return f'{value:f}'
+            return field.to_representation(value)
+        return decimal
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if type(field) is serializers.DateTimeField and output_format and output_format.lower() == ISO_8601:
+        field_timezone = getattr(field, 'timezone', field.default_timezone())
+        if field_timezone is None:
+            return field.to_representation
+
+        def datetime(value):
+            if isinstance(value, str) or timezone.is_naive(value):
+                return field.to_representation(value)
+            try:
+                value = value.astimezone(field_timezone).isoformat()
+            except OverflowError:
+                return field.to_representation(value)
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return datetime
+    return field.to_representation
+
+
+class ValuesRepresentation:
+    """A serializer's output built from .values() rows"""
+
+    def __init__(self, serializer_class):
+        model = serializer_class.Meta.model
+        self.pk = model._meta.pk.attname
+        self.fields = []
+        self.nested = {}
+        sources = {self.pk}
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                relation = model._meta.get_field(field.source)
+                if not relation.one_to_many:
+                    raise ImproperlyConfigured(f'{serializer_class.__name__}.{name} is not a reverse foreign key')
+                self.nested[name] = (relation, get_representation(field.child.__class__))
+                self.fields.append((name, None))
+            elif isinstance(field, (serializers.SerializerMethodField, serializers.BaseSerializer)) \
+                    or '.' in field.source or field.source == '*':
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name} can only be built by the serializer')
+            else:
+                self.fields.append((name, field))
+                sources.add(field.source)
+        self.sources = sorted(sources)
+
+    @profiling.timed_serialization
+    def represent(self, rows):
+        """Output of the serializer with many=True for the rows"""
+        nested = {name: self.represent_related(rows, *related) for name, related in self.nested.items()}
+        fields = [
+            (name, None, None) if field is None else (name, field.source, converter(field))
+            for name, field in self.fields
+        ]
+        data = []
+        for row in rows:
+            item = {}
+            for name, source, convert in fields:
+                if source is None:
+                    item[name] = nested[name][row[self.pk]]
+                    continue
+                value = row[source]
+                if convert is not None and value is not None:
+                    value = convert(value)
+                item[name] = value
+            data.append(item)
+        return data
+
+    def represent_related(self, rows, relation, representation):
+        """Output of the related rows of each row, by its primary key"""
+        related = defaultdict(list)
+        if not rows:
+            return related
+        key = relation.field.attname
+        related_rows = list(
+            relation.related_model._default_manager.filter(**{f'{key}__in': [row[self.pk] for row in rows]})
+            .values(*representation.sources, key)
+        )
+        for row, item in zip(related_rows, representation.represent(related_rows)):
+            related[row[key]].append(item)
+        return related
+
+
+def get_representation(serializer_class):
+    """The ValuesRepresentation of a serializer class, built once"""
+    if serializer_class not in _representations:
+        _representations[serializer_class] = ValuesRepresentation(serializer_class)
+    return _representations[serializer_class]
+
+
+class FastListMixin:
+    """Serve a ListAPIView from .values() rows when FAST_LIST_VIEWS is set, see the module docs
+
+    The view's get_queryset and pagination are used as they are, so they must
+    work on dicts as well as on model instances.
+    """
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if not settings.FAST_LIST_VIEWS:
+            return renderers
+        return [ORJSONRenderer() if type(renderer) is JSONRenderer else renderer for renderer in renderers]
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_LIST_VIEWS:
+            return super().list(request, *args, **kwargs)
+        representation = get_representation(self.get_serializer_class())
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).values(*representation.sources)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(representation.represent(page))
+        return Response(representation.represent(list(queryset)))
@@ -0,0 +1,267 @@
+"""
+Idempotency keys for retried writes
+
+A client sends the same Idempotency-Key header with every retry of a write.
+The first request with a key claims it and runs, its response is stored for
+IDEMPOTENCY_KEY_TTL seconds and replayed to every retry, marked with an
+Idempotent-Replayed header, without running the view again. A retry while
+the first request is still running gets 409 and Retry-After. A key reused
+for a different request (method, path or body) gets 422. Keys are per user.
+
+Server errors (5xx) and answers that depend on the moment (401, 403, 409,
+429) are not stored, the key is released and a retry runs again. A key
+claimed by a request that never finished, a crashed worker say, is taken
+over after IDEMPOTENCY_LOCK_SECONDS.
+
+Views opt in with IdempotentMixin. Keys live in Redis when
+IDEMPOTENCY_REDIS_URL is set, and in the IdempotencyKey table otherwise or
+while Redis is unreachable. A retry that straddles the switch can run twice.
+"""
+import base64
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+# Stored, and replayed, unless the status is one of these or a server error
+NOT_STORED = {
+    status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN, status.HTTP_409_CONFLICT,
+    status.HTTP_429_TOO_MANY_REQUESTS,
+}
+
+_client = None
+
+
+class KeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still in progress, retry later.'
+    default_code = 'idempotency_key_in_use'
+    # Sent as Retry-After
+    wait = 1
+
+
+class KeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was used for a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+class Replay(Exception):
+    """Raised with the stored response of a completed request"""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class RedisStore:
+    """A JSON record per key, without a status while in progress"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def claim(self, key, fingerprint):
+        """None when claimed, the record of whoever has the key otherwise"""
+        record = json.dumps({'fingerprint': fingerprint})
+        if self.client.set(key, record, nx=True, ex=settings.IDEMPOTENCY_LOCK_SECONDS):
+            return None
+        stored = self.client.get(key)
+        # Expired in between
+        if stored is None:
+            return self.claim(key, fingerprint)
+        return json.loads(stored)
+
+    def finish(self, key, record):
+        self.client.set(key, json.dumps(record), ex=settings.IDEMPOTENCY_KEY_TTL)
+
+    def release(self, key):
+        self.client.delete(key)
+
+
+class DatabaseStore:
+    """IdempotencyKey rows, one statement per operation"""
+
+    def claim(self, key, fingerprint):
+        from core.models import IdempotencyKey
+
+        now = timezone.now()
+        # Inserts the key, or takes over an expired one, in one statement so
+        # concurrent claims can't both win, and without a savepoint
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {IdempotencyKey._meta.db_table}
+                    (key, fingerprint, status_code, content_type, body, expires_at)
+                VALUES (%s, %s, NULL, '', '', %s)
+                ON CONFLICT (key) DO UPDATE SET
+                    fingerprint = EXCLUDED.fingerprint, status_code = NULL, content_type = '', body = '',
+                    expires_at = EXCLUDED.expires_at
+                WHERE {IdempotencyKey._meta.db_table}.expires_at <= %s
+                RETURNING key
+                """,
+                [key, fingerprint, now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS), now],
+            )
+            if cursor.fetchone():
+                return None
+        stored = IdempotencyKey.objects.filter(key=key).values(
+            'fingerprint', 'status_code', 'content_type', 'body'
+        ).first()
+        if stored is None:
+            return self.claim(key, fingerprint)
+        stored['body'] = base64.b64encode(stored['body']).decode()
+        return stored
+
+    def finish(self, key, record):
+        from core.models import IdempotencyKey
+
+        values = {
+            'fingerprint': record['fingerprint'],
+            'status_code': record['status_code'],
+            'content_type': record['content_type'],
+            'body': base64.b64decode(record['body']),
+            'expires_at': timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+        }
+        # Missing when Redis went away after the claim
+        if not IdempotencyKey.objects.filter(key=key).update(**values):
+            IdempotencyKey.objects.create(key=key, **values)
+
+    def release(self, key):
+        from core.models import IdempotencyKey
+
+        IdempotencyKey.objects.filter(key=key, status_code__isnull=True).delete()
+
+
+database_store = DatabaseStore()
+
+
+def get_client():
+    """Return the idempotency Redis client, short timeouts so a slow Redis falls back quickly"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.IDEMPOTENCY_REDIS_URL, socket_timeout=0.1, socket_connect_timeout=0.1
+        )
+    return _client
+
+
+def _call(operation, *args):
+    if settings.IDEMPOTENCY_REDIS_URL:
+        try:
+            return getattr(RedisStore(get_client()), operation)(*args)
+        except redis.RedisError:
+            metrics.REDIS_FALLBACKS.labels('idempotency').inc()
+            logger.warning('Idempotency Redis unavailable, using the database', exc_info=True)
+    return getattr(database_store, operation)(*args)
+
+
+def purge():
+    """Delete expired keys from the database, Redis expires its own"""
+    from core.models import IdempotencyKey
+
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+class Claim:
+    """A key this request holds until its response is stored or it gives up"""
+
+    def __init__(self, key, fingerprint):
+        self.key = key
+        self.fingerprint = fingerprint
+
+    def finish(self, response):
+        if response.status_code >= 500 or response.status_code in NOT_STORED:
+            self.release()
+            return
+        if hasattr(response, 'render'):
+            response.render()
+        _call('finish', self.key, {
+            'fingerprint': self.fingerprint,
+            'status_code': response.status_code,
+            'content_type': response.get('Content-Type', ''),
+            'body': base64.b64encode(response.content).decode(),
+        })
+
+    def release(self):
+        _call('release', self.key)
+
+
+def storage_key(user, value):
+    """Key a user's Idempotency-Key header value is stored under"""
+    return 'idempotency:' + hashlib.sha256(f'{user.pk}:{value}'.encode()).hexdigest()
+
+
+def claim(request):
+    """Claim the request's Idempotency-Key, None for requests without one
+
+    Raises Replay, KeyInUse or KeyReused when another request has the key.
+    """
+    value = request.headers.get(HEADER)
+    if not value or not request.user.is_authenticated:
+        return None
+    key = storage_key(request.user, value)
+    # The parsed body, a retried multipart request comes with a new boundary
+    data = dict(request.data.lists()) if hasattr(request.data, 'lists') else request.data
+    fingerprint = hashlib.sha256(
+        json.dumps([request.method, request.get_full_path(), data], sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+    stored = _call('claim', key, fingerprint)
+    if stored is None:
+        return Claim(key, fingerprint)
+    if stored['fingerprint'] != fingerprint:
+        raise KeyReused()
+    if stored.get('status_code') is None:
+        raise KeyInUse()
+    metrics.IDEMPOTENT_REPLAYS.inc()
+    response = HttpResponse(
+        base64.b64decode(stored['body']), status=stored['status_code'], content_type=stored['content_type'] or None
+    )
+    response[REPLAYED_HEADER] = 'true'
+    raise Replay(response)
+
+
+class IdempotentMixin:
+    """Honour the Idempotency-Key header on a DRF view's writes, see the module docs
+
+    The key is claimed once the user is known, before permissions and
+    throttles: a replay does no work so it is neither refused for a pass that
+    has run out since nor counted against the rate.
+    """
+    idempotency_claim = None
+
+    def check_permissions(self, request):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            self.idempotency_claim = claim(request)
+        super().check_permissions(request)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Replay):
+            return exc.response
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # Unhandled, a server error
+            if self.idempotency_claim is not None:
+                self.idempotency_claim.release()
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.idempotency_claim is not None:
+            self.idempotency_claim.finish(response)
+        return response
@@ -0,0 +1,264 @@
+"""
+Redis-backed hot inventory for Tickets
+
+With INVENTORY_BACKEND = 'redis' the availability of every Ticket lives in
+Redis. Reservations are one atomic Lua script, so a popular ticket is no
+longer a hot row in Postgres. Changed tickets are recorded in a dirty set and
+written back to core.models.Ticket in batches by core.tasks.flush_inventory.
+Sales are counted as a delta per ticket and added to Ticket.sold on flush,
+their revenue likewise, in cents, to Ticket.revenue.
+"""
+from decimal import Decimal
+
+import redis
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+
+
+TICKET_KEY = 'inventory:ticket:{}'
+DIRTY_KEY = 'inventory:dirty'
+SOLD_KEY = 'inventory:sold:{}'
+REVENUE_KEY = 'inventory:revenue:{}'
+
+# Returns the availability left, -1 if there isn't enough and -2 if the
+# ticket hasn't been loaded from the database yet. ARGV[3] is how many of the
+# tickets count as sold, held ones don't, ARGV[4] their revenue in cents.
+RESERVE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    return -2
+end
+local quantity = tonumber(ARGV[1])
+if tonumber(current) < quantity then
+    return -1
+end
+local left = redis.call('DECRBY', KEYS[1], quantity)
+redis.call('INCRBY', KEYS[3], ARGV[3])
+redis.call('INCRBY', KEYS[4], ARGV[4])
+redis.call('SADD', KEYS[2], ARGV[2])
+return left
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -2
+end
+local left = redis.call('INCRBY', KEYS[1], ARGV[1])
+redis.call('DECRBY', KEYS[3], ARGV[3])
+redis.call('DECRBY', KEYS[4], ARGV[4])
+redis.call('SADD', KEYS[2], ARGV[2])
+return left
+"""
+
+# Sets availability to ARGV[2] only if it still is ARGV[1] and nothing is
+# waiting to be flushed, returns 1 if it was set
+REPLACE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] or redis.call('SISMEMBER', KEYS[2], ARGV[3]) == 1
+        or tonumber(redis.call('GET', KEYS[3]) or '0') ~= 0 then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2])
+return 1
+"""
+
+_client = None
+_scripts = {}
+
+
+def is_enabled():
+    """Whether availability is kept in Redis instead of the Ticket row"""
+    return settings.INVENTORY_BACKEND == 'redis'
+
+
+def get_client():
+    """Return the shared Redis client for inventory"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.INVENTORY_REDIS_URL)
+    return _client
+
+
+def _cents(revenue):
+    return int(revenue * 100)
+
+
+def _run(source, ticket_id, quantity, loader, sold, revenue):
+    """Run an inventory script, loading the ticket from the database once if needed"""
+    script, client = _script(source)
+    keys = [TICKET_KEY.format(ticket_id), DIRTY_KEY, SOLD_KEY.format(ticket_id), REVENUE_KEY.format(ticket_id)]
+    args = [quantity, ticket_id, sold, _cents(revenue)]
+    result = script(keys=keys, args=args, client=client)
+    if result == -2:
+        availability = loader(ticket_id)
+        if availability is None:
+            raise ValidationError("Quantity not allowed")
+        # NX so a concurrent loader or reservation is never overwritten
+        client.set(keys[0], availability, nx=True)
+        result = script(keys=keys, args=args, client=client)
+    return result
+
+
+def _script(source):
+    client = get_client()
+    if source not in _scripts:
+        _scripts[source] = client.register_script(source)
+    return _scripts[source], client
+
+
+def reserve(ticket_id, quantity, loader, sold, revenue=0):
+    """Take quantity tickets, raise if not enough are left"""
+    if _run(RESERVE_SCRIPT, ticket_id, quantity, loader, sold, revenue) < 0:
+        raise ValidationError("Quantity not allowed")
+
+
+def release(ticket_id, quantity, loader, sold, revenue=0):
+    """Give quantity tickets back"""
+    _run(RELEASE_SCRIPT, ticket_id, quantity, loader, sold, revenue)
+
+
+def sell(ticket_id, quantity, revenue=0):
+    """Count quantity already reserved tickets as sold"""
+    pipe = get_client().pipeline()
+    pipe.incrby(SOLD_KEY.format(ticket_id), quantity)
+    pipe.incrby(REVENUE_KEY.format(ticket_id), _cents(revenue))
+    pipe.sadd(DIRTY_KEY, ticket_id)
+    pipe.execute()
+
+
+def store(ticket_id, availability):
+    """Set availability after a direct write to the Ticket row"""
+    get_client().set(TICKET_KEY.format(ticket_id), availability)
+
+
+def store_on_commit(availability):
+    """Set {ticket_id: availability} once the current transaction commits, a rollback leaves Redis alone"""
+    def store_all():
+        pipe = get_client().pipeline()
+        for ticket_id, left in availability.items():
+            pipe.set(TICKET_KEY.format(ticket_id), left)
+        pipe.execute()
+
+    if availability:
+        transaction.on_commit(store_all)
+
+
+def replace(ticket_id, expected, availability):
+    """Set availability if Redis still holds expected and has no unflushed change, return whether it did"""
+    script, client = _script(REPLACE_SCRIPT)
+    keys = [TICKET_KEY.format(ticket_id), DIRTY_KEY, SOLD_KEY.format(ticket_id)]
+    return bool(script(keys=keys, args=[expected, availability, ticket_id], client=client))
+
+
+def unflushed(ticket_ids):
+    """Return the ids of the tickets whose Redis changes aren't in the database yet"""
+    ticket_ids = list(ticket_ids)
+    if not ticket_ids:
+        return set()
+    pipe = get_client().pipeline()
+    for ticket_id in ticket_ids:
+        pipe.sismember(DIRTY_KEY, ticket_id)
+    dirty = {ticket_id for ticket_id, flag in zip(ticket_ids, pipe.execute()) if flag}
+    return dirty | set(pending_sales(ticket_ids))
+
+
+def forget(ticket_id):
+    """Drop a deleted ticket"""
+    client = get_client()
+    client.delete(TICKET_KEY.format(ticket_id), SOLD_KEY.format(ticket_id), REVENUE_KEY.format(ticket_id))
+    client.srem(DIRTY_KEY, ticket_id)
+
+
+def read(ticket_ids):
+    """Return {ticket_id: availability} for the tickets Redis knows about"""
+    ticket_ids = list(ticket_ids)
+    if not ticket_ids:
+        return {}
+    values = get_client().mget([TICKET_KEY.format(ticket_id) for ticket_id in ticket_ids])
+    return {
+        ticket_id: int(value)
+        for ticket_id, value in zip(ticket_ids, values)
+        if value is not None
+    }
+
+
+def _pending(key, ticket_ids):
+    ticket_ids = list(ticket_ids)
+    if not ticket_ids:
+        return {}
+    values = get_client().mget([key.format(ticket_id) for ticket_id in ticket_ids])
+    return {
+        ticket_id: int(value)
+        for ticket_id, value in zip(ticket_ids, values)
+        if value is not None and int(value)
+    }
+
+
+def pending_sales(ticket_ids):
+    """Return {ticket_id: sold} not yet added to Ticket.sold"""
+    return _pending(SOLD_KEY, ticket_ids)
+
+
+def pending_revenue(ticket_ids):
+    """Return {ticket_id: revenue} not yet added to Ticket.revenue"""
+    return {ticket_id: Decimal(cents).scaleb(-2) for ticket_id, cents in _pending(REVENUE_KEY, ticket_ids).items()}
+
+
+def _take_pending(client, key, ticket_ids):
+    """Reset the deltas under key to 0 and return what they were"""
+    pipe = client.pipeline()
+    for ticket_id in ticket_ids:
+        pipe.getset(key.format(ticket_id), 0)
+    return {
+        ticket_id: int(value)
+        for ticket_id, value in zip(ticket_ids, pipe.execute())
+        if value is not None and int(value)
+    }
+
+
+def _flush_batch(client, ticket_ids):
+    """Write one batch of dirty tickets back to the database"""
+    from core import caching
+    from core.models import Ticket
+
+    # Clear the flags before reading, a reservation racing with us marks the
+    # ticket dirty again and is picked up by the next flush
+    client.srem(DIRTY_KEY, *ticket_ids)
+    sold, revenue = {}, {}
+    try:
+        availability = read(ticket_ids)
+        sold = _take_pending(client, SOLD_KEY, ticket_ids)
+        revenue = _take_pending(client, REVENUE_KEY, ticket_ids)
+        tickets = [
+            Ticket(
+                pk=ticket_id, availability=left, sold=F('sold') + sold.get(ticket_id, 0),
+                revenue=F('revenue') + Decimal(revenue.get(ticket_id, 0)).scaleb(-2),
+            )
+            for ticket_id, left in availability.items()
+        ]
+        Ticket.objects.bulk_update(tickets, ['availability', 'sold', 'revenue'])
+        caching.bump_tickets(availability)
+    except Exception:
+        # Keep them dirty, with their sales, so the next flush retries
+        for key, deltas in ((SOLD_KEY, sold), (REVENUE_KEY, revenue)):
+            for ticket_id, delta in deltas.items():
+                client.incrby(key.format(ticket_id), delta)
+        client.sadd(DIRTY_KEY, *ticket_ids)
+        raise
+    return len(tickets)
+
+
+def flush(batch_size=500):
+    """Write availability of changed tickets back to the database, return how many were written"""
+    client = get_client()
+    flushed = 0
+    ticket_ids = []
+    for ticket_id in client.sscan_iter(DIRTY_KEY, count=batch_size):
+        ticket_ids.append(int(ticket_id))
+        if len(ticket_ids) == batch_size:
+            flushed += _flush_batch(client, ticket_ids)
+            ticket_ids = []
+    if ticket_ids:
+        flushed += _flush_batch(client, ticket_ids)
+    return flushed
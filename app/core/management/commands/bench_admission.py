@@ -0,0 +1,98 @@
+"""
+Django command to load test bookings with and without the admission queue
+"""
+
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from booking.views import BookingCreateView
+from core import admission
+from core.models import User, EventOrganizer, Customer, Event, Ticket
+
+
+class Command(BaseCommand):
+    """Let N clients book one ticket at once, straight in or through the queue
+
+    Only the booking request is timed, time spent waiting in the queue is
+    what keeps it fast.
+    """
+
+    help = 'Compare booking latency percentiles with and without the admission queue as clients grow'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', default='8,32,64', help='Comma separated numbers of concurrent clients')
+        parser.add_argument('--rate', type=int, default=5, help='Admissions per second')
+        parser.add_argument('--backend', choices=['memory', 'redis'], default='memory')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+        organizer_user = User.objects.create_user(f'{prefix}-org@example.com', role='organizer')
+        try:
+            organizer = EventOrganizer.objects.create(user=organizer_user)
+            with override_settings(ADMISSION_QUEUE_BACKEND=options['backend']):
+                self.stdout.write('clients  mode    p50(ms)  p99(ms)  max(ms)')
+                for clients in [int(count) for count in options['clients'].split(',')]:
+                    users = []
+                    for i in range(clients):
+                        user = User.objects.create_user(f'{prefix}-{clients}-{i}@example.com', role='customer')
+                        Customer.objects.create(user=user)
+                        users.append(user)
+                    for rate in (None, options['rate']):
+                        event = Event.objects.create(organizer=organizer, admission_rate=rate)
+                        ticket = Ticket.objects.create(event=event, availability=clients)
+                        latencies = self.run(event, ticket, users)
+                        self.report(clients, 'queue' if rate else 'direct', latencies)
+        finally:
+            User.objects.filter(email__startswith=prefix).delete()
+
+    def run(self, event, ticket, users):
+        view = BookingCreateView.as_view()
+        factory = APIRequestFactory()
+        start = threading.Barrier(len(users))
+        latencies = []
+        lock = threading.Lock()
+
+        def client(user):
+            try:
+                headers = {}
+                start.wait()
+                if event.admission_rate:
+                    queue = admission.get_queue()
+                    status = queue.join(event.pk, user.pk, event.admission_rate)
+                    while not status['admitted']:
+                        time.sleep(status['position'] / event.admission_rate / 2)
+                        status = queue.status(event.pk, status['token'], event.admission_rate)
+                    headers['HTTP_X_ADMISSION_TOKEN'] = status['token']
+
+                request = factory.post('/', {'quantity': 1}, format='json', **headers)
+                force_authenticate(request, user=user)
+                began = time.perf_counter()
+                response = view(request, event_id=event.pk, ticket_id=ticket.pk)
+                elapsed = time.perf_counter() - began
+                if response.status_code != 201:
+                    self.stderr.write(f'booking failed: {response.status_code} {response.data}')
+                with lock:
+                    latencies.append(elapsed)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=client, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies
+
+    def report(self, clients, mode, latencies):
+        latencies = sorted(latency * 1000 for latency in latencies)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f'{clients:>7}  {mode:<6}  {statistics.median(latencies):>7.1f}  {p99:>7.1f}  {latencies[-1]:>7.1f}'
+        )
@@ -0,0 +1,78 @@
+"""
+Django command to benchmark concurrent bookings against a single ticket
+"""
+
+import threading
+import time
+import uuid
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+from core.models import User, EventOrganizer, Customer, Event, Ticket, Booking
+
+
+class Command(BaseCommand):
+    """Hammer one ticket from many threads and check nothing is oversold"""
+
+    help = 'Benchmark concurrent bookings on one ticket and verify there is no overselling'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--availability', type=int, default=2000)
+        parser.add_argument('--quantity', type=int, default=1)
+        parser.add_argument('--hold', action='store_true', help='Hold the tickets instead of booking them')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        threads = options['threads']
+        availability = options['availability']
+        quantity = options['quantity']
+        booking_status = Booking.HELD if options['hold'] else Booking.CONFIRMED
+
+        suffix = uuid.uuid4().hex[:8]
+        organizer_user = User.objects.create_user(f'bench-org-{suffix}@example.com', role='organizer')
+        customer_user = User.objects.create_user(f'bench-customer-{suffix}@example.com', role='customer')
+        try:
+            organizer = EventOrganizer.objects.create(user=organizer_user)
+            customer = Customer.objects.create(user=customer_user)
+            event = Event.objects.create(organizer=organizer, title='Contention benchmark')
+            ticket = Ticket.objects.create(event=event, availability=availability)
+
+            rejected = [0] * threads
+
+            def book(index):
+                try:
+                    while True:
+                        try:
+                            Booking.objects.create(
+                                customer=customer, event=event, ticket=ticket, quantity=quantity, status=booking_status
+                            )
+                        except ValidationError:
+                            rejected[index] += 1
+                            return
+                finally:
+                    connection.close()
+
+            workers = [threading.Thread(target=book, args=(i,)) for i in range(threads)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+
+            booked = Booking.objects.filter(ticket=ticket).aggregate(total=Sum('quantity'))['total'] or 0
+            remaining = Ticket.objects.get(pk=ticket.pk).availability
+            bookings = Booking.objects.filter(ticket=ticket).count()
+
+            self.stdout.write(f'threads={threads} bookings={bookings} elapsed={elapsed:.3f}s')
+            self.stdout.write(f'bookings/sec={bookings / elapsed:.1f}')
+            self.stdout.write(f'booked={booked} remaining={remaining} rejected={sum(rejected)}')
+            if booked + remaining != availability or booked > availability:
+                raise CommandError(f'Oversold: booked {booked} + remaining {remaining} != {availability}')
+            self.stdout.write(self.style.SUCCESS('No overselling'))
+        finally:
+            organizer_user.delete()
+            customer_user.delete()
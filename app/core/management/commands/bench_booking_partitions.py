@@ -0,0 +1,133 @@
+"""
+Django command to benchmark per-event booking queries on one table against hash partitions
+"""
+
+import random
+import re
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from core.db import partitioning
+from core.models import User, EventOrganizer, Customer, Booking
+
+
+class Command(BaseCommand):
+    """Seed bookings, time the queries on them, repartition the table and time them again
+
+    Everything runs in one transaction that is rolled back, the database is
+    left as it was. The booking table is locked meanwhile.
+    """
+
+    help = 'Compare per-event booking queries on one table and on hash partitions by event'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=2000)
+        parser.add_argument('--bookings-per-event', type=int, default=500)
+        parser.add_argument('--customers', type=int, default=10000)
+        parser.add_argument('--partitions', type=int, default=16)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        with transaction.atomic():
+            started = time.perf_counter()
+            events = self.seed(options['events'], options['bookings_per_event'], options['customers'])
+            self.stdout.write(
+                f'seeded {options["events"] * options["bookings_per_event"]} bookings '
+                f'in {time.perf_counter() - started:.0f}s'
+            )
+            self.stdout.write('layout          query              p50(ms)  p95(ms)  tables read')
+            current = partitioning.booking_partitions(connection)
+            self.run(current, events, options['repeat'])
+
+            other = 0 if current else options['partitions']
+            started = time.perf_counter()
+            partitioning.partition_bookings(connection, other)
+            self.stdout.write(f'rebuilt with {other} partitions in {time.perf_counter() - started:.0f}s')
+            self.run(other, events, options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, events, bookings_per_event, customers):
+        tag = uuid.uuid4().hex[:8]
+        organizer = EventOrganizer.objects.create(
+            user=User.objects.create_user(f'bench-org-{tag}@example.com', role='organizer')
+        )
+        users = User.objects.bulk_create(
+            User(email=f'bench-{tag}-{i}@example.com', password='!', role='customer') for i in range(customers)
+        )
+        Customer.objects.bulk_create(Customer(user=user) for user in users)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO core_event (organizer_id, date, venue, title, description) '
+                "SELECT %s, now() + i * interval '1 hour', '', '', '' FROM generate_series(1, %s) AS i",
+                [organizer.pk, events],
+            )
+            cursor.execute(
+                "INSERT INTO core_ticket (event_id, ticket_type, price, availability, sold) "
+                "SELECT id, 'Regular', 10, %s, 0 FROM core_event WHERE organizer_id = %s",
+                [bookings_per_event, organizer.pk],
+            )
+            # Or the foreign key checks of the bookings are planned as scans
+            cursor.execute('ANALYZE core_event, core_ticket, core_customer')
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            cursor.execute(
+                """
+                INSERT INTO core_booking (customer_id, event_id, ticket_id, quantity, status)
+                SELECT customers.ids[1 + (ticket.id * %(per_event)s + i) %% array_length(customers.ids, 1)],
+                       ticket.event_id, ticket.id, 1, 'confirmed'
+                FROM core_ticket AS ticket
+                JOIN core_event AS event ON event.id = ticket.event_id AND event.organizer_id = %(organizer)s,
+                     generate_series(1, %(per_event)s) AS i,
+                     (SELECT array_agg(customer.id) AS ids FROM core_customer AS customer
+                      JOIN core_user AS u ON u.id = customer.user_id WHERE u.email LIKE %(emails)s) AS customers
+                """,
+                {'per_event': bookings_per_event, 'organizer': organizer.pk, 'emails': f'bench-{tag}-%'},
+            )
+            cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+            cursor.execute('ANALYZE core_booking')
+        return list(organizer.event_set.values_list('id', flat=True))
+
+    def run(self, partitions, events, repeat):
+        layout = f'{partitions} partitions' if partitions else 'one table'
+        samples = [
+            Booking.objects.filter(event_id=random.choice(events)).values_list('id', 'event_id', 'customer_id')[0]
+            for _ in range(repeat)
+        ]
+        queries = [
+            ('event bookings', lambda pk, event, customer: Booking.objects.filter(event_id=event).order_by('id')),
+            ('event count', lambda pk, event, customer: Booking.objects.filter(event_id=event)),
+            ('one booking', lambda pk, event, customer: Booking.objects.filter(pk=pk, event_id=event)),
+            ('customer bookings', lambda pk, event, customer: Booking.objects.filter(customer_id=customer)),
+        ]
+        for label, query in queries:
+            timings = []
+            for sample in samples:
+                queryset = query(*sample)
+                start = time.perf_counter()
+                if label == 'event count':
+                    queryset.count()
+                else:
+                    list(queryset)
+                timings.append((time.perf_counter() - start) * 1000)
+            self.report(layout, label, timings, query(*samples[0]).explain())
+
+        # What deleting an event does to its bookings, each undone
+        timings = []
+        for _, event, _ in samples:
+            sid = transaction.savepoint()
+            start = time.perf_counter()
+            Booking.objects.filter(event_id=event).delete()
+            timings.append((time.perf_counter() - start) * 1000)
+            transaction.savepoint_rollback(sid)
+        self.report(layout, 'delete event', timings, Booking.objects.filter(event_id=samples[0][1]).explain())
+
+    def report(self, layout, label, timings, plan):
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        tables = len(set(re.findall(rf' on ({partitioning.TABLE}(?:_p\d+)?)(?!\w)', plan)))
+        self.stdout.write(
+            f'{layout:<14}  {label:<17}  {statistics.median(timings):>7.2f}  {p95:>7.2f}  {tables:>11}'
+        )
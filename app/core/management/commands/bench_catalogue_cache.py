@@ -0,0 +1,82 @@
+"""
+Django command to benchmark the versioned cache on public event reads
+"""
+
+import random
+import time
+import uuid
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from prometheus_client import REGISTRY
+from core.models import User, EventOrganizer, Event, Ticket
+from events.views import EventListView, MyEventRetrieveView, TicketListView
+
+
+def cached(result):
+    """Response cache lookups of this process with the result"""
+    return int(REGISTRY.get_sample_value('response_cache_total', {'result': result}) or 0)
+
+
+class Command(BaseCommand):
+    """Replay a read-heavy mix against the catalogue views and report hit rate"""
+
+    help = 'Benchmark hit rate and latency of the public event read cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--write-every', type=int, default=100, help='Save a ticket every N requests')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        suffix = uuid.uuid4().hex[:8]
+        organizer_user = User.objects.create_user(f'bench-org-{suffix}@example.com', role='organizer')
+        try:
+            organizer = EventOrganizer.objects.create(user=organizer_user)
+            events = Event.objects.bulk_create(
+                Event(organizer=organizer, title=f'Cache benchmark {i}') for i in range(options['events'])
+            )
+            tickets = Ticket.objects.bulk_create(Ticket(event=event) for event in events)
+            self.run(events, tickets, options['requests'], options['write_every'])
+        finally:
+            organizer_user.delete()
+
+    def run(self, events, tickets, requests, write_every):
+        factory = RequestFactory()
+        views = [
+            (EventListView.as_view(), lambda event: {}),
+            (MyEventRetrieveView.as_view(), lambda event: {'pk': event.pk}),
+            (TicketListView.as_view(), lambda event: {'event_id': event.pk}),
+        ]
+        cache.clear()
+        # Counted since the process started, only what this run adds is reported
+        start_hits, start_misses = cached('hit'), cached('miss')
+
+        hit_time = miss_time = 0.0
+        rng = random.Random(0)
+        for i in range(requests):
+            if write_every and i and i % write_every == 0:
+                rng.choice(tickets).save()
+
+            # Popular events get most of the traffic, like a real on-sale
+            event = events[min(int(rng.expovariate(0.05)), len(events) - 1)]
+            view, view_kwargs = rng.choice(views)
+            request = factory.get('/', HTTP_HOST='localhost')
+            misses = cached('miss')
+            start = time.perf_counter()
+            view(request, **view_kwargs(event)).render()
+            elapsed = time.perf_counter() - start
+            if cached('miss') > misses:
+                miss_time += elapsed
+            else:
+                hit_time += elapsed
+
+        hits, misses = cached('hit') - start_hits, cached('miss') - start_misses
+        self.stdout.write(f'requests={requests} hits={hits} misses={misses}')
+        self.stdout.write(f'hit rate={hits / requests:.1%}')
+        if hits:
+            self.stdout.write(f'avg hit={hit_time / hits * 1000:.3f}ms')
+        if misses:
+            self.stdout.write(f'avg miss={miss_time / misses * 1000:.3f}ms')
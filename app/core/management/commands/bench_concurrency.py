@@ -0,0 +1,75 @@
+"""
+Django command to benchmark sync and async views with many concurrent connections
+"""
+
+import asyncio
+import time
+
+from core.management.commands import bench_server
+
+
+class Command(bench_server.Command):
+    """bench_server with every client a keep-alive connection on one event loop
+
+    A thread per client doesn't scale to a thousand connections, an asyncio
+    client does. Compares sync views under WSGI (gthread) and ASGI (uvicorn)
+    with the async views (uvicorn-async).
+    """
+
+    help = 'Compare requests/sec of sync and async views at 1000 concurrent connections'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.set_defaults(models='gthread,uvicorn,uvicorn-async', clients=1000, seconds=10)
+
+    def load(self, port, endpoint, tokens, seconds):
+        return asyncio.run(self.load_async(port, endpoint, tokens, seconds))
+
+    async def load_async(self, port, endpoint, tokens, seconds):
+        method, path, body = endpoint
+        body = body or b''
+        deadline = time.monotonic() + seconds
+        latencies = []
+        errors = 0
+
+        async def client(token):
+            nonlocal errors
+            request = (
+                f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAuthorization: Token {token}\r\n'
+                f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'
+            ).encode() + body
+            reader = writer = None
+            while time.monotonic() < deadline:
+                began = time.perf_counter()
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                    writer.write(request)
+                    status, keep_alive = await asyncio.wait_for(self.read_response(reader), 30)
+                    ok = status < 400
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                    ok = keep_alive = False
+                if not keep_alive and writer is not None:
+                    writer.close()
+                    writer = None
+                if ok:
+                    latencies.append(time.perf_counter() - began)
+                else:
+                    errors += 1
+            if writer is not None:
+                writer.close()
+
+        await asyncio.gather(*(client(token) for token in tokens))
+        return latencies, errors
+
+    async def read_response(self, reader):
+        """Read one response, return its status and whether the connection stays open"""
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin1').split('\r\n')
+        status = int(lines[0].split()[1])
+        headers = dict(line.lower().split(': ', 1) for line in lines[1:] if line)
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+            return status, headers.get('connection') != 'close'
+        await reader.read()
+        return status, False
@@ -0,0 +1,106 @@
+"""
+Django command to benchmark connecting per request against persistent and pooled connections
+"""
+
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory, override_settings
+from core.db import base
+from core.models import User, EventOrganizer, Event, Ticket
+from events.views import TicketListView
+
+# Database settings of each connection mode, the pool size is set from --pool-size
+MODES = {
+    'per-request': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'POOL': None},
+    'persistent': {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True, 'POOL': None},
+    'pool': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True, 'POOL': {'TIMEOUT': 10}},
+}
+
+
+class Command(BaseCommand):
+    """Serve the ticket list from threads, each request opening and closing connections like Django's handler
+
+    The response cache is off so every request runs its query.
+    """
+
+    help = 'Compare requests/sec and connections opened with a connection per request, persistent and pooled'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--pool-size', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=500, help='Requests per thread')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        user = User.objects.create_user(f'bench-organizer-{uuid.uuid4().hex[:8]}@example.com', role='organizer')
+        database = connections.databases['default']
+        original = {key: database.get(key) for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS', 'POOL')}
+        try:
+            event = Event.objects.create(organizer=EventOrganizer.objects.create(user=user))
+            Ticket.objects.create(event=event, availability=10)
+            connections.close_all()
+            self.stdout.write('mode          req/s    p50(ms)  p99(ms)  connections opened')
+            dummy_cache = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+            with override_settings(CACHES=dummy_cache, ALLOWED_HOSTS=['testserver']):
+                for mode, mode_settings in MODES.items():
+                    if mode_settings['POOL']:
+                        pool_settings = {**mode_settings['POOL'], 'SIZE': options['pool_size']}
+                        mode_settings = {**mode_settings, 'POOL': pool_settings}
+                    # Connections of every thread read this same dict
+                    database.update(mode_settings)
+                    self.run(mode, event.pk, options['threads'], options['requests'])
+                    base.close_pool('default', database['NAME'])
+        finally:
+            database.update(original)
+            user.delete()
+
+    def run(self, mode, event_id, threads, requests):
+        view = TicketListView.as_view()
+        factory = RequestFactory()
+        latencies = []
+        # Pooled connections are "created" again each time they are taken
+        opened = set()
+        lock = threading.Lock()
+
+        def count(connection, **kwargs):
+            with lock:
+                opened.add(connection.connection)
+
+        def serve():
+            mine = []
+            for _ in range(requests):
+                request = factory.get(f'/api/event/{event_id}/tickets/')
+                began = time.perf_counter()
+                # What the request_started and request_finished signals do
+                close_old_connections()
+                view(request, event_id=event_id).render()
+                close_old_connections()
+                mine.append(time.perf_counter() - began)
+            connections.close_all()
+            with lock:
+                latencies.extend(mine)
+
+        connection_created.connect(count)
+        try:
+            workers = [threading.Thread(target=serve) for _ in range(threads)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            connection_created.disconnect(count)
+
+        latencies = sorted(latency * 1000 for latency in latencies)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f'{mode:<12}  {len(latencies) / elapsed:>6.0f}  {statistics.median(latencies):>7.2f}  '
+            f'{p99:>7.2f}  {len(opened):>18}'
+        )
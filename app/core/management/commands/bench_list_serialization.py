@@ -0,0 +1,95 @@
+"""
+Django command to benchmark building and rendering list responses with and without serializers
+"""
+
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from booking.serializers import BookingListSerializer
+from core.fast_lists import get_representation
+from core.models import User, EventOrganizer, Customer, Event, Ticket, Booking
+from core.renderers import ORJSONRenderer
+from events.serializers import EventSerializer, TicketSerializer
+
+
+class Command(BaseCommand):
+    """Time the serializer path and the .values() path on the same rows, per 1k rows
+
+    Rows are read once for each path, only building the data and rendering it
+    is timed. Everything is rolled back.
+    """
+
+    help = 'Compare serializer and .values() list building, JSONRenderer and orjson, in ms per 1k rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--tickets-per-event', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        with transaction.atomic():
+            self.seed(options['rows'], options['tickets_per_event'])
+            self.stdout.write('list      path        build(ms)  render(ms)  total(ms)  bytes equal')
+            for label, serializer_class, queryset in self.lists():
+                self.run(label, serializer_class, queryset, options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, rows, tickets_per_event):
+        tag = uuid.uuid4().hex[:8]
+        organizer = EventOrganizer.objects.create(
+            user=User.objects.create_user(f'bench-org-{tag}@example.com', role='organizer')
+        )
+        self.customer = Customer.objects.create(
+            user=User.objects.create_user(f'bench-{tag}@example.com', role='customer')
+        )
+        self.events = Event.objects.bulk_create(
+            Event(organizer=organizer, title=f'Benchmark event {i}', venue='Hall', description='A night out')
+            for i in range(rows)
+        )
+        tickets = Ticket.objects.bulk_create(
+            Ticket(event=event, ticket_type=f'Type {i}', price=10 + i, availability=1000)
+            for event in self.events for i in range(tickets_per_event)
+        )
+        Booking.objects.bulk_create(
+            Booking(customer=self.customer, event_id=ticket.event_id, ticket=ticket, quantity=1)
+            for ticket in tickets[:rows]
+        )
+
+    def lists(self):
+        event_ids = [event.pk for event in self.events]
+        return [
+            ('events', EventSerializer, Event.objects.filter(pk__in=event_ids).order_by('id')),
+            ('tickets', TicketSerializer, Ticket.objects.filter(event_id__in=event_ids).order_by('id')),
+            ('bookings', BookingListSerializer, Booking.objects.filter(customer=self.customer).order_by('id')),
+        ]
+
+    def run(self, label, serializer_class, queryset, repeat):
+        instances = list(queryset.prefetch_related('tickets') if serializer_class is EventSerializer else queryset)
+        representation = get_representation(serializer_class)
+        values = list(queryset.values(*representation.sources))
+        paths = [
+            ('serializer', lambda: serializer_class(instances, many=True).data, JSONRenderer()),
+            # Includes the nested query for the tickets of events
+            ('values', lambda: representation.represent(values), ORJSONRenderer()),
+        ]
+        content = {}
+        for path, build, renderer in paths:
+            build_times, render_times = [], []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                data = build()
+                built = time.perf_counter()
+                content[path] = renderer.render(data)
+                render_times.append((time.perf_counter() - built) * 1000 * 1000 / len(values))
+                build_times.append((built - start) * 1000 * 1000 / len(values))
+            build_ms, render_ms = statistics.median(build_times), statistics.median(render_times)
+            equal = 'yes' if content[path] == content['serializer'] else 'NO'
+            self.stdout.write(
+                f'{label:<8}  {path:<10}  {build_ms:>9.2f}  {render_ms:>10.2f}  {build_ms + render_ms:>9.2f}  '
+                f'{equal:>11}'
+            )
@@ -0,0 +1,69 @@
+"""
+Django command to benchmark the per request cost of collecting metrics
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve
+from core import metrics
+
+
+class Command(BaseCommand):
+    """Time MetricsMiddleware and a reservation's metrics around a view that does nothing
+
+    Multiprocess mode is picked when prometheus_client is imported, so
+    --multiprocess runs the benchmark again in a child process with
+    PROMETHEUS_MULTIPROC_DIR set.
+    """
+
+    help = 'Measure the metrics overhead per request, in process and in multiprocess mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100000)
+        parser.add_argument('--multiprocess', action='store_true', help='Also measure multiprocess mode')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        mode = 'multiprocess' if 'PROMETHEUS_MULTIPROC_DIR' in os.environ else 'single process'
+        self.stdout.write(f'{mode}: {self.run(options["requests"]):.2f}us/request')
+
+        if options['multiprocess']:
+            with tempfile.TemporaryDirectory() as directory:
+                subprocess.run(
+                    [sys.executable, sys.argv[0], 'bench_metrics', '--requests', str(options['requests'])],
+                    env={**os.environ, 'PROMETHEUS_MULTIPROC_DIR': directory}, check=True,
+                )
+
+    def run(self, requests):
+        request = RequestFactory().get('/api/booking/mybookings/')
+        request.resolver_match = resolve('/api/booking/mybookings/')
+        response = HttpResponse()
+
+        def view(request):
+            return response
+
+        def booking_view(request):
+            # What a booking adds on top of the request metrics
+            with metrics.TICKET_UPDATE_SECONDS.time():
+                pass
+            metrics.RESERVATIONS.labels('reserved').inc()
+            return response
+
+        middleware = metrics.MetricsMiddleware(booking_view)
+        started = time.perf_counter()
+        for _ in range(requests):
+            view(request)
+        bare = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(requests):
+            middleware(request)
+        measured = time.perf_counter() - started
+        return (measured - bare) / requests * 1e6
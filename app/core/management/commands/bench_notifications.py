@@ -0,0 +1,88 @@
+"""
+Django command to benchmark event update fan-out against the locmem email backend
+"""
+
+import time
+import uuid
+
+from django.core import mail
+from django.core.mail import send_mail
+from django.core.mail.backends import locmem
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from core.models import User, EventOrganizer, Customer, Event, Ticket, Booking
+from core.tasks import fan_out_event_update
+
+
+class SlowConnectBackend(locmem.EmailBackend):
+    """locmem backend that pays a fixed cost per connection, like an SMTP handshake"""
+
+    connect_latency = 0.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connection_open = False
+
+    def open(self):
+        if self.connection_open:
+            return False
+        time.sleep(self.connect_latency)
+        self.connection_open = True
+        return True
+
+    def close(self):
+        self.connection_open = False
+
+    def send_messages(self, messages):
+        new_connection = self.open()
+        try:
+            return super().send_messages(messages)
+        finally:
+            if new_connection:
+                self.close()
+
+
+class Command(BaseCommand):
+    """Fan out one event update to many attendees and report messages/sec"""
+
+    help = 'Benchmark event update fan-out throughput with the locmem email backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=5000)
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--connect-ms', type=float, default=2.0, help='Simulated cost of opening a connection')
+
+    @override_settings(EMAIL_BACKEND='core.management.commands.bench_notifications.SlowConnectBackend')
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        recipients = options['recipients']
+        SlowConnectBackend.connect_latency = options['connect_ms'] / 1000
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+        organizer_user = User.objects.create_user(f'{prefix}-org@example.com', role='organizer')
+        try:
+            event = Event.objects.create(organizer=EventOrganizer.objects.create(user=organizer_user))
+            ticket = Ticket.objects.create(event=event, availability=recipients)
+            users = User.objects.bulk_create(
+                User(email=f'{prefix}-{i}@example.com', password='!', role='customer') for i in range(recipients)
+            )
+            customers = Customer.objects.bulk_create(Customer(user=user) for user in users)
+            Booking.objects.bulk_create(
+                Booking(customer=customer, event=event, ticket=ticket, quantity=1) for customer in customers
+            )
+
+            mail.outbox = []
+            start = time.perf_counter()
+            for user in users:
+                send_mail(f'Update for event {event.id}', 'event updated', None, [user.email])
+            naive = time.perf_counter() - start
+            self.stdout.write(f'one send_mail per recipient: {recipients / naive:.1f} messages/sec')
+
+            mail.outbox = []
+            with override_settings(NOTIFICATION_CHUNK_SIZE=options['chunk_size']):
+                stats = fan_out_event_update(event.id)
+            self.stdout.write(
+                f'fan_out_event_update: sent={stats["sent"]} in {stats["seconds"]}s '
+                f'{stats["messages_per_second"]} messages/sec'
+            )
+        finally:
+            User.objects.filter(email__startswith=prefix).delete()
@@ -0,0 +1,116 @@
+"""
+Django command to benchmark event search and facets on a large catalogue
+"""
+
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from core.models import User, EventOrganizer
+from events.views import EventSearchView
+
+WORDS = (
+    'jazz rock pop blues folk opera ballet comedy theatre cinema festival gala concert recital choir orchestra '
+    'quartet trio band dance disco techno house swing soul funk reggae punk metal indie acoustic classical '
+    'symphony poetry lecture workshop market fair expo summit conference hackathon tasting wine beer food '
+    'street night morning sunset summer winter spring autumn garden park river harbour castle museum gallery'
+).split()
+VENUES = [f'Venue {i}' for i in range(200)]
+
+# Label, query parameters. Each word is in about 4% of events, saxophone in 0.1%
+SCENARIOS = [
+    ('rare word', {'q': 'saxophone'}),
+    ('common word', {'q': 'jazz'}),
+    ('two words', {'q': 'jazz night'}),
+    ('word + dates', {'q': 'jazz', 'date_from': '2031-01-01T00:00:00Z', 'date_to': '2031-03-01T00:00:00Z'}),
+    ('word + price', {'q': 'jazz', 'price_min': '50', 'price_max': '80'}),
+    ('venue', {'venue': 'Venue 7'}),
+    ('dates', {'date_from': '2031-01-01T00:00:00Z', 'date_to': '2031-01-08T00:00:00Z'}),
+    ('everything', {}),
+]
+
+
+class Command(BaseCommand):
+    """Seed a catalogue with SQL and time the search endpoint on a mix of queries
+
+    The response cache is off, every request runs its queries.
+    """
+
+    help = 'Benchmark latency of event search with facets on a large catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        user = User.objects.create_user(f'bench-org-{uuid.uuid4().hex[:8]}@example.com', role='organizer')
+        organizer = EventOrganizer.objects.create(user=user)
+        try:
+            started = time.perf_counter()
+            self.seed(organizer, options['events'])
+            self.stdout.write(f'seeded {options["events"]} events in {time.perf_counter() - started:.0f}s')
+            dummy_cache = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+            with override_settings(CACHES=dummy_cache):
+                self.run(options['repeat'])
+        finally:
+            # Far quicker than the ORM's cascade over a million rows
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'DELETE FROM core_ticket USING core_event '
+                    'WHERE core_ticket.event_id = core_event.id AND core_event.organizer_id = %s', [organizer.pk]
+                )
+                cursor.execute('DELETE FROM core_event WHERE organizer_id = %s', [organizer.pk])
+            user.delete()
+
+    def seed(self, organizer, events):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO core_event (organizer_id, date, venue, title, description)
+                SELECT %(organizer)s,
+                       '2030-01-01'::timestamptz + (i %% 1095) * interval '1 day' + (i %% 24) * interval '1 hour',
+                       (%(venues)s::text[])[1 + i %% array_length(%(venues)s::text[], 1)],
+                       initcap(words[1 + i %% n] || ' ' || words[1 + (i / n) %% n]),
+                       'An evening of ' || words[1 + (i / 7) %% n] || ' and ' || words[1 + (i / 13) %% n]
+                       || CASE WHEN i %% 1000 = 0 THEN ' with a saxophone solo' ELSE '' END
+                FROM generate_series(1, %(events)s) AS i,
+                     (SELECT %(words)s::text[] AS words, array_length(%(words)s::text[], 1) AS n) AS vocabulary
+                """,
+                {'organizer': organizer.pk, 'events': events, 'venues': VENUES, 'words': list(WORDS)},
+            )
+            # Otherwise the foreign key check of every ticket below is planned as a scan of core_event
+            cursor.execute('ANALYZE core_event')
+            cursor.execute(
+                """
+                INSERT INTO core_ticket (event_id, ticket_type, price, availability, sold)
+                SELECT id, ticket_type, (id * price_step) %% 300 + 5, 1000, 0
+                FROM core_event, (VALUES ('Regular', 7), ('VIP', 31)) AS types (ticket_type, price_step)
+                WHERE organizer_id = %s
+                """,
+                [organizer.pk],
+            )
+            cursor.execute('ANALYZE core_ticket')
+
+    def run(self, repeat):
+        view = EventSearchView.as_view()
+        factory = RequestFactory()
+        self.stdout.write('scenario        matches   p50(ms)  p95(ms)  queries')
+        for label, params in SCENARIOS:
+            timings = []
+            for _ in range(repeat):
+                request = factory.get('/api/event/search/', params, HTTP_HOST='localhost')
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    response = view(request).render()
+                    timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f'{label:<14}  {response.data["facets"]["total"]:>7}  {statistics.median(timings):>8.1f}  '
+                f'{p95:>7.1f}  {len(queries):>7}'
+            )
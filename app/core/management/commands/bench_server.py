@@ -0,0 +1,163 @@
+"""
+Django command to compare gunicorn worker models on startup time and throughput
+"""
+
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+from core.models import User, EventOrganizer, Customer, Event, Ticket
+
+# Worker class, application and extra environment of each worker model
+WORKER_MODELS = {
+    'sync': ('sync', 'app.wsgi', {}),
+    'gthread': ('gthread', 'app.wsgi', {}),
+    'uvicorn': ('uvicorn.workers.UvicornWorker', 'app.asgi', {}),
+    'uvicorn-async': ('uvicorn.workers.UvicornWorker', 'app.asgi', {'ASYNC_VIEWS': '1'}),
+}
+
+
+class Command(BaseCommand):
+    """Start gunicorn.conf.py with each worker model and load the catalogue and booking endpoints
+
+    Every client thread keeps its connection open between requests where the
+    worker allows it, like a load balancer would. Throttling is lifted for
+    the server under test.
+    """
+
+    help = 'Compare startup time and requests/sec of gunicorn worker models on the catalogue and booking endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', default='sync,gthread,uvicorn', help='Comma separated worker models')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--clients', type=int, default=16)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        models = options['models'].split(',')
+        unknown = set(models) - set(WORKER_MODELS)
+        if unknown:
+            raise CommandError(f'Unknown worker models: {", ".join(sorted(unknown))}')
+
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+        organizer_user = User.objects.create_user(f'{prefix}-org@example.com', role='organizer')
+        try:
+            event = Event.objects.create(organizer=EventOrganizer.objects.create(user=organizer_user))
+            ticket = Ticket.objects.create(event=event, availability=10 ** 9)
+            tokens = []
+            for i in range(options['clients']):
+                user = User.objects.create_user(f'{prefix}-{i}@example.com', role='customer')
+                Customer.objects.create(user=user)
+                tokens.append(Token.objects.create(user=user).key)
+            endpoints = {
+                'catalogue': ('GET', '/api/event/', None),
+                'booking': ('POST', f'/api/booking/{event.pk}/{ticket.pk}/book/', b'{"quantity": 1}'),
+            }
+
+            self.stdout.write('model          startup(s)  endpoint   req/s    p50(ms)  p99(ms)  errors')
+            for model in models:
+                self.run_model(model, endpoints, tokens, options)
+        finally:
+            User.objects.filter(email__startswith=prefix).delete()
+
+    def run_model(self, model, endpoints, tokens, options):
+        worker_class, module, model_env = WORKER_MODELS[model]
+        env = {
+            **os.environ,
+            **model_env,
+            'GUNICORN_WORKER_CLASS': worker_class,
+            'WEB_CONCURRENCY': str(options['workers']),
+            'GUNICORN_BIND': f'127.0.0.1:{options["port"]}',
+            'GUNICORN_ACCESS_LOG': '',
+            'THROTTLE_RATE_BOOKING': '1000000/min',
+        }
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', module],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        try:
+            self.wait_until_up(options['port'], server)
+            startup = time.perf_counter() - started
+            for name, endpoint in endpoints.items():
+                latencies, errors = self.load(options['port'], endpoint, tokens, options['seconds'])
+                self.report(model, startup, name, latencies, errors, options['seconds'])
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+
+    def wait_until_up(self, port, server, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'gunicorn exited: {server.stderr.read().decode()[-2000:]}')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+                connection.request('GET', '/metrics')
+                if connection.getresponse().status == 200:
+                    return
+            except (ConnectionError, socket.timeout, http.client.HTTPException):
+                pass
+            time.sleep(0.05)
+        raise CommandError('gunicorn did not start')
+
+    def load(self, port, endpoint, tokens, seconds):
+        method, path, body = endpoint
+        deadline = time.monotonic() + seconds
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+
+        def client(token):
+            headers = {'Authorization': f'Token {token}', 'Content-Type': 'application/json'}
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            mine = []
+            while time.monotonic() < deadline:
+                began = time.perf_counter()
+                try:
+                    connection.request(method, path, body=body, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    ok = response.status < 400
+                    if response.getheader('Connection', '').lower() == 'close':
+                        connection.close()
+                except (ConnectionError, socket.timeout, http.client.HTTPException):
+                    ok = False
+                    connection.close()
+                if ok:
+                    mine.append(time.perf_counter() - began)
+                else:
+                    with lock:
+                        errors[0] += 1
+            connection.close()
+            with lock:
+                latencies.extend(mine)
+
+        threads = [threading.Thread(target=client, args=(token,)) for token in tokens]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors[0]
+
+    def report(self, model, startup, endpoint, latencies, errors, seconds):
+        if not latencies:
+            self.stdout.write(f'{model:<13}  {startup:>10.2f}  {endpoint:<9}  no successful requests, errors={errors}')
+            return
+        latencies = sorted(latency * 1000 for latency in latencies)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f'{model:<13}  {startup:>10.2f}  {endpoint:<9}  {len(latencies) / seconds:>6.0f}  '
+            f'{statistics.median(latencies):>7.1f}  {p99:>7.1f}  {errors:>6}'
+        )
@@ -0,0 +1,53 @@
+"""
+Django command to benchmark queries per request with and without the token cache
+"""
+
+import time
+import uuid
+
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.core.management.base import BaseCommand
+from rest_framework import authentication
+from rest_framework.authtoken.models import Token
+from booking.views import BookingListView
+from core.authentication import CachedTokenAuthentication, local_tokens
+from core.models import User, Customer
+
+
+class Command(BaseCommand):
+    """Call an authenticated view with plain and cached token authentication"""
+
+    help = 'Compare queries and latency per request of TokenAuthentication and CachedTokenAuthentication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        requests = options['requests']
+        user = User.objects.create_user(f'bench-customer-{uuid.uuid4().hex[:8]}@example.com', role='customer')
+        try:
+            Customer.objects.create(user=user)
+            token = Token.objects.create(user=user)
+            local_tokens.clear()
+            for auth_class in (authentication.TokenAuthentication, CachedTokenAuthentication):
+                self.run(auth_class, token.key, requests)
+        finally:
+            user.delete()
+
+    def run(self, auth_class, key, requests):
+        # BookingListView reads request.user.customer, which the cache preloads
+        view = BookingListView.as_view(authentication_classes=[auth_class])
+        factory = RequestFactory()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(requests):
+                request = factory.get('/', HTTP_AUTHORIZATION='Token ' + key)
+                view(request).render()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{auth_class.__name__}: queries/request={len(queries) / requests:.2f} '
+            f'avg={elapsed / requests * 1000:.3f}ms'
+        )
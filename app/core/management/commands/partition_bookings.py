@@ -0,0 +1,40 @@
+"""
+Django command to partition the booking table by event, or merge it back
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.db import partitioning
+
+
+class Command(BaseCommand):
+    """Rebuild core_booking with the given number of hash partitions on event_id
+
+    Bookings can't be read or written while their rows are copied, run it in
+    a maintenance window. Set BOOKING_PARTITIONS to the same number so new
+    databases are migrated the same way.
+    """
+
+    help = 'Hash partition the booking table on event_id, 0 to go back to one table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('partitions', type=int)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        partitions = options['partitions']
+        if partitions < 0:
+            raise CommandError('partitions must be 0 or more')
+        if partitioning.booking_partitions(connection) == partitions:
+            self.stdout.write(f'{partitioning.TABLE} already has {partitions} partitions')
+            return
+
+        started = time.perf_counter()
+        try:
+            partitioning.partition_bookings(connection, partitions)
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(
+            f'{partitioning.TABLE} rebuilt with {partitions} partitions in {time.perf_counter() - started:.1f}s'
+        ))
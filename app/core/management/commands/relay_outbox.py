@@ -0,0 +1,42 @@
+"""
+Django command to relay outbox messages to Celery
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core import outbox
+
+
+class Command(BaseCommand):
+    """Drain unsent outbox messages to the broker in batches"""
+
+    help = 'Relay outbox messages to Celery, once or continuously with --loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep relaying until stopped')
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        batch_size = options['batch_size']
+        while True:
+            try:
+                sent = outbox.relay(batch_size)
+            except Exception as exc:
+                if not options['loop']:
+                    raise
+                # Broker or database down, messages stay in the outbox
+                self.stderr.write(f'Relay failed: {exc}')
+                close_old_connections()
+                time.sleep(options['interval'])
+                continue
+
+            if sent:
+                self.stdout.write(f'Relayed {sent} messages')
+            if not options['loop']:
+                return
+            if sent < batch_size:
+                time.sleep(options['interval'])
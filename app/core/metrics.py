@@ -0,0 +1,109 @@
+"""
+Prometheus metrics, served at /metrics (see core.views.metrics)
+
+Request counts and latency per view come from MetricsMiddleware, ticket
+reservations and the time their conditional UPDATE waits on the ticket row
+from TicketManager, and Celery task timings from the task signals below.
+The response cache, query budgets, throttles and idempotency keys count
+their outcomes here too.
+
+Under gunicorn every worker is its own process. Set PROMETHEUS_MULTIPROC_DIR
+to an empty directory shared by the workers before they start, each then
+writes its samples there and /metrics adds them up. The gunicorn config has
+to call mark_process_dead when a worker exits.
+"""
+import asyncio
+import time
+
+from celery import signals
+from prometheus_client import Counter, Histogram, multiprocess
+
+# Shorter than the defaults, row updates and lock waits are mostly under 100ms
+DB_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+
+REQUESTS = Counter('http_requests_total', 'Requests by view, method and status', ['view', 'method', 'status'])
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Request latency by view', ['view', 'method'])
+
+RESERVATIONS = Counter(
+    'ticket_reservations_total', 'Ticket reservations, rejected when not enough were left', ['result']
+)
+TICKET_UPDATE_SECONDS = Histogram(
+    'ticket_update_seconds', 'Conditional availability UPDATE time, mostly spent waiting on the ticket row lock',
+    buckets=DB_BUCKETS,
+)
+
+OUTBOX_LAG_SECONDS = Histogram('outbox_relay_lag_seconds', 'From outbox row written to task sent to the broker')
+TASK_QUEUE_SECONDS = Histogram('celery_task_queue_seconds', 'From task sent to the broker to started', ['task'])
+TASK_SECONDS = Histogram('celery_task_duration_seconds', 'Task run time', ['task'])
+TASKS = Counter('celery_tasks_total', 'Finished tasks by state', ['task', 'state'])
+
+RESPONSE_CACHE = Counter('response_cache_total', 'Versioned response cache lookups by result', ['result'])
+QUERY_BUDGET_EXCEEDED = Counter('query_budget_exceeded_total', 'Requests over their view\'s query budget', ['view'])
+THROTTLE_CHECKS = Counter('throttle_checks_total', 'Throttled requests by scope and result', ['scope', 'result'])
+IDEMPOTENT_REPLAYS = Counter('idempotent_replays_total', 'Responses replayed for a repeated Idempotency-Key')
+REDIS_FALLBACKS = Counter(
+    'redis_fallbacks_total', 'Redis errors answered without Redis, by what fell back', ['component']
+)
+
+
+class MetricsMiddleware:
+    """Count and time every request by the name of the URL it resolved to"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Tells Django this instance is a coroutine function
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        return self.record(request, response, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        return self.record(request, response, time.perf_counter() - started)
+
+    def record(self, request, response, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+        REQUEST_SECONDS.labels(view, request.method).observe(elapsed)
+        return response
+
+
+_task_started = {}
+
+
+@signals.before_task_publish.connect
+def task_published(headers=None, **kwargs):
+    # Travels with the message, the worker reads it back as task.request.published_at
+    if headers is not None:
+        headers['published_at'] = time.time()
+
+
+@signals.task_prerun.connect
+def task_started(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at:
+        TASK_QUEUE_SECONDS.labels(task.name).observe(max(0, time.time() - published_at))
+
+
+@signals.task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_SECONDS.labels(task.name).observe(time.perf_counter() - started)
+    TASKS.labels(task.name, state or 'UNKNOWN').inc()
+
+
+def mark_process_dead(pid):
+    """Drop the live samples of an exited worker, call from gunicorn's child_exit"""
+    multiprocess.mark_process_dead(pid)
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_alter_eventorganizer_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticket',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tickets', to='core.event'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_auto_20261018_1925'),
+    ]
+
+    # New indexes are built before the plain foreign key indexes they replace are dropped
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['customer', 'id'], name='booking_customer_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['event', 'id'], name='booking_event_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['date', 'id'], name='event_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['organizer', 'date', 'id'], name='event_organizer_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['event', 'id'], name='ticket_event_id_idx'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='customer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.customer'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='event',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.event'),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='organizer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.eventorganizer'),
+        ),
+        migrations.AlterField(
+            model_name='ticket',
+            name='event',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='tickets', to='core.event'),
+        ),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.CheckConstraint(check=models.Q(('quantity__gt', 0)), name='booking_quantity_gt_0'),
+        ),
+        migrations.AddConstraint(
+            model_name='ticket',
+            constraint=models.CheckConstraint(check=models.Q(('availability__gte', 0)), name='ticket_availability_gte_0'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_indexes_and_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='sold',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        # Count the bookings made before the field existed
+        migrations.RunSQL(
+            """
+            UPDATE core_ticket SET sold = totals.sold
+            FROM (SELECT ticket_id, SUM(quantity) AS sold FROM core_booking GROUP BY ticket_id) AS totals
+            WHERE core_ticket.id = totals.ticket_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_event_admission_rate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='max_price',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='min_price',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # Weighted title, venue, description. The config has to match
+        # events.search.SEARCH_CONFIG
+        migrations.RunSQL(
+            """
+            CREATE FUNCTION core_event_search_vector() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector :=
+                    setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+                    setweight(to_tsvector('english', coalesce(NEW.venue, '')), 'B') ||
+                    setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C');
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER core_event_search_vector
+            BEFORE INSERT OR UPDATE OF title, venue, description, search_vector ON core_event
+            FOR EACH ROW EXECUTE FUNCTION core_event_search_vector();
+
+            UPDATE core_event SET search_vector = NULL;
+            """,
+            """
+            DROP TRIGGER core_event_search_vector ON core_event;
+            DROP FUNCTION core_event_search_vector();
+            """,
+        ),
+        # Inserts and deletes once per statement, so a bulk insert updates each
+        # event once. Bookings don't change the price and don't fire the update trigger
+        migrations.RunSQL(
+            """
+            CREATE FUNCTION core_event_prices() RETURNS trigger AS $$
+            BEGIN
+                UPDATE core_event SET
+                    min_price = (SELECT MIN(price) FROM core_ticket WHERE event_id = core_event.id),
+                    max_price = (SELECT MAX(price) FROM core_ticket WHERE event_id = core_event.id)
+                WHERE id IN (SELECT event_id FROM changed_tickets);
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER core_ticket_insert_event_prices
+            AFTER INSERT ON core_ticket REFERENCING NEW TABLE AS changed_tickets
+            FOR EACH STATEMENT EXECUTE FUNCTION core_event_prices();
+
+            CREATE FUNCTION core_event_prices_of_ticket() RETURNS trigger AS $$
+            BEGIN
+                UPDATE core_event SET
+                    min_price = (SELECT MIN(price) FROM core_ticket WHERE event_id = NEW.event_id),
+                    max_price = (SELECT MAX(price) FROM core_ticket WHERE event_id = NEW.event_id)
+                WHERE id = NEW.event_id;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER core_ticket_update_event_prices
+            AFTER UPDATE OF price ON core_ticket
+            FOR EACH ROW WHEN (OLD.price IS DISTINCT FROM NEW.price) EXECUTE FUNCTION core_event_prices_of_ticket();
+
+            CREATE TRIGGER core_ticket_delete_event_prices
+            AFTER DELETE ON core_ticket REFERENCING OLD TABLE AS changed_tickets
+            FOR EACH STATEMENT EXECUTE FUNCTION core_event_prices();
+
+            UPDATE core_event SET min_price = prices.min_price, max_price = prices.max_price
+            FROM (
+                SELECT event_id, MIN(price) AS min_price, MAX(price) AS max_price FROM core_ticket GROUP BY event_id
+            ) AS prices
+            WHERE core_event.id = prices.event_id;
+            """,
+            """
+            DROP TRIGGER core_ticket_insert_event_prices ON core_ticket;
+            DROP TRIGGER core_ticket_update_event_prices ON core_ticket;
+            DROP TRIGGER core_ticket_delete_event_prices ON core_ticket;
+            DROP FUNCTION core_event_prices();
+            DROP FUNCTION core_event_prices_of_ticket();
+            """,
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='event_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['venue', 'date', 'id'], name='event_venue_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.db import migrations
+
+from core.db import partitioning
+
+
+def partition_bookings(apps, schema_editor):
+    # Opt in, with BOOKING_PARTITIONS
+    if settings.BOOKING_PARTITIONS:
+        partitioning.partition_bookings(schema_editor.connection, settings.BOOKING_PARTITIONS)
+
+
+def unpartition_bookings(apps, schema_editor):
+    partitioning.partition_bookings(schema_editor.connection, 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_event_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_bookings, unpartition_bookings),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-18 22:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        # The price paid for older bookings is unknown, take the current one
+        migrations.RunSQL(
+            """
+            UPDATE core_booking SET unit_price = core_ticket.price
+            FROM core_ticket
+            WHERE core_ticket.id = core_booking.ticket_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 22:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_booking_unit_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE core_ticket SET revenue = totals.revenue
+            FROM (
+                SELECT ticket_id, SUM(quantity * unit_price) AS revenue
+                FROM core_booking WHERE status = 'confirmed'
+                GROUP BY ticket_id
+            ) AS totals
+            WHERE core_ticket.id = totals.ticket_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
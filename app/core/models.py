@@ -1,7 +1,13 @@
 """
 Database Models
 """
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -10,6 +16,7 @@ from django.contrib.auth.models import (
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.conf import settings
+from core import caching, inventory, metrics, outbox
 from core.tasks import *
 
 
@@ -86,85 +93,455 @@ class Customer(models.Model):
 
 class Event(models.Model):
     """Model for Event"""
-    organizer = models.ForeignKey(EventOrganizer, on_delete=models.CASCADE)
+    # Indexed below together with date, which also serves filters on organizer alone
+    organizer = models.ForeignKey(EventOrganizer, on_delete=models.CASCADE, db_index=False)
     date = models.DateTimeField(default=timezone.now)
     venue = models.CharField(max_length=255, default='Venue pura')
     description = models.TextField(default="Its a surprise event")
     title = models.CharField(max_length=255, default="Surprise Event")
+    # Customers admitted to book per second, through core.admission. None for no queue
+    admission_rate = models.PositiveIntegerField(null=True, blank=True)
+    # Title, venue and description for full-text search (events/search.py),
+    # kept up to date by a database trigger so bulk writes are covered too
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Lowest and highest price of the event's tickets, kept by triggers on the
+    # ticket table for the search price filter and facet
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, editable=False)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Catalogue pages in (date, id) order
+            models.Index(fields=['date', 'id'], name='event_date_id_idx'),
+            # An organizer's events
+            models.Index(fields=['organizer', 'date', 'id'], name='event_organizer_date_id_idx'),
+            # Search by venue, in date order without a query
+            models.Index(fields=['venue', 'date', 'id'], name='event_venue_date_id_idx'),
+            # Full-text search
+            GinIndex(fields=['search_vector'], name='event_search_vector_idx'),
+        ]
+
+    # Written by database triggers only
+    trigger_fields = ('search_vector', 'min_price', 'max_price')
+
     def save(self, *args, **kwargs):
         message =  "event updated"
         if self._state.adding:
             message = "event updated"
+        elif kwargs.get('update_fields') is None:
+            # Never write back what the triggers computed since the event was read
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.trigger_fields
+            ]
 
-        super().save(*args, **kwargs)
-        send_event_update_notification(self.id, message)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            caching.bump_event(self.id)
+            outbox.enqueue(send_event_update_notification, self.id, message)
 
     def delete(self, *args, **kwargs):
         event_id = self.id
         message = "deleted event"
-        super().delete(*args, **kwargs)
-
-        # Call the Celery task after deleting the event
-        send_event_update_notification(event_id, message)
+        with transaction.atomic():
+            # The bookings are deleted with the event, read who to tell first
+            recipients = list(
+                Booking.objects.filter(event_id=event_id).order_by()
+                .values_list('customer__user__email', flat=True).distinct()
+            )
+            super().delete(*args, **kwargs)
+            caching.bump_event(event_id)
+
+            # Notify through the outbox, only if the delete commits
+            outbox.enqueue(
+                send_event_deleted_notification, event_id, message, recipients, dedup_key=f'event-deleted:{event_id}'
+            )
+
+
+class TicketManager(models.Manager):
+    """Manager for Tickets, owns every change to availability.
+
+    Availability is never read into Python and written back. Each change is a
+    single conditional UPDATE, so concurrent bookings can't lose updates and
+    the Ticket row is only locked for the duration of that statement.
+    With INVENTORY_BACKEND = 'redis' the change happens in Redis instead and
+    is written back later, see core.inventory.
+    Ticket.sold and Ticket.revenue move with availability in the same
+    statement, so sales stats never need to add up Booking rows. Revenue is at
+    the unit_price of the booking, at the ticket's current price if none is
+    given. Held tickets leave availability but only count as sold once
+    confirm_hold is called.
+    """
+
+    def current_availability(self, ticket_id):
+        """Availability stored in the database, None if the ticket doesn't exist"""
+        return self.filter(pk=ticket_id).values_list('availability', flat=True).first()
+
+    def _revenue(self, ticket_id, sold, unit_price):
+        """What sold tickets add to revenue, an expression on the row when the price isn't given"""
+        if not sold:
+            return 0
+        if unit_price is not None:
+            return sold * unit_price
+        if inventory.is_enabled():
+            return sold * (self.filter(pk=ticket_id).values_list('price', flat=True).first() or 0)
+        return sold * F('price')
+
+    def reserve(self, ticket_id, quantity, held=False, unit_price=None):
+        """Take quantity tickets, raise if not enough are left"""
+        if quantity <= 0:
+            raise ValidationError("Quantity not allowed")
+        sold = 0 if held else quantity
+        revenue = self._revenue(ticket_id, sold, unit_price)
+        try:
+            if inventory.is_enabled():
+                inventory.reserve(ticket_id, quantity, self.current_availability, sold, revenue)
+            else:
+                with metrics.TICKET_UPDATE_SECONDS.time():
+                    updated = self.filter(pk=ticket_id, availability__gte=quantity).update(
+                        availability=F('availability') - quantity, sold=F('sold') + sold,
+                        revenue=F('revenue') + revenue,
+                    )
+                if not updated:
+                    raise ValidationError("Quantity not allowed")
+        except ValidationError:
+            metrics.RESERVATIONS.labels('rejected').inc()
+            raise
+        metrics.RESERVATIONS.labels('reserved').inc()
+
+    def release(self, ticket_id, quantity, held=False, unit_price=None):
+        """Give quantity tickets back"""
+        if quantity <= 0:
+            return
+        sold = 0 if held else quantity
+        revenue = self._revenue(ticket_id, sold, unit_price)
+        if inventory.is_enabled():
+            inventory.release(ticket_id, quantity, self.current_availability, sold, revenue)
+            return
+        self.filter(pk=ticket_id).update(
+            availability=F('availability') + quantity, sold=F('sold') - sold, revenue=F('revenue') - revenue
+        )
+
+    def release_on_commit(self, ticket_id, quantity, held=False, unit_price=None):
+        """Give quantity tickets back with the current transaction
+
+        Redis isn't rolled back with the transaction, there the tickets only
+        go back once it commits.
+        """
+        if inventory.is_enabled():
+            transaction.on_commit(lambda: self.release(ticket_id, quantity, held, unit_price))
+        else:
+            self.release(ticket_id, quantity, held, unit_price)
+
+    def confirm_hold(self, ticket_id, quantity, unit_price=None):
+        """Count quantity held tickets as sold, in Redis once the transaction commits"""
+        revenue = self._revenue(ticket_id, quantity, unit_price)
+        if inventory.is_enabled():
+            transaction.on_commit(lambda: inventory.sell(ticket_id, quantity, revenue))
+            return
+        self.filter(pk=ticket_id).update(sold=F('sold') + quantity, revenue=F('revenue') + revenue)
+
+    def sales(self, event_id):
+        """Sold, revenue and remaining availability of each ticket type of an event
+
+        One row per ticket type, revenue is at the price each booking was made at.
+        """
+        tickets = list(
+            self.filter(event_id=event_id).order_by('id')
+            .values('id', 'ticket_type', 'price', 'availability', 'sold', 'revenue')
+        )
+        if inventory.is_enabled():
+            ticket_ids = [ticket['id'] for ticket in tickets]
+            availability = inventory.read(ticket_ids)
+            pending = inventory.pending_sales(ticket_ids)
+            pending_revenue = inventory.pending_revenue(ticket_ids)
+            for ticket in tickets:
+                ticket['availability'] = availability.get(ticket['id'], ticket['availability'])
+                ticket['sold'] += pending.get(ticket['id'], 0)
+                ticket['revenue'] += pending_revenue.get(ticket['id'], 0)
+        return tickets
 
 
 class Ticket(models.Model):
     """Model for Ticket"""
-    event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='tickets', db_index=False)
     ticket_type = models.CharField(max_length=100,default='Surprise Ticket xD')
     price = models.DecimalField(max_digits=10, decimal_places=2, default=1.11)
     availability = models.PositiveIntegerField(default=1000)
+    # Tickets taken by bookings and what they were sold for, only ever changed by TicketManager
+    sold = models.PositiveIntegerField(default=0, editable=False)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    objects = TicketManager()
+
+    class Meta:
+        indexes = [
+            # Tickets of an event, in the order the API lists them
+            models.Index(fields=['event', 'id'], name='ticket_event_id_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(availability__gte=0), name='ticket_availability_gte_0'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        ticket = super().from_db(db, field_names, values)
+        # As read, to tell whether a save sets availability
+        ticket._loaded_availability = ticket.__dict__.get('availability')
+        return ticket
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding:
+            sets_availability = True
+        elif update_fields is not None:
+            sets_availability = 'availability' in update_fields
+        else:
+            sets_availability = self.availability != getattr(self, '_loaded_availability', None)
+            # Never write back sales read before a concurrent booking, nor in
+            # Redis mode an availability the write-behind hasn't caught up with
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('sold', 'revenue')
+                and (field.name != 'availability' or sets_availability or not inventory.is_enabled())
+            ]
+        super().save(*args, **kwargs)
+        if sets_availability:
+            self._loaded_availability = self.availability
+            if inventory.is_enabled():
+                # A direct write to availability replaces whatever Redis holds, once committed
+                inventory.store_on_commit({self.pk: self.availability})
+        caching.bump_event(self.event_id)
+
+    def delete(self, *args, **kwargs):
+        ticket_id = self.pk
+        deleted = super().delete(*args, **kwargs)
+        if inventory.is_enabled():
+            inventory.forget(ticket_id)
+        caching.bump_event(self.event_id)
+        return deleted
+
+
+class BookingManager(models.Manager):
+    """Manager for Bookings"""
+
+    def expire_holds(self, batch_size=500):
+        """Expire one batch of holds past expires_at and give their tickets back
+
+        Returns how many holds expired. Rows another transaction is working
+        on (a confirm, say) are skipped and picked up by a later sweep.
+        """
+        with transaction.atomic():
+            holds = list(
+                self.select_for_update(skip_locked=True)
+                .filter(status=Booking.HELD, expires_at__lte=timezone.now())
+                .order_by('expires_at', 'id')
+                .values_list('id', 'ticket_id', 'event_id', 'quantity')[:batch_size]
+            )
+            if not holds:
+                return 0
+            self.filter(pk__in=[hold[0] for hold in holds]).update(status=Booking.EXPIRED)
+
+            released = defaultdict(int)
+            for _, ticket_id, _, quantity in holds:
+                released[ticket_id] += quantity
+
+            def release():
+                # One UPDATE per ticket, in id order like every other multi-ticket lock
+                for ticket_id in sorted(released):
+                    Ticket.objects.release(ticket_id, released[ticket_id], held=True)
+
+            if inventory.is_enabled():
+                # Redis isn't rolled back with the transaction
+                transaction.on_commit(release)
+            else:
+                release()
+            for event_id in {hold[2] for hold in holds}:
+                caching.bump_event(event_id)
+        return len(holds)
 
 
 class Booking(models.Model):
-    """Model for Booking"""
-    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
-    event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    """Model for Booking
+
+    A booking is confirmed straight away, or held until expires_at and then
+    confirmed by the customer or expired by the sweeper. Status only changes
+    through confirm() and BookingManager.expire_holds.
+
+    The table may be partitioned by event (core/db/partitioning.py), queries
+    for one booking also filter on its event_id so they read one partition.
+    A booking never moves to another event.
+    """
+    HELD = 'held'
+    CONFIRMED = 'confirmed'
+    EXPIRED = 'expired'
+
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, db_index=False)
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, db_index=False)
     ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=5)
-
+    status = models.CharField(
+        max_length=10,
+        choices=[
+            (HELD, 'Held'),
+            (CONFIRMED, 'Confirmed'),
+            (EXPIRED, 'Expired'),
+        ],
+        default=CONFIRMED
+    )
+    expires_at = models.DateTimeField(null=True, blank=True)
+    # Price of one ticket when booked, the ticket's price may change since
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+    objects = BookingManager()
+
+    class Meta:
+        indexes = [
+            # A customer's bookings and an event's bookings
+            models.Index(fields=['customer', 'id'], name='booking_customer_id_idx'),
+            models.Index(fields=['event', 'id'], name='booking_event_id_idx'),
+            # The sweeper only ever looks at holds
+            models.Index(
+                fields=['expires_at', 'id'], name='booking_hold_expiry_idx', condition=models.Q(status='held')
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(quantity__gt=0), name='booking_quantity_gt_0'),
+        ]
 
     def save(self, *args, **kwargs):
         """Ensure availability-conformance"""
+        if self.quantity <= 0:
+            raise ValidationError("Quantity not allowed")
+
+        # Tickets taken from Redis, given back if anything below fails since
+        # Redis isn't rolled back with the transaction
+        reserved = 0
+        held = self.status == Booking.HELD
+        try:
+            with transaction.atomic():
+                message = "booking updated"
+                adding = self._state.adding
+                if adding:
+                    # If it's a new booking, take the whole requested quantity
+                    quantity_difference = self.quantity
+                    if self.unit_price is None:
+                        self.unit_price = self.ticket.price
+                    if self.status == Booking.HELD:
+                        message = "booking held"
+                        if self.expires_at is None:
+                            self.expires_at = timezone.now() + timedelta(seconds=settings.BOOKING_HOLD_SECONDS)
+                    else:
+                        message = "booking created"
+                else:
+                    # Lock the booking and retrieve the previous quantity, the
+                    # status may have been changed by a confirm or the sweeper
+                    previous_quantity, self.status = Booking.objects.select_for_update().values_list(
+                        'quantity', 'status'
+                    ).get(pk=self.pk, event_id=self.event_id)
+                    if self.status == Booking.EXPIRED:
+                        raise ValidationError("Booking expired")
+                    quantity_difference = self.quantity - previous_quantity
+
+                """Ensure quantity-update"""
+                held = self.status == Booking.HELD
+                if quantity_difference > 0:
+                    Ticket.objects.reserve(self.ticket_id, quantity_difference, held, self.unit_price)
+                    reserved = quantity_difference
+                elif quantity_difference < 0:
+                    Ticket.objects.release_on_commit(self.ticket_id, -quantity_difference, held, self.unit_price)
+                super().save(*args, **kwargs)
+                caching.bump_event(self.event_id)
+                dedup_key = f'booking-{"held" if held else "created"}:{self.id}' if adding else None
+                outbox.enqueue(send_booking_confirmation_email, self.id, message, dedup_key=dedup_key)
+        except Exception:
+            if reserved and inventory.is_enabled():
+                Ticket.objects.release(self.ticket_id, reserved, held, self.unit_price)
+            raise
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        return super()._do_update(
+            base_qs.filter(event_id=self.event_id), using, pk_val, values, update_fields, forced_update
+        )
+
+    def confirm(self):
+        """Turn a hold into a confirmed booking, raise if it expired
+
+        Confirming an already confirmed booking does nothing.
+        """
         with transaction.atomic():
-            message = "booking updated"
-            if self._state.adding:
-                # If it's a new booking, set quantity_difference to the requested quantity
-                quantity_difference = self.quantity
-                message = "booking created"
-
-                # send_booking_confirmation_email.delay(self.id, "booking created")
-            else:
-                # Retrieve the previous quantity
-                previous_booking = Booking.objects.select_for_update().get(pk=self.pk)
-                previous_quantity = previous_booking.quantity
-                quantity_difference = self.quantity - previous_quantity
-
-            print(quantity_difference)
-            print(self.quantity)
-            if quantity_difference > self.ticket.availability or self.quantity <= 0:
-                raise ValidationError("Quantity not allowed")
-
-            """Ensure quantity-update"""
-            self.ticket.availability -= quantity_difference
-            self.ticket.save()
-            super().save(*args, **kwargs)
-            send_booking_confirmation_email.delay(self.id, message)
-
-
+            quantity, status, expires_at, unit_price = Booking.objects.select_for_update().values_list(
+                'quantity', 'status', 'expires_at', 'unit_price'
+            ).get(pk=self.pk, event_id=self.event_id)
+            if status == Booking.CONFIRMED:
+                self.status, self.expires_at = status, expires_at
+                return
+            if status == Booking.EXPIRED or expires_at <= timezone.now():
+                raise ValidationError("Hold expired")
+
+            Booking.objects.filter(pk=self.pk, event_id=self.event_id).update(
+                status=Booking.CONFIRMED, expires_at=None
+            )
+            Ticket.objects.confirm_hold(self.ticket_id, quantity, unit_price)
+            self.quantity, self.status, self.expires_at = quantity, Booking.CONFIRMED, None
+            outbox.enqueue(
+                send_booking_confirmation_email, self.id, "booking confirmed", dedup_key=f'booking-confirmed:{self.id}'
+            )
 
     def delete(self, *args, **kwargs):
         with transaction.atomic():
-            # Calculate the quantity being deleted
+            # Lock the booking and read what is being deleted, the sweeper may
+            # have expired the hold, and released its tickets, already
             booking_id = self.id
-            quantity_deleted = self.quantity
+            quantity_deleted, status, unit_price = Booking.objects.select_for_update().filter(
+                pk=booking_id, event_id=self.event_id
+            ).values_list(
+                'quantity', 'status', 'unit_price'
+            ).first() or (self.quantity, None, self.unit_price)
             message = f"deleted quantity{quantity_deleted}"
 
-            # Delete the booking
-            super().delete(*args, **kwargs)
-
-            # Update the ticket availability
-            self.ticket.availability += quantity_deleted
-            self.ticket.save()
-            send_booking_confirmation_email.delay(booking_id, message)
-
+            # Delete the booking, a concurrent delete of the same row removes nothing
+            deleted = super().delete(*args, **kwargs)
+
+            # Give the tickets back, only once
+            if deleted[0]:
+                if status != Booking.EXPIRED:
+                    Ticket.objects.release_on_commit(
+                        self.ticket_id, quantity_deleted, held=status == Booking.HELD, unit_price=unit_price
+                    )
+                caching.bump_event(self.event_id)
+                outbox.enqueue(send_booking_confirmation_email, booking_id, message, dedup_key=f'booking-deleted:{booking_id}')
+            return deleted
+
+
+class OutboxMessage(models.Model):
+    """Celery task call written in the same transaction as the change it announces"""
+    task = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    dedup_key = models.CharField(max_length=255, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The relay only ever scans unsent messages in id order
+            models.Index(fields=['id'], name='outbox_unsent_idx', condition=models.Q(sent_at__isnull=True)),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """Response to a write sent with an Idempotency-Key, when keys are kept in the database
+
+    No status_code while the first request with the key is still running, see
+    core/idempotency.py.
+    """
+    key = models.CharField(max_length=100, primary_key=True)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=255, blank=True)
+    body = models.BinaryField(blank=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # The purge deletes expired keys
+            models.Index(fields=['expires_at'], name='idempotency_expiry_idx'),
+        ]
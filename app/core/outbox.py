@@ -0,0 +1,67 @@
+"""
+Transactional outbox for Celery tasks
+
+Models record task calls as OutboxMessage rows in the same transaction as
+the change they announce, so nothing is sent for a rolled back change and the
+request never waits on the broker. The relay_outbox command drains unsent rows
+to Celery in batches. Delivery is at least once, the dedup key is used as the
+Celery task id so consumers can skip a redelivered message.
+"""
+import uuid
+from datetime import timedelta
+
+from celery import current_app
+from django.db import transaction
+from django.utils import timezone
+from core import metrics
+
+
+def enqueue(task, *args, dedup_key=None):
+    """Record a call of task(*args), delivered once the current transaction commits
+
+    A message whose dedup_key was already recorded is dropped.
+    """
+    from core.models import OutboxMessage
+
+    OutboxMessage.objects.bulk_create(
+        [OutboxMessage(task=task.name, args=list(args), dedup_key=dedup_key or uuid.uuid4().hex)],
+        ignore_conflicts=True,
+    )
+
+
+def relay(batch_size=500):
+    """Send one batch of unsent messages to Celery, return how many were sent"""
+    from core.models import OutboxMessage
+
+    error = None
+    with transaction.atomic():
+        # skip_locked lets several relays drain side by side
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(sent_at__isnull=True).order_by('id')[:batch_size]
+        )
+        sent = []
+        for message in messages:
+            try:
+                current_app.send_task(message.task, args=message.args, task_id=message.dedup_key)
+            except Exception as exc:
+                error = exc
+                break
+            sent.append(message.pk)
+        # Whatever made it to the broker is marked, the rest is retried
+        if sent:
+            now = timezone.now()
+            OutboxMessage.objects.filter(pk__in=sent).update(sent_at=now)
+            for message in messages[:len(sent)]:
+                metrics.OUTBOX_LAG_SECONDS.observe((now - message.created_at).total_seconds())
+    if error is not None:
+        raise error
+    return len(sent)
+
+
+def purge(older_than=timedelta(days=1)):
+    """Delete sent messages, dedup keys are only remembered this long"""
+    from core.models import OutboxMessage
+
+    deleted, _ = OutboxMessage.objects.filter(sent_at__lt=timezone.now() - older_than).delete()
+    return deleted
@@ -2,6 +2,8 @@
 Permission classes
 """
 from rest_framework import permissions
+from core import admission
+from core.models import Event, Ticket
 
 class IsEventOrganizer(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
@@ -15,6 +17,26 @@ class IsCustomer(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user.role == 'customer'
 
+class HasAdmission(permissions.BasePermission):
+    """Booking an event with an admission_rate needs an admitted X-Admission-Token"""
+    message = 'This event is booked through its admission queue, join it and book once admitted.'
+
+    def has_permission(self, request, view):
+        event_id = view.kwargs.get('event_id')
+        ticket_id = view.kwargs.get('ticket_id')
+        if ticket_id is not None:
+            # The queue of the ticket's own event, the view refuses a ticket
+            # of another event than the url's
+            event_id, rate = Ticket.objects.filter(pk=ticket_id).values_list(
+                'event_id', 'event__admission_rate'
+            ).first() or (event_id, None)
+        else:
+            rate = Event.objects.filter(pk=event_id).values_list('admission_rate', flat=True).first()
+        if not rate:
+            return True
+        token = request.headers.get('X-Admission-Token')
+        return admission.is_admitted(event_id, request.user.pk, token, rate)
+
 
 
 
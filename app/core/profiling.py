@@ -0,0 +1,167 @@
+"""
+Per request query budget and timing
+
+QueryProfileMiddleware counts the SQL queries of every request and times
+them, along with the time spent rendering serializer .data (nested
+serializers and the lazy queries they trigger included) or building lists
+without serializers (core/fast_lists.py). With SERVER_TIMING
+on the numbers go out in a Server-Timing header, readable in the browser's
+network tab.
+
+A view declares how many queries it should need with query_budget. A request
+over it is logged, counted in query_budget_exceeded_total and sent as query_budget_exceeded, which
+QueryBudgetTestMixin (core/testing.py) turns into a test failure.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import Signal, receiver
+from rest_framework import serializers
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Sent with sender=view class, request and profile
+query_budget_exceeded = Signal()
+
+_profile = contextvars.ContextVar('query_profile', default=None)
+
+
+class QueryProfile:
+    """Queries and timings of one request, times in seconds"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.started = time.perf_counter()
+        self.total_time = 0.0
+
+    def record(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="queries={self.queries}"',
+            f'serializer;dur={self.serializer_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+
+def _record_query(execute, sql, params, many, context):
+    # Execute wrapper of every connection, counts for the request in progress.
+    # The profile follows the request into threads (contextvars), so queries
+    # run by async views in their thread pool are counted too
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.record(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    """Add _record_query to a connection, connections are per thread"""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def timed_serialization(build):
+    """Count the time of build, serializer .data or the like, as serializer time"""
+    def timed(*args, **kwargs):
+        profile = _profile.get()
+        if profile is None:
+            return build(*args, **kwargs)
+        # Only the outermost .data counts, it includes anything it calls
+        profile.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return build(*args, **kwargs)
+        finally:
+            profile.serializer_depth -= 1
+            if not profile.serializer_depth:
+                profile.serializer_time += time.perf_counter() - started
+    timed.profiled = True
+    return timed
+
+
+def instrument_serializers():
+    """Time BaseSerializer.data, which Serializer and ListSerializer build on"""
+    fget = serializers.BaseSerializer.data.fget
+    if not getattr(fget, 'profiled', False):
+        serializers.BaseSerializer.data = property(timed_serialization(fget))
+
+
+class QueryProfileMiddleware:
+    """Profile every request, see the module docs"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Tells Django this instance is a coroutine function
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        instrument_serializers()
+        # Connections opened before this was loaded
+        for connection in connections.all():
+            install_query_recorder(None, connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profile, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.stop(profile, token)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        profile, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.stop(profile, token)
+        return self.finish(request, response, profile)
+
+    def start(self, request):
+        request.view_class = None
+        profile = QueryProfile()
+        return profile, _profile.set(profile)
+
+    def stop(self, profile, token):
+        profile.total_time = time.perf_counter() - profile.started
+        _profile.reset(token)
+
+    def finish(self, request, response, profile):
+        self.check_budget(request, profile)
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = profile.server_timing()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # as_view() keeps the class on the function it returns
+        request.view_class = getattr(view_func, 'view_class', None)
+
+    def check_budget(self, request, profile):
+        budget = getattr(request.view_class, 'query_budget', None)
+        if budget is None or profile.queries <= budget:
+            return
+        metrics.QUERY_BUDGET_EXCEEDED.labels(request.view_class.__name__).inc()
+        logger.warning(
+            '%s %s ran %d queries, %s allows %d',
+            request.method, request.path, profile.queries, request.view_class.__name__, budget,
+        )
+        query_budget_exceeded.send(sender=request.view_class, request=request, profile=profile)
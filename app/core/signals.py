@@ -10,4 +10,39 @@
 
 # @receiver(post_delete, sender=Booking)
 # def update_ticket_availability_on_delete(sender, instance, **kwargs):
-#     pass
\ No newline at end of file
+#     pass
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from core.authentication import invalidate_token
+from core.models import User, EventOrganizer, Customer
+
+
+def invalidate_tokens_on_commit(keys):
+    """Invalidate once the change is visible, a request reading before could cache it again"""
+    transaction.on_commit(lambda: [invalidate_token(key) for key in keys])
+
+
+def invalidate_user_tokens(user_id):
+    """Cached tokens carry a copy of the user, drop them when it changes"""
+    invalidate_tokens_on_commit(list(Token.objects.filter(user_id=user_id).values_list('key', flat=True)))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens_on_commit([instance.key])
+
+
+@receiver(post_save, sender=User)
+def invalidate_changed_user(sender, instance, created, **kwargs):
+    # Covers deactivation, a new user has no token yet
+    if not created:
+        invalidate_user_tokens(instance.pk)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=EventOrganizer)
+def invalidate_changed_profile(sender, instance, **kwargs):
+    invalidate_user_tokens(instance.user_id)
@@ -1,11 +1,34 @@
 """Task file for celery event tasks"""
 
-from celery import shared_task
-from django.core.mail import send_mail
+import logging
+import time
+
+from celery import shared_task, current_task
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection, send_mail
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
+EVENT_UPDATE_MESSAGE_KEY = 'notify:event:{}:message'
+EVENT_UPDATE_SCHEDULED_KEY = 'notify:event:{}:scheduled'
+
+
+def already_delivered():
+    """Whether the running task id was handled before
+
+    Tasks relayed from the outbox are delivered at least once, with the
+    message's dedup key as task id.
+    """
+    if current_task is None or not current_task.request.id:
+        return False
+    return not cache.add(f'task-delivered:{current_task.request.id}', 1, 60 * 60 * 24)
+
+
 @shared_task
 def send_booking_confirmation_email(booking_id, message):
+    if already_delivered():
+        return None
     try:
         subject = f'Booking information for {booking_id}'
         message = f'Dear Blej. {message}.\n\nRegards,\nThe Event Team'
@@ -17,12 +40,142 @@ def send_booking_confirmation_email(booking_id, message):
 
 @shared_task
 def send_event_update_notification(event_id, message):
+    """Coalesce updates to the same event into one fan-out per window
+
+    The latest message is kept, the first update in a window schedules
+    fan_out_event_update and later ones within the window only replace the
+    message it will send.
+    """
+    if already_delivered():
+        return None
+    window = settings.NOTIFICATION_COALESCE_WINDOW
+    cache.set(EVENT_UPDATE_MESSAGE_KEY.format(event_id), message, window * 10)
+    # Expires on its own in case the fan-out is lost
+    if cache.add(EVENT_UPDATE_SCHEDULED_KEY.format(event_id), 1, window * 10):
+        fan_out_event_update.apply_async((event_id,), countdown=window)
+        return 'scheduled'
+    return 'coalesced'
+
+
+def send_in_chunks(subject, body, recipients, chunk_size=None):
+    """Send one message per recipient over a single mail connection
+
+    recipients can be any iterable, it is consumed chunk_size at a time so
+    memory stays flat however many there are. Returns throughput stats.
+    """
+    chunk_size = chunk_size or settings.NOTIFICATION_CHUNK_SIZE
+    connection = get_connection()
+    sent = 0
+    start = time.perf_counter()
+    connection.open()
     try:
-        subject = f'Booking information for {event_id}'
-        message = f'Dear Blej. {message}.\n\nRegards,\nThe Event Team'
-        print(subject)
-        print(message)
-        return f"subbject: {subject}, message: {message}"
-    except Exception as e:
-        return f" some exception: {str(e)} while attemplting to send: subbject: {subject}, message: {message}"
+        chunk = []
+        for recipient in recipients:
+            chunk.append(EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [recipient], connection=connection))
+            if len(chunk) == chunk_size:
+                sent += connection.send_messages(chunk) or 0
+                chunk = []
+        if chunk:
+            sent += connection.send_messages(chunk) or 0
+    finally:
+        connection.close()
+    elapsed = time.perf_counter() - start
+    stats = {
+        'sent': sent,
+        'seconds': round(elapsed, 3),
+        'messages_per_second': round(sent / elapsed, 1) if elapsed else 0.0,
+    }
+    logger.info('Sent %(sent)s messages in %(seconds)ss (%(messages_per_second)s/s)', stats)
+    return stats
+
+
+@shared_task
+def fan_out_event_update(event_id):
+    """Email every customer with a booking for the event the latest update"""
+    from core.models import Booking
+
+    # Cleared first, an update arriving from here on schedules its own fan-out
+    cache.delete(EVENT_UPDATE_SCHEDULED_KEY.format(event_id))
+    message = cache.get(EVENT_UPDATE_MESSAGE_KEY.format(event_id), 'event updated')
+
+    recipients = (
+        Booking.objects.filter(event_id=event_id)
+        .order_by()
+        .values_list('customer__user__email', flat=True)
+        .distinct()
+        .iterator(chunk_size=settings.NOTIFICATION_CHUNK_SIZE)
+    )
+    subject = f'Update for event {event_id}'
+    body = f'Dear customer. {message}.\n\nRegards,\nThe Event Team'
+    return send_in_chunks(subject, body, recipients)
+
+
+@shared_task
+def send_event_deleted_notification(event_id, message, recipients):
+    """Email the customers who had bookings for a deleted event, right away
+
+    Not coalesced like updates: the bookings are gone with the event, so the
+    recipients are collected before the delete and passed in.
+    """
+    if already_delivered():
+        return None
+    subject = f'Update for event {event_id}'
+    body = f'Dear customer. {message}.\n\nRegards,\nThe Event Team'
+    return send_in_chunks(subject, body, recipients)
+
+
+@shared_task
+def send_batch_booking_confirmation_email(booking_ids, message):
+    """One notification for all bookings made in a single checkout"""
+    from core.models import Booking
+
+    if already_delivered():
+        return None
+    recipients = (
+        Booking.objects.filter(id__in=booking_ids)
+        .order_by()
+        .values_list('customer__user__email', flat=True)
+        .distinct()
+    )
+    subject = f'Booking information for {", ".join(str(booking_id) for booking_id in booking_ids)}'
+    body = f'Dear customer. {message}.\n\nRegards,\nThe Event Team'
+    return send_in_chunks(subject, body, recipients)
+
+
+@shared_task
+def flush_inventory():
+    """Write Redis-held ticket availability back to the database"""
+    from core import inventory
+
+    if not inventory.is_enabled():
+        return 0
+    return inventory.flush()
+
+
+@shared_task
+def expire_holds():
+    """Release the tickets of every held booking past its expiry, a batch at a time"""
+    from core.models import Booking
+
+    expired = 0
+    while True:
+        count = Booking.objects.expire_holds(settings.HOLD_SWEEP_BATCH_SIZE)
+        expired += count
+        if count < settings.HOLD_SWEEP_BATCH_SIZE:
+            return expired
+
+
+@shared_task
+def purge_outbox():
+    """Delete outbox messages sent more than a day ago"""
+    from core import outbox
+
+    return outbox.purge()
+
+
+@shared_task
+def purge_idempotency_keys():
+    """Delete expired Idempotency-Key responses kept in the database"""
+    from core import idempotency
 
+    return idempotency.purge()
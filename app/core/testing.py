@@ -0,0 +1,35 @@
+"""
+Test helpers shared by the apps
+"""
+from prometheus_client import REGISTRY
+from core import profiling
+
+
+def sample(name, **labels):
+    """Current value of a metric of this process, 0 before it is first counted"""
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class QueryBudgetTestMixin:
+    """Fail the test when a request it makes runs over its view's query_budget
+
+    Mix into a TestCase that calls views through the test client, the
+    failure is reported when the test finishes.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.over_budget = []
+        profiling.query_budget_exceeded.connect(self._record_over_budget)
+        self.addCleanup(self._check_query_budgets)
+
+    def _record_over_budget(self, sender, request, profile, **kwargs):
+        self.over_budget.append(
+            f'{request.method} {request.path}: {profile.queries} queries, '
+            f'{sender.__name__}.query_budget is {sender.query_budget}'
+        )
+
+    def _check_query_budgets(self):
+        profiling.query_budget_exceeded.disconnect(self._record_over_budget)
+        if self.over_budget:
+            self.fail('Query budget exceeded:\n' + '\n'.join(self.over_budget))
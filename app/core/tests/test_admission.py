@@ -0,0 +1,94 @@
+"""
+Test the admission queue against both backends
+"""
+from unittest.mock import patch
+
+import fakeredis
+from django.test import SimpleTestCase, override_settings
+from core import admission
+
+
+class AdmissionQueueTestMixin:
+    """Runs every test with a clock the test moves by hand"""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch('core.admission.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue = self.make_queue()
+        patcher = patch('core.admission.get_queue', return_value=self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def join(self, user_id, rate=2, event_id=1):
+        return self.queue.join(event_id, user_id, rate)
+
+    def test_admits_a_burst_then_at_the_rate(self):
+        """Test the first rate customers get in at once and the rest one every 1/rate seconds"""
+        statuses = [self.join(user_id) for user_id in range(1, 6)]
+
+        self.assertEqual([status['admitted'] for status in statuses], [True, True, False, False, False])
+        self.assertEqual([status['position'] for status in statuses[2:]], [1, 2, 3])
+
+        self.now += 0.5
+        self.assertTrue(self.queue.status(1, statuses[2]['token'], 2)['admitted'])
+        self.assertEqual(self.queue.status(1, statuses[3]['token'], 2)['position'], 1)
+        self.now += 1
+        self.assertTrue(self.queue.status(1, statuses[4]['token'], 2)['admitted'])
+
+    def test_idle_time_does_not_build_up_a_bigger_burst(self):
+        self.join(1)
+        self.now += 3600
+
+        statuses = [self.join(user_id) for user_id in range(2, 6)]
+
+        self.assertEqual([status['admitted'] for status in statuses], [True, True, False, False])
+
+    def test_joining_twice_keeps_the_place(self):
+        self.join(1)
+        self.join(2)
+        first = self.join(3)
+
+        again = self.join(3)
+
+        self.assertEqual(again['token'], first['token'])
+        self.assertEqual(again['position'], 1)
+
+    def test_admission_expires(self):
+        """Test an admitted token lapses after the pass and joining again queues at the back"""
+        token = self.join(1)['token']
+        self.assertTrue(admission.is_admitted(1, 1, token, 2))
+        self.assertFalse(admission.is_admitted(1, 2, token, 2))
+
+        self.now += 61
+
+        self.assertIsNone(self.queue.status(1, token, 2))
+        rejoined = self.join(1)
+        self.assertNotEqual(rejoined['token'], token)
+
+    def test_events_have_separate_queues(self):
+        self.join(1, rate=1, event_id=1)
+
+        self.assertTrue(self.join(2, rate=1, event_id=2)['admitted'])
+        self.assertFalse(self.join(3, rate=1, event_id=1)['admitted'])
+
+    def test_status_reports_the_owner(self):
+        token = self.join(7)['token']
+
+        self.assertEqual(self.queue.status(1, token, 2)['user_id'], 7)
+        self.assertIsNone(self.queue.status(1, 'unknown', 2))
+
+
+@override_settings(ADMISSION_PASS_SECONDS=60)
+class MemoryAdmissionQueueTests(AdmissionQueueTestMixin, SimpleTestCase):
+
+    def make_queue(self):
+        return admission.MemoryAdmissionQueue()
+
+
+@override_settings(ADMISSION_PASS_SECONDS=60)
+class RedisAdmissionQueueTests(AdmissionQueueTestMixin, SimpleTestCase):
+
+    def make_queue(self):
+        return admission.RedisAdmissionQueue(fakeredis.FakeStrictRedis())
@@ -0,0 +1,117 @@
+"""
+Test the async views through the ASGI handler
+"""
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import path
+from rest_framework.authtoken.models import Token
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from booking.views import BookingCreateView
+from core import async_views
+from core.models import User, Customer, Event, Ticket, EventOrganizer, Booking
+from events.views import EventListView, MyEventRetrieveView, TicketListView
+
+
+class SlowView(APIView):
+    permission_classes = []
+    running = 0
+    most = 0
+    lock = threading.Lock()
+
+    def get(self, request):
+        with self.lock:
+            SlowView.running += 1
+            SlowView.most = max(SlowView.most, SlowView.running)
+        time.sleep(0.05)
+        with self.lock:
+            SlowView.running -= 1
+        return Response({'thread': threading.current_thread().name})
+
+
+urlpatterns = [
+    path('events/', async_views.as_async_view(EventListView), name='event-list'),
+    path('events/<int:pk>/', async_views.as_async_view(MyEventRetrieveView), name='event-retrieve'),
+    path('events/<int:event_id>/tickets/', async_views.as_async_view(TicketListView), name='ticket-list'),
+    path('book/<int:event_id>/<int:ticket_id>/', async_views.as_async_view(BookingCreateView), name='book'),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__, SERVER_TIMING=True)
+class AsyncViewTestCase(TransactionTestCase):
+
+    def setUp(self):
+        # Pool threads outlive the test, their connections mustn't
+        patcher = patch.dict(connection.settings_dict, {'CONN_MAX_AGE': 0})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = AsyncClient()
+        organizer_user = User.objects.create_user('organizer@example.com', 'password', role='organizer')
+        self.event = Event.objects.create(organizer=EventOrganizer.objects.create(user=organizer_user))
+        self.ticket = Ticket.objects.create(event=self.event, availability=10)
+        user = User.objects.create_user('customer@example.com', 'password', role='customer')
+        Customer.objects.create(user=user)
+        self.token = Token.objects.create(user=user)
+
+    def test_catalogue_reads(self):
+        async def get(url):
+            return await self.client.get(url)
+
+        for url in ('/events/', f'/events/{self.event.pk}/', f'/events/{self.event.pk}/tickets/'):
+            response = async_to_sync(get)(url)
+            self.assertEqual(response.status_code, 200, url)
+
+        response = async_to_sync(get)(f'/events/{self.event.pk}/tickets/')
+        self.assertEqual(response.json()[0]['id'], self.ticket.pk)
+
+    def test_booking(self):
+        async def book():
+            return await self.client.post(
+                f'/book/{self.event.pk}/{self.ticket.pk}/', {'quantity': 3}, content_type='application/json',
+                # Extra arguments are ASGI headers
+                authorization=f'Token {self.token.key}',
+            )
+
+        response = async_to_sync(book)()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).availability, 7)
+        self.assertTrue(Booking.objects.filter(ticket=self.ticket, quantity=3).exists())
+        # Queries run in the pool thread are still counted for the request
+        self.assertNotIn('queries=0', response['Server-Timing'])
+
+
+@override_settings(ASYNC_VIEW_THREADS=2)
+class AsyncViewPoolTestCase(SimpleTestCase):
+
+    def setUp(self):
+        SlowView.running = SlowView.most = 0
+        patcher = patch('core.async_views._executor', ThreadPoolExecutor(2, thread_name_prefix='async-view'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_runs_in_the_bounded_pool(self):
+        view = async_views.as_async_view(SlowView)
+        factory = APIRequestFactory()
+
+        async def run():
+            return await asyncio.gather(*(view(factory.get('/')) for _ in range(6)))
+
+        responses = async_to_sync(run)()
+
+        self.assertTrue(all(response.data['thread'].startswith('async-view') for response in responses))
+        self.assertEqual(SlowView.most, 2)
+
+    def test_plain_view_without_async_views(self):
+        with override_settings(ASYNC_VIEWS=False):
+            self.assertFalse(asyncio.iscoroutinefunction(async_views.as_view(SlowView)))
+        with override_settings(ASYNC_VIEWS=True):
+            self.assertTrue(asyncio.iscoroutinefunction(async_views.as_view(SlowView)))
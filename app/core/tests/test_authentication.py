@@ -0,0 +1,86 @@
+"""
+Test cached token authentication
+"""
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from core.authentication import CachedTokenAuthentication, local_tokens, LRUCache
+from core.models import User, Customer
+
+
+BOOKING_LIST_URL = reverse('booking:booking-list')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test tokens are looked up once and then served from cache"""
+
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='customer@example.com', password='password', role='customer')
+        self.customer = Customer.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_first_request_preloads_customer(self):
+        """Test one query loads token, user and customer, the booking query is the only other"""
+        with self.assertNumQueries(2):
+            response = self.client.get(BOOKING_LIST_URL)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cached_request_skips_token_query(self):
+        """Test a cached token costs no query at all"""
+        self.client.get(BOOKING_LIST_URL)
+        with self.assertNumQueries(1):
+            response = self.client.get(BOOKING_LIST_URL)
+        self.assertEqual(response.status_code, 200)
+
+    def test_shared_tier_fills_local_tier(self):
+        """Test a token cached by another process is found without the database"""
+        self.client.get(BOOKING_LIST_URL)
+        local_tokens.clear()
+        with self.assertNumQueries(1):
+            self.client.get(BOOKING_LIST_URL)
+
+    @override_settings(TOKEN_CACHE_SHARED=False)
+    def test_local_tier_only(self):
+        """Test the shared tier can be switched off"""
+        self.client.get(BOOKING_LIST_URL)
+        local_tokens.clear()
+        with self.assertNumQueries(2):
+            self.client.get(BOOKING_LIST_URL)
+
+    def test_invalid_token(self):
+        """Test unknown tokens are still rejected"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token not-a-token')
+        response = self.client.get(BOOKING_LIST_URL)
+        self.assertEqual(response.status_code, 401)
+
+    def test_requests_get_their_own_user_copy(self):
+        """Test changes a view makes to request.user don't leak into the cache"""
+        auth = CachedTokenAuthentication()
+        user, _ = auth.authenticate_credentials(self.token.key)
+        user.name = 'Changed in memory'
+        user, _ = auth.authenticate_credentials(self.token.key)
+        self.assertNotEqual(user.name, 'Changed in memory')
+
+
+class LRUCacheTests(TestCase):
+    """Test the in-process LRU"""
+
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(2)
+        lru.set('a', 1, 60)
+        lru.set('b', 2, 60)
+        lru.get('a')
+        lru.set('c', 3, 60)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b'))
+
+    def test_expired_entries_are_misses(self):
+        lru = LRUCache(2)
+        lru.set('a', 1, -1)
+        self.assertIsNone(lru.get('a'))
@@ -0,0 +1,125 @@
+"""
+Test the health checks and the connection pool of the core.db backend
+"""
+from unittest.mock import patch
+
+from django.contrib.postgres.signals import register_type_handlers
+from django.db import connection, OperationalError
+from django.db.backends.signals import connection_created
+from django.test import SimpleTestCase
+from core.db import base
+
+
+class DatabaseTestCase(SimpleTestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        # contrib.postgres looks its types up through connections[alias], which has no 'test'
+        connection_created.disconnect(register_type_handlers)
+        self.addCleanup(connection_created.connect, register_type_handlers)
+
+    def new_connection(self, **settings):
+        """A connection of its own to the test database, closed after the test"""
+        wrapper = base.DatabaseWrapper({**connection.settings_dict, **settings}, alias='test')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def backend_pid(self, wrapper):
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def terminate(self, pid):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+
+
+class HealthCheckTests(DatabaseTestCase):
+
+    def test_replaces_a_dropped_connection(self):
+        wrapper = self.new_connection(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+        pid = self.backend_pid(wrapper)
+        self.terminate(pid)
+
+        # As the next request starts
+        wrapper.close_if_unusable_or_obsolete()
+
+        self.assertNotEqual(self.backend_pid(wrapper), pid)
+
+    def test_without_health_checks_the_first_query_fails(self):
+        wrapper = self.new_connection(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=False)
+        self.terminate(self.backend_pid(wrapper))
+
+        wrapper.close_if_unusable_or_obsolete()
+
+        with self.assertRaises(OperationalError):
+            self.backend_pid(wrapper)
+
+    def test_checks_once_per_request(self):
+        wrapper = self.new_connection(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+        self.backend_pid(wrapper)
+        wrapper.close_if_unusable_or_obsolete()
+
+        with patch.object(wrapper, 'is_usable', wraps=wrapper.is_usable) as is_usable:
+            self.backend_pid(wrapper)
+            self.backend_pid(wrapper)
+
+        self.assertEqual(is_usable.call_count, 1)
+
+
+class ConnectionPoolTests(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(self.close_pool)
+
+    def close_pool(self):
+        base.close_pool('test', connection.settings_dict['NAME'])
+        while base._inherited:
+            base._inherited.pop().close()
+
+    def pooled(self, size=1):
+        return self.new_connection(CONN_MAX_AGE=0, POOL={'SIZE': size, 'TIMEOUT': 0.1})
+
+    def test_reuses_a_closed_connection(self):
+        first, second = self.pooled(), self.pooled()
+        pid = self.backend_pid(first)
+        raw = first.connection
+        first.close()
+
+        self.assertEqual(self.backend_pid(second), pid)
+        self.assertIs(second.connection, raw)
+
+    def test_rolls_back_before_reuse(self):
+        first, second = self.pooled(), self.pooled()
+        first.set_autocommit(False)
+        with first.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE pooled (id int)')
+        first.close()
+
+        with second.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pg_temp.pooled')")
+            self.assertIsNone(cursor.fetchone()[0])
+
+    def test_waits_for_a_free_connection(self):
+        first, second = self.pooled(), self.pooled()
+        pid = self.backend_pid(first)
+
+        with self.assertRaisesRegex(OperationalError, 'No database connection free'):
+            second.ensure_connection()
+
+        first.close()
+        self.assertEqual(self.backend_pid(second), pid)
+
+    def test_forked_process_starts_its_own_pool(self):
+        first, second = self.pooled(), self.pooled()
+        self.backend_pid(first)
+        inherited = first.connection
+
+        with patch('core.db.base.os.getpid', return_value=-1):
+            first.close()
+            self.backend_pid(second)
+
+        # The parent's connection is neither closed nor handed out
+        self.assertFalse(inherited.closed)
+        self.assertIsNot(second.connection, inherited)
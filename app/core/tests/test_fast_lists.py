@@ -0,0 +1,165 @@
+"""
+Test the serializer-free list endpoints and the orjson renderer
+"""
+import datetime
+import decimal
+import uuid
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from core.fast_lists import ValuesRepresentation, converter
+from core.models import User, Customer, Event, Ticket, EventOrganizer, Booking
+from core.renderers import ORJSONRenderer
+from core.testing import QueryBudgetTestMixin
+
+
+class FastListTests(QueryBudgetTestMixin, TestCase):
+    """Each list is fetched through its serializer and through .values(), the bytes must match"""
+
+    def setUp(self):
+        super().setUp()
+        organizer = EventOrganizer.objects.create(
+            user=User.objects.create_user('organizer@example.com', role='organizer')
+        )
+        start = timezone.now().replace(microsecond=123456)
+        self.events = [
+            Event.objects.create(
+                organizer=organizer, date=start + datetime.timedelta(days=i), venue='Hall',
+                title=f'Concert {i} é\u2028"quoted"', description='Line\nbreak\t☃',
+            )
+            for i in range(5)
+        ]
+        self.events.append(Event.objects.create(organizer=organizer, date=start, title='No tickets'))
+        for event in self.events[:5]:
+            Ticket.objects.create(event=event, ticket_type='Regular', price=decimal.Decimal('10.50'), availability=20)
+            Ticket.objects.create(event=event, ticket_type='VIP', price=decimal.Decimal('99.99'), availability=20)
+        user = User.objects.create_user('customer@example.com', role='customer')
+        customer = Customer.objects.create(user=user)
+        ticket = self.events[0].tickets.first()
+        Booking.objects.create(customer=customer, event=self.events[0], ticket=ticket, quantity=2)
+        Booking.objects.create(
+            customer=customer, event=self.events[0], ticket=ticket, quantity=1, status=Booking.HELD,
+            expires_at=timezone.now() + datetime.timedelta(minutes=5),
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+
+    def fetch(self, url, fast):
+        cache.clear()
+        with override_settings(FAST_LIST_VIEWS=fast), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def assertSameResponse(self, url):
+        slow, slow_queries = self.fetch(url, fast=False)
+        fast, fast_queries = self.fetch(url, fast=True)
+        self.assertEqual(fast.content, slow.content)
+        self.assertEqual(fast['Content-Type'], slow['Content-Type'])
+        # The token is cached by the first
+        self.assertLessEqual(fast_queries, slow_queries)
+        return fast
+
+    def test_event_list(self):
+        response = self.assertSameResponse(reverse('event:event-list'))
+        self.assertEqual(len(response.json()['results']), 6)
+        self.assertIn(b'\\u2028', response.content)
+
+    def test_event_list_in_another_timezone(self):
+        with timezone.override('America/New_York'):
+            response = self.assertSameResponse(reverse('event:event-list'))
+        self.assertFalse(response.json()['results'][0]['date'].endswith('Z'))
+
+    def test_event_list_pages(self):
+        url = reverse('event:event-list') + '?page_size=2'
+        pages = 0
+        while url:
+            url = self.assertSameResponse(url).json()['next']
+            pages += 1
+        self.assertEqual(pages, 3)
+
+    def test_ticket_list(self):
+        response = self.assertSameResponse(reverse('event:ticket-list', kwargs={'event_id': self.events[0].pk}))
+        self.assertEqual({ticket['price'] for ticket in response.json()}, {'10.50', '99.99'})
+
+    def test_booking_list(self):
+        response = self.assertSameResponse(reverse('booking:booking-list'))
+        self.assertEqual({booking['status'] for booking in response.json()}, {Booking.CONFIRMED, Booking.HELD})
+
+    def test_errors_are_rendered_the_same(self):
+        self.client.credentials()
+        with override_settings(FAST_LIST_VIEWS=True):
+            fast = self.client.get(reverse('booking:booking-list'))
+        slow = self.client.get(reverse('booking:booking-list'))
+        self.assertEqual((fast.status_code, fast.content), (slow.status_code, slow.content))
+
+    def test_refuses_fields_only_the_serializer_builds(self):
+        class EventTitleSerializer(serializers.ModelSerializer):
+            shout = serializers.SerializerMethodField()
+
+            class Meta:
+                model = Event
+                fields = ['id', 'shout']
+
+            def get_shout(self, event):
+                return event.title.upper()
+
+        with self.assertRaises(ImproperlyConfigured):
+            ValuesRepresentation(EventTitleSerializer)
+
+
+class ConverterTests(SimpleTestCase):
+
+    def assertSameRepresentation(self, field, values):
+        convert = converter(field)
+        for value in values:
+            self.assertEqual(convert(value), field.to_representation(value), value)
+
+    def test_decimals(self):
+        self.assertSameRepresentation(
+            serializers.DecimalField(max_digits=5, decimal_places=2),
+            [decimal.Decimal(value) for value in ('10.50', '1.5', '7', '0.00', '-3.21', '1.005', '1E+2')],
+        )
+
+    def test_datetimes(self):
+        utc = datetime.datetime(2024, 5, 1, 12, 30, 15, 500, tzinfo=datetime.timezone.utc)
+        field = serializers.DateTimeField()
+        self.assertSameRepresentation(field, [utc, utc.replace(microsecond=0), utc.replace(tzinfo=None)])
+        with timezone.override('Asia/Kolkata'):
+            self.assertSameRepresentation(serializers.DateTimeField(), [utc])
+
+
+class ORJSONRendererTests(SimpleTestCase):
+
+    def assertSameBytes(self, data, **kwargs):
+        self.assertEqual(ORJSONRenderer().render(data, **kwargs), JSONRenderer().render(data, **kwargs))
+
+    def test_matches_json_renderer(self):
+        self.assertSameBytes({
+            'text': 'café \u2028 \u2029 "\\/\x00\x1f\x7f',
+            'datetime': datetime.datetime(2024, 5, 1, 12, 30, 0, 500, tzinfo=datetime.timezone.utc),
+            'offset': datetime.datetime(2024, 5, 1, 12, 30, tzinfo=datetime.timezone(datetime.timedelta(hours=2))),
+            'date': datetime.date(2024, 5, 1),
+            'time': datetime.time(8, 15),
+            'decimal': decimal.Decimal('10.50'),
+            'uuid': uuid.UUID(int=1),
+            'nested': [{'a': 1, 'b': None, 'c': True}, (1, 2)],
+        })
+
+    def test_falls_back_for_what_orjson_cannot_encode(self):
+        self.assertSameBytes({'big': 2 ** 70, 1: 'int key'})
+
+    def test_indented(self):
+        self.assertSameBytes({'a': [1]}, accepted_media_type='application/json; indent=4')
+
+    def test_nothing(self):
+        self.assertEqual(ORJSONRenderer().render(None), b'')
@@ -0,0 +1,202 @@
+"""
+Test held bookings, confirmation and the expiry sweeper
+"""
+import threading
+from datetime import timedelta
+from unittest.mock import patch
+
+import fakeredis
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from core import inventory
+from core.models import EventOrganizer, Customer, Event, Ticket, Booking
+from core.tasks import expire_holds
+
+
+class HoldTestMixin:
+
+    def make_fixtures(self, availability=10):
+        organizer_user = get_user_model().objects.create_user('org@example.com', 'pass123', role='organizer')
+        customer_user = get_user_model().objects.create_user('customer@example.com', 'pass123', role='customer')
+        self.customer = Customer.objects.create(user=customer_user)
+        self.event = Event.objects.create(organizer=EventOrganizer.objects.create(user=organizer_user))
+        self.ticket = Ticket.objects.create(event=self.event, availability=availability)
+
+    def hold(self, quantity=1, ticket=None, expired=False):
+        expires_at = timezone.now() - timedelta(seconds=1) if expired else None
+        return Booking.objects.create(
+            customer=self.customer, event=self.event, ticket=ticket or self.ticket,
+            quantity=quantity, status=Booking.HELD, expires_at=expires_at,
+        )
+
+    def counts(self, ticket=None):
+        ticket = Ticket.objects.get(pk=(ticket or self.ticket).pk)
+        return ticket.availability, ticket.sold
+
+
+class HoldTests(HoldTestMixin, TestCase):
+
+    def setUp(self):
+        self.make_fixtures()
+
+    @override_settings(BOOKING_HOLD_SECONDS=600)
+    def test_hold_takes_availability_but_is_not_sold(self):
+        booking = self.hold(3)
+
+        self.assertEqual(self.counts(), (7, 0))
+        self.assertEqual(booking.status, Booking.HELD)
+        self.assertAlmostEqual(booking.expires_at, timezone.now() + timedelta(seconds=600), delta=timedelta(seconds=5))
+
+    def test_hold_costs_the_same_queries_as_a_booking(self):
+        """Test the hold path is the create path plus a status"""
+        Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=1)
+        self.hold(1)
+        with self.assertNumQueries(5) as booking_queries:
+            Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=1)
+        with self.assertNumQueries(len(booking_queries)):
+            self.hold(1)
+
+    def test_confirm(self):
+        """Test confirming counts the held tickets as sold, once"""
+        booking = self.hold(3)
+
+        booking.confirm()
+        booking.confirm()
+
+        self.assertEqual(self.counts(), (7, 3))
+        booking.refresh_from_db()
+        self.assertEqual((booking.status, booking.expires_at), (Booking.CONFIRMED, None))
+
+    def test_confirm_after_expiry_fails(self):
+        booking = self.hold(3, expired=True)
+
+        with self.assertRaises(ValidationError):
+            booking.confirm()
+        self.assertEqual(Booking.objects.get(pk=booking.pk).status, Booking.HELD)
+
+    def test_sweeper_releases_expired_holds(self):
+        """Test the sweeper gives back expired holds only"""
+        other = Ticket.objects.create(event=self.event, availability=10)
+        for _ in range(3):
+            self.hold(2, expired=True)
+            self.hold(1, ticket=other, expired=True)
+        live = self.hold(1)
+
+        # Lock the batch, mark it expired and one UPDATE per ticket
+        with self.assertNumQueries(6):
+            self.assertEqual(Booking.objects.expire_holds(), 6)
+
+        self.assertEqual(self.counts(), (9, 0))
+        self.assertEqual(self.counts(other), (10, 0))
+        self.assertEqual(Booking.objects.filter(status=Booking.EXPIRED).count(), 6)
+        self.assertEqual(Booking.objects.get(pk=live.pk).status, Booking.HELD)
+
+    def test_sweeper_task_drains_in_batches(self):
+        for _ in range(5):
+            self.hold(1, expired=True)
+
+        with override_settings(HOLD_SWEEP_BATCH_SIZE=2):
+            self.assertEqual(expire_holds(), 5)
+        self.assertEqual(self.counts(), (10, 0))
+
+    def test_expired_booking_is_released_once(self):
+        """Test deleting or updating an expired hold doesn't touch the ticket again"""
+        booking = self.hold(4, expired=True)
+        stale = Booking.objects.get(pk=booking.pk)
+        Booking.objects.expire_holds()
+
+        stale.quantity = 2
+        with self.assertRaises(ValidationError):
+            stale.save()
+        booking.delete()
+
+        self.assertEqual(self.counts(), (10, 0))
+
+    def test_delete_hold_releases_without_selling(self):
+        confirmed = Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=2)
+        held = self.hold(3)
+
+        held.delete()
+
+        self.assertEqual(self.counts(), (8, 2))
+        confirmed.delete()
+        self.assertEqual(self.counts(), (10, 0))
+
+    def test_update_hold_quantity(self):
+        booking = self.hold(3)
+
+        booking.quantity = 5
+        booking.save()
+
+        self.assertEqual(self.counts(), (5, 0))
+
+    @override_settings(INVENTORY_BACKEND='redis')
+    def test_holds_with_redis_inventory(self):
+        """Test hold, confirm and expiry move Redis inventory and pending sales"""
+        redis = fakeredis.FakeStrictRedis()
+        with patch('core.inventory.get_client', return_value=redis):
+            inventory._scripts.clear()
+            confirmed = self.hold(2)
+            self.hold(3, expired=True)
+            with self.captureOnCommitCallbacks(execute=True):
+                confirmed.confirm()
+            with self.captureOnCommitCallbacks(execute=True):
+                Booking.objects.expire_holds()
+
+            self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 8})
+            self.assertEqual(inventory.pending_sales([self.ticket.pk]), {self.ticket.pk: 2})
+            inventory.flush()
+        self.assertEqual(self.counts(), (8, 2))
+
+
+class HoldConcurrencyTests(HoldTestMixin, TransactionTestCase):
+    """Test holds, confirms and the sweeper racing on one ticket"""
+
+    def test_confirm_racing_the_sweeper(self):
+        self.make_fixtures(availability=40)
+        # Expire in a moment, so confirms and sweeps overlap around the deadline
+        holds = [self.hold(1) for _ in range(40)]
+        Booking.objects.filter(pk__in=[hold.pk for hold in holds]).update(
+            expires_at=timezone.now() + timedelta(milliseconds=200)
+        )
+        errors = []
+
+        def confirm(batch):
+            try:
+                for booking in batch:
+                    try:
+                        booking.confirm()
+                    except ValidationError:
+                        pass
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        def sweep():
+            try:
+                deadline = timezone.now() + timedelta(seconds=1)
+                while timezone.now() < deadline:
+                    Booking.objects.expire_holds(batch_size=5)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=confirm, args=(holds[i::4],)) for i in range(4)]
+        threads.append(threading.Thread(target=sweep))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        Booking.objects.expire_holds()
+
+        self.assertEqual(errors, [])
+        confirmed = Booking.objects.filter(status=Booking.CONFIRMED).aggregate(total=Sum('quantity'))['total'] or 0
+        self.assertFalse(Booking.objects.filter(status=Booking.HELD).exists())
+        # Every hold ended up confirmed (sold) or expired (given back), never both
+        self.assertEqual(self.counts(), (40 - confirmed, confirmed))
@@ -0,0 +1,278 @@
+"""
+Test Idempotency-Key replays of booking writes
+"""
+import threading
+from datetime import timedelta
+from unittest.mock import patch
+
+import fakeredis
+import redis
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from booking.views import BookingCreateView
+from core import idempotency
+from core.models import User, Customer, Event, Ticket, EventOrganizer, Booking, IdempotencyKey
+from core.tasks import purge_idempotency_keys
+from core.testing import QueryBudgetTestMixin, sample
+
+
+class IdempotencyTestMixin:
+
+    def make_fixtures(self):
+        organizer = EventOrganizer.objects.create(
+            user=User.objects.create_user('organizer@example.com', role='organizer')
+        )
+        self.event = Event.objects.create(organizer=organizer)
+        self.ticket = Ticket.objects.create(event=self.event, availability=10)
+        self.user = User.objects.create_user('customer@example.com', role='customer')
+        self.customer = Customer.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.book_url = reverse('booking:booking-book', kwargs={'event_id': self.event.pk, 'ticket_id': self.ticket.pk})
+
+    def client_for(self, user=None):
+        token = self.token if user is None else Token.objects.create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def book(self, key='key-1', quantity=1, client=None):
+        return (client or self.client_for()).post(self.book_url, {'quantity': quantity}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def availability(self):
+        return Ticket.objects.get(pk=self.ticket.pk).availability
+
+
+class IdempotencyTests(IdempotencyTestMixin, QueryBudgetTestMixin, TestCase):
+    """Keys kept in the database"""
+
+    def setUp(self):
+        super().setUp()
+        self.make_fixtures()
+
+    def test_retry_replays_the_response_without_booking_again(self):
+        first = self.book()
+        self.assertEqual(first.status_code, 201, first.data)
+
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.book()
+
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Content-Type'], first['Content-Type'])
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], 'true')
+        self.assertNotIn(idempotency.REPLAYED_HEADER, first)
+        self.assertFalse([q for q in queries if 'core_ticket' in q['sql']])
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(self.availability(), 9)
+
+    def test_requests_without_a_key_are_not_deduplicated(self):
+        self.client_for().post(self.book_url, {'quantity': 1})
+        self.client_for().post(self.book_url, {'quantity': 1})
+
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_key_reused_for_a_different_request(self):
+        self.book(quantity=1)
+
+        response = self.book(quantity=2)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.data['detail'].code, 'idempotency_key_reused')
+        self.assertEqual(self.availability(), 9)
+
+    def test_keys_are_per_user(self):
+        other = User.objects.create_user('other@example.com', role='customer')
+        Customer.objects.create(user=other)
+
+        self.book()
+        response = self.book(client=self.client_for(other))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn(idempotency.REPLAYED_HEADER, response)
+        self.assertEqual(self.availability(), 8)
+
+    def test_client_errors_are_replayed(self):
+        first = self.book(quantity=50)
+        self.assertEqual(first.status_code, 400)
+        # Tickets freed since don't change the answer to this key
+        Ticket.objects.filter(pk=self.ticket.pk).update(availability=100)
+
+        retry = self.book(quantity=50)
+
+        self.assertEqual(retry.status_code, 400)
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], 'true')
+        self.assertFalse(Booking.objects.exists())
+
+    def test_server_errors_are_not_stored(self):
+        with patch.object(BookingCreateView, 'perform_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.book()
+
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.book().status_code, 201)
+
+    def test_conflicts_are_not_stored(self):
+        with patch.object(BookingCreateView, 'perform_create', side_effect=idempotency.KeyInUse):
+            self.assertEqual(self.book().status_code, 409)
+
+        self.assertEqual(self.book().status_code, 201)
+
+    def test_key_in_progress(self):
+        perform_create = BookingCreateView.perform_create
+        duplicates = []
+
+        def perform_create_and_retry(view, serializer):
+            duplicates.append(self.book())
+            perform_create(view, serializer)
+
+        with patch.object(BookingCreateView, 'perform_create', perform_create_and_retry):
+            self.assertEqual(self.book().status_code, 201)
+
+        self.assertEqual(duplicates[0].status_code, 409)
+        self.assertEqual(duplicates[0]['Retry-After'], '1')
+        self.assertEqual(self.availability(), 9)
+
+    def test_abandoned_key_is_taken_over(self):
+        IdempotencyKey.objects.create(
+            key=idempotency.storage_key(self.user, 'key-1'), fingerprint='',
+            expires_at=timezone.now() - timedelta(seconds=1),
+        )
+
+        self.assertEqual(self.book().status_code, 201)
+
+    def test_update_and_delete_are_replayed(self):
+        self.book()
+        booking = Booking.objects.get()
+        client = self.client_for()
+        update_url = reverse('booking:booking-update', kwargs={'pk': booking.pk})
+        delete_url = reverse('booking:booking-delete', kwargs={'pk': booking.pk})
+
+        for _ in range(2):
+            response = client.patch(update_url, {'quantity': 3}, HTTP_IDEMPOTENCY_KEY='update-1')
+            self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.availability(), 7)
+
+        first = client.delete(delete_url, HTTP_IDEMPOTENCY_KEY='delete-1')
+        retry = client.delete(delete_url, HTTP_IDEMPOTENCY_KEY='delete-1')
+
+        self.assertEqual((first.status_code, retry.status_code), (204, 204))
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], 'true')
+        # Without the key the booking is gone
+        self.assertEqual(client.delete(delete_url).status_code, 404)
+        self.assertEqual(self.availability(), 10)
+
+    def test_purge_deletes_expired_keys(self):
+        self.book()
+        IdempotencyKey.objects.create(key='expired', fingerprint='', expires_at=timezone.now())
+
+        self.assertEqual(purge_idempotency_keys(), 1)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+
+@override_settings(IDEMPOTENCY_REDIS_URL='redis://idempotency')
+class RedisIdempotencyTests(IdempotencyTestMixin, TestCase):
+    """Keys kept in Redis"""
+
+    def setUp(self):
+        self.make_fixtures()
+        self.redis = fakeredis.FakeStrictRedis()
+        patcher = patch('core.idempotency.get_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retry_replays_the_response(self):
+        first = self.book()
+        retry = self.book()
+
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(self.availability(), 9)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        (key,) = self.redis.keys('idempotency:*')
+        self.assertGreater(self.redis.ttl(key), 60)
+
+    def test_falls_back_to_the_database(self):
+        fallbacks = sample('redis_fallbacks_total', component='idempotency')
+
+        with patch.object(self.redis, 'set', side_effect=redis.ConnectionError), \
+                self.assertLogs('core.idempotency', 'WARNING'):
+            self.book()
+            retry = self.book()
+
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(self.availability(), 9)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+        self.assertGreater(sample('redis_fallbacks_total', component='idempotency'), fallbacks)
+
+
+class IdempotencyConcurrencyTests(IdempotencyTestMixin, TransactionTestCase):
+    """Test duplicates of one request arriving together"""
+
+    def setUp(self):
+        self.make_fixtures()
+
+    def test_duplicate_while_the_first_is_running(self):
+        started, finish = threading.Event(), threading.Event()
+        perform_create = BookingCreateView.perform_create
+        responses = []
+
+        def slow_perform_create(view, serializer):
+            started.set()
+            finish.wait(5)
+            perform_create(view, serializer)
+
+        def first():
+            try:
+                responses.append(self.book())
+            finally:
+                connection.close()
+
+        with patch.object(BookingCreateView, 'perform_create', slow_perform_create):
+            thread = threading.Thread(target=first)
+            thread.start()
+            self.assertTrue(started.wait(5))
+            duplicate = self.book()
+            finish.set()
+            thread.join()
+
+        self.assertEqual(duplicate.status_code, 409)
+        self.assertEqual(responses[0].status_code, 201)
+        self.assertEqual(self.book()[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(self.availability(), 9)
+
+    def test_duplicates_book_once(self):
+        clients = 8
+        barrier = threading.Barrier(clients)
+        responses, errors = [], []
+
+        def post():
+            try:
+                client = self.client_for()
+                barrier.wait(5)
+                responses.append(self.book(client=client))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(self.availability(), 9)
+        statuses = [response.status_code for response in responses]
+        self.assertLessEqual(set(statuses), {201, 409})
+        # Only the first created the booking, the others were replays or refused
+        created = [r for r in responses if r.status_code == 201 and idempotency.REPLAYED_HEADER not in r]
+        self.assertEqual(len(created), 1)
@@ -0,0 +1,101 @@
+"""
+Test that the hot queries are served by the indexes declared on the models
+"""
+from datetime import timedelta
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+from django.utils import timezone
+from core.models import User, EventOrganizer, Customer, Event, Ticket, Booking
+
+
+class QueryPlanTestCase(TestCase):
+    """Seeds a dataset big enough for the planner to prefer an index scan
+
+    assertUsesIndex runs EXPLAIN on a queryset and checks the plan mentions
+    the index by name.
+    """
+
+    organizers = 20
+    events_per_organizer = 100
+    customers = 200
+    bookings_per_customer = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        users = User.objects.bulk_create(
+            User(email=f'org{i}@example.com', password='!', role='organizer') for i in range(cls.organizers)
+        )
+        organizers = EventOrganizer.objects.bulk_create(EventOrganizer(user=user) for user in users)
+        events = Event.objects.bulk_create(
+            Event(organizer=organizer, date=now + timedelta(hours=i))
+            for organizer in organizers for i in range(cls.events_per_organizer)
+        )
+        tickets = Ticket.objects.bulk_create(
+            Ticket(event=event, ticket_type=ticket_type) for event in events for ticket_type in ('VIP', 'Regular')
+        )
+        users = User.objects.bulk_create(
+            User(email=f'customer{i}@example.com', password='!', role='customer') for i in range(cls.customers)
+        )
+        customers = Customer.objects.bulk_create(Customer(user=user) for user in users)
+        Booking.objects.bulk_create(
+            Booking(customer=customer, event=ticket.event, ticket=ticket, quantity=1)
+            for i, customer in enumerate(customers)
+            for ticket in tickets[i * cls.bookings_per_customer:(i + 1) * cls.bookings_per_customer]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.organizer = organizers[0]
+        cls.customer = customers[0]
+        cls.event = events[0]
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f'{index_name} not used by:\n{queryset.query}\n{plan}')
+
+
+class IndexUsageTests(QueryPlanTestCase):
+    """Test the access paths of the API views"""
+
+    def test_catalogue_first_page(self):
+        self.assertUsesIndex(Event.objects.order_by('date', 'id')[:51], 'event_date_id_idx')
+
+    def test_catalogue_next_page(self):
+        date = self.event.date + timedelta(hours=50)
+        self.assertUsesIndex(
+            Event.objects.filter(date__gte=date).order_by('date', 'id')[:51], 'event_date_id_idx'
+        )
+
+    def test_events_of_organizer(self):
+        self.assertUsesIndex(Event.objects.filter(organizer=self.organizer), 'event_organizer_date_id_idx')
+
+    def test_tickets_of_event(self):
+        self.assertUsesIndex(Ticket.objects.filter(event_id=self.event.id), 'ticket_event_id_idx')
+
+    def test_bookings_of_customer(self):
+        self.assertUsesIndex(Booking.objects.filter(customer=self.customer), 'booking_customer_id_idx')
+
+    def test_bookings_of_event(self):
+        self.assertUsesIndex(Booking.objects.filter(event=self.event), 'booking_event_id_idx')
+
+
+class ConstraintTests(TestCase):
+    """Test the database rejects invalid quantities without the model's checks"""
+
+    def setUp(self):
+        organizer_user = User.objects.create_user('org@example.com', 'pass123', role='organizer')
+        customer_user = User.objects.create_user('customer@example.com', 'pass123', role='customer')
+        self.customer = Customer.objects.create(user=customer_user)
+        self.event = Event.objects.create(organizer=EventOrganizer.objects.create(user=organizer_user))
+        self.ticket = Ticket.objects.create(event=self.event, availability=1)
+
+    def test_availability_cannot_go_negative(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Ticket.objects.filter(pk=self.ticket.pk).update(availability=-1)
+
+    def test_booking_quantity_must_be_positive(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Booking.objects.bulk_create(
+                [Booking(customer=self.customer, event=self.event, ticket=self.ticket, quantity=0)]
+            )
@@ -0,0 +1,296 @@
+"""
+Test atomic ticket inventory operations
+"""
+import threading
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+import fakeredis
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core import inventory
+from core.models import EventOrganizer, Customer, Event, Ticket, Booking
+from core.tasks import flush_inventory
+
+
+class TicketManagerTests(TestCase):
+    """Test reserve/release on the Ticket manager"""
+
+    def setUp(self):
+        organizer_user = get_user_model().objects.create_user('org@example.com', 'pass123', role='organizer')
+        self.organizer = EventOrganizer.objects.create(user=organizer_user)
+        customer_user = get_user_model().objects.create_user('customer@example.com', 'pass123', role='customer')
+        self.customer = Customer.objects.create(user=customer_user)
+        self.event = Event.objects.create(organizer=self.organizer)
+        self.ticket = Ticket.objects.create(event=self.event, ticket_type='GA', price=Decimal('10.00'), availability=10)
+
+    def assertAvailability(self, expected):
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).availability, expected)
+
+    def test_reserve_takes_quantity(self):
+        """Test reserve decrements availability"""
+        Ticket.objects.reserve(self.ticket.pk, 4)
+        self.assertAvailability(6)
+
+    def test_reserve_and_release_move_revenue(self):
+        """Test revenue follows sold at the price given"""
+        Ticket.objects.reserve(self.ticket.pk, 4, unit_price=Decimal('10.00'))
+        Ticket.objects.release(self.ticket.pk, 1, unit_price=Decimal('10.00'))
+
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        self.assertEqual((ticket.sold, ticket.revenue), (3, Decimal('30.00')))
+
+    def test_reserve_more_than_available_raises(self):
+        """Test reserve never takes availability below zero"""
+        with self.assertRaises(ValidationError):
+            Ticket.objects.reserve(self.ticket.pk, 11)
+        self.assertAvailability(10)
+
+    def test_reserve_is_a_single_query(self):
+        """Test reserve issues one conditional UPDATE and no SELECT"""
+        with self.assertNumQueries(1):
+            Ticket.objects.reserve(self.ticket.pk, 1)
+
+    def test_update_booking_adjusts_by_difference(self):
+        """Test changing a booking's quantity only moves the difference"""
+        booking = Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=3)
+        booking.quantity = 8
+        booking.save()
+        self.assertAvailability(2)
+
+        booking.quantity = 1
+        booking.save()
+        self.assertAvailability(9)
+
+    def test_update_booking_exceeding_availability_raises(self):
+        """Test increasing a booking past availability is rejected"""
+        booking = Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=3)
+        booking.quantity = 11
+        with self.assertRaises(ValidationError):
+            booking.save()
+        self.assertAvailability(7)
+
+    def test_delete_booking_twice_releases_once(self):
+        """Test deleting an already deleted booking gives nothing back"""
+        booking = Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=3)
+        stale = Booking.objects.get(pk=booking.pk)
+        booking.delete()
+        stale.delete()
+        self.assertAvailability(10)
+
+
+class TicketContentionTests(TransactionTestCase):
+    """Test concurrent bookings never oversell"""
+
+    def test_concurrent_bookings_do_not_oversell(self):
+        organizer_user = get_user_model().objects.create_user('org@example.com', 'pass123', role='organizer')
+        organizer = EventOrganizer.objects.create(user=organizer_user)
+        customer_user = get_user_model().objects.create_user('customer@example.com', 'pass123', role='customer')
+        customer = Customer.objects.create(user=customer_user)
+        event = Event.objects.create(organizer=organizer)
+        ticket = Ticket.objects.create(event=event, availability=20)
+
+        def book():
+            try:
+                for _ in range(10):
+                    try:
+                        Booking.objects.create(customer=customer, event=event, ticket=ticket, quantity=1)
+                    except ValidationError:
+                        pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(Ticket.objects.get(pk=ticket.pk).availability, 0)
+        self.assertEqual(Booking.objects.filter(ticket=ticket).count(), 20)
+
+
+@override_settings(INVENTORY_BACKEND='redis')
+class RedisInventoryTests(TestCase):
+    """Test the Redis inventory mode against fakeredis"""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeStrictRedis()
+        patcher = patch('core.inventory.get_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        inventory._scripts.clear()
+
+        organizer_user = get_user_model().objects.create_user('org@example.com', 'pass123', role='organizer')
+        organizer = EventOrganizer.objects.create(user=organizer_user)
+        customer_user = get_user_model().objects.create_user('customer@example.com', 'pass123', role='customer')
+        self.customer = Customer.objects.create(user=customer_user)
+        self.event = Event.objects.create(organizer=organizer)
+        self.ticket = Ticket.objects.create(event=self.event, availability=10)
+
+    def db_availability(self):
+        return Ticket.objects.get(pk=self.ticket.pk).availability
+
+    def test_booking_decrements_redis_not_db(self):
+        """Test a booking only touches Redis until the flush"""
+        Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=4)
+
+        self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 6})
+        self.assertEqual(self.db_availability(), 10)
+
+    def test_booking_more_than_available_raises(self):
+        """Test the Lua reservation rejects overselling"""
+        with self.assertRaises(ValidationError):
+            Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=11)
+        self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 10})
+
+    def test_missing_key_is_loaded_from_db(self):
+        """Test a ticket unknown to Redis is loaded from its row first"""
+        self.redis.flushall()
+        Ticket.objects.reserve(self.ticket.pk, 3)
+        self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 7})
+
+    def test_flush_writes_back_in_batches(self):
+        """Test the flush task writes Redis availability to the Ticket rows"""
+        other = Ticket.objects.create(event=self.event, availability=5)
+        Ticket.objects.reserve(self.ticket.pk, 2)
+        Ticket.objects.reserve(other.pk, 5)
+        Ticket.objects.release(other.pk, 1)
+
+        self.assertEqual(flush_inventory(), 2)
+
+        self.assertEqual(self.db_availability(), 8)
+        self.assertEqual(Ticket.objects.get(pk=other.pk).availability, 1)
+        self.assertEqual(self.redis.scard(inventory.DIRTY_KEY), 0)
+
+    def test_flush_adds_pending_revenue(self):
+        """Test the flush adds the revenue counted in Redis to the Ticket row"""
+        Ticket.objects.reserve(self.ticket.pk, 3, unit_price=Decimal('12.50'))
+        Ticket.objects.release(self.ticket.pk, 1, unit_price=Decimal('12.50'))
+        self.assertEqual(inventory.pending_revenue([self.ticket.pk]), {self.ticket.pk: Decimal('25.00')})
+
+        flush_inventory()
+
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        self.assertEqual((ticket.sold, ticket.revenue), (2, Decimal('25.00')))
+        self.assertEqual(inventory.pending_revenue([self.ticket.pk]), {})
+
+    def test_saving_other_fields_keeps_redis_availability(self):
+        """Test a save that doesn't set availability leaves Redis, ahead of the row, alone"""
+        Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=8)
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+
+        ticket.price = Decimal('20.00')
+        ticket.save()
+        ticket.ticket_type = 'VIP'
+        ticket.save(update_fields=['ticket_type'])
+
+        self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 2})
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).price, Decimal('20.00'))
+        with self.assertRaises(ValidationError):
+            Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=3)
+
+        ticket.availability = 50
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.save()
+        self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 50})
+
+    def test_rolled_back_ticket_save_leaves_redis_alone(self):
+        """Test availability set in a transaction that rolls back never reaches Redis"""
+        Ticket.objects.reserve(self.ticket.pk, 2)
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                ticket.availability = 50
+                ticket.save()
+                raise RuntimeError
+
+        self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 8})
+
+    def test_price_patch_keeps_redis_availability(self):
+        """Test updating a ticket's price through the API doesn't hand sold tickets back"""
+        Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=8)
+        client = APIClient()
+        client.force_authenticate(user=self.event.organizer.user)
+        url = reverse('event:ticket-update', kwargs={'event_id': self.event.pk, 'pk': self.ticket.pk})
+
+        self.assertEqual(client.patch(url, {'price': '12.00'}).status_code, 200)
+
+        self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 2})
+
+    def test_delete_booking_releases_in_redis(self):
+        """Test cancelling gives the tickets back in Redis"""
+        booking = Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=4)
+        with self.captureOnCommitCallbacks() as callbacks:
+            booking.delete()
+        # Only once the delete commits
+        self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 6})
+
+        callbacks[0]()
+        self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 10})
+
+    def test_rolled_back_delete_keeps_redis_tickets(self):
+        """Test a delete rolled back with an outer transaction gives nothing back"""
+        booking = Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=4)
+        booking_id = booking.pk
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                booking.delete()
+                raise RuntimeError
+
+        self.assertTrue(Booking.objects.filter(pk=booking_id).exists())
+        self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 6})
+
+    def test_failed_save_gives_redis_tickets_back(self):
+        """Test a booking failing after the reservation, in the outbox say, doesn't keep the tickets"""
+        with patch('core.outbox.enqueue', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=4)
+
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 10})
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        """Test the reconcile command finds drift and repairs it from either side"""
+        Ticket.objects.reserve(self.ticket.pk, 3)
+        flush_inventory()
+        # Drift a flush won't repair, as after a crash between the two writes
+        inventory.store(self.ticket.pk, 5)
+        out = StringIO()
+
+        call_command('reconcile_inventory', stdout=out)
+        self.assertIn('drifted=1', out.getvalue())
+        self.assertEqual(self.db_availability(), 7)
+
+        call_command('reconcile_inventory', source='redis', stdout=out)
+        self.assertEqual(self.db_availability(), 5)
+
+        inventory.store(self.ticket.pk, 1)
+        call_command('reconcile_inventory', source='db', stdout=out)
+        self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 5})
+
+    def test_reconcile_skips_unflushed_tickets(self):
+        """Test a reservation not yet flushed is neither drift nor overwritten from the lagging row"""
+        Ticket.objects.reserve(self.ticket.pk, 3)
+        out = StringIO()
+
+        call_command('reconcile_inventory', source='db', stdout=out)
+
+        self.assertIn('drifted=0', out.getvalue())
+        self.assertIn('unflushed=1', out.getvalue())
+        self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 7})
+        self.assertEqual(self.db_availability(), 10)
+
+    def test_replace_refuses_a_changed_ticket(self):
+        """Test the reconcile write loses to a reservation made since the comparison"""
+        inventory.store(self.ticket.pk, 10)
+        self.assertFalse(inventory.replace(self.ticket.pk, 9, 4))
+        self.assertTrue(inventory.replace(self.ticket.pk, 10, 4))
+        self.assertEqual(inventory.read([self.ticket.pk]), {self.ticket.pk: 4})
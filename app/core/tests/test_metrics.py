@@ -0,0 +1,70 @@
+"""
+Test the metrics endpoint and what feeds it
+"""
+from types import SimpleNamespace
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core import metrics
+from core.models import User, Customer, Event, Ticket, EventOrganizer
+from core.testing import sample
+
+
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        organizer_user = User.objects.create_user('organizer@example.com', 'password', role='organizer')
+        self.event = Event.objects.create(organizer=EventOrganizer.objects.create(user=organizer_user))
+        self.ticket = Ticket.objects.create(event=self.event, availability=1)
+        self.user = User.objects.create_user('customer@example.com', 'password', role='customer')
+        Customer.objects.create(user=self.user)
+
+    def test_requests_are_counted_per_view(self):
+        labels = {'view': 'booking:booking-list', 'method': 'GET'}
+        before = sample('http_requests_total', status='200', **labels)
+        observed = sample('http_request_duration_seconds_count', **labels)
+        self.client.force_authenticate(user=self.user)
+
+        self.client.get(reverse('booking:booking-list'))
+
+        self.assertEqual(sample('http_requests_total', status='200', **labels), before + 1)
+        self.assertEqual(sample('http_request_duration_seconds_count', **labels), observed + 1)
+
+    def test_reservations_and_rejections(self):
+        reserved = sample('ticket_reservations_total', result='reserved')
+        rejected = sample('ticket_reservations_total', result='rejected')
+        updates = sample('ticket_update_seconds_count')
+
+        Ticket.objects.reserve(self.ticket.pk, 1)
+        with self.assertRaises(ValidationError):
+            Ticket.objects.reserve(self.ticket.pk, 1)
+
+        self.assertEqual(sample('ticket_reservations_total', result='reserved'), reserved + 1)
+        self.assertEqual(sample('ticket_reservations_total', result='rejected'), rejected + 1)
+        self.assertEqual(sample('ticket_update_seconds_count'), updates + 2)
+
+    def test_task_timings(self):
+        """Test the publish time set on the message is read back when the task starts"""
+        headers = {}
+        metrics.task_published(headers=headers)
+        task = SimpleNamespace(name='core.tasks.example', request=SimpleNamespace(**headers))
+        queued = sample('celery_task_queue_seconds_count', task=task.name)
+
+        metrics.task_started(task_id='1', task=task)
+        metrics.task_finished(task_id='1', task=task, state='SUCCESS')
+
+        self.assertEqual(sample('celery_task_queue_seconds_count', task=task.name), queued + 1)
+        self.assertEqual(sample('celery_task_duration_seconds_count', task=task.name), 1)
+        self.assertEqual(sample('celery_tasks_total', task=task.name, state='SUCCESS'), 1)
+
+    def test_metrics_endpoint(self):
+        Ticket.objects.reserve(self.ticket.pk, 1)
+
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('ticket_reservations_total{result="reserved"}', response.content.decode())
@@ -0,0 +1,103 @@
+"""
+Test the transactional outbox
+"""
+from unittest.mock import patch
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from core import outbox
+from core.models import EventOrganizer, Customer, Event, Ticket, Booking, OutboxMessage
+from core.tasks import send_booking_confirmation_email
+
+
+class OutboxTests(TestCase):
+    """Test notifications are written with the change and relayed later"""
+
+    def setUp(self):
+        organizer_user = get_user_model().objects.create_user('org@example.com', 'pass123', role='organizer')
+        self.organizer = EventOrganizer.objects.create(user=organizer_user)
+        customer_user = get_user_model().objects.create_user('customer@example.com', 'pass123', role='customer')
+        self.customer = Customer.objects.create(user=customer_user)
+        self.event = Event.objects.create(organizer=self.organizer)
+        self.ticket = Ticket.objects.create(event=self.event, availability=10)
+        OutboxMessage.objects.all().delete()
+
+    def book(self, quantity=1):
+        return Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=quantity)
+
+    def test_booking_writes_outbox_message(self):
+        """Test a booking records its notification instead of calling the broker"""
+        with patch.object(send_booking_confirmation_email, 'delay') as delay:
+            booking = self.book()
+
+        delay.assert_not_called()
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.task, send_booking_confirmation_email.name)
+        self.assertEqual(message.args, [booking.id, 'booking created'])
+        self.assertIsNone(message.sent_at)
+
+    def test_rolled_back_booking_leaves_no_message(self):
+        """Test a rolled back transaction sends nothing"""
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.book()
+                raise RuntimeError
+
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_rejected_booking_leaves_no_message(self):
+        with self.assertRaises(ValidationError):
+            self.book(quantity=11)
+
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_event_save_writes_outbox_message(self):
+        self.event.title = 'Renamed'
+        self.event.save()
+
+        self.assertEqual(OutboxMessage.objects.get().args, [self.event.id, 'event updated'])
+
+    def test_duplicate_dedup_key_is_dropped(self):
+        outbox.enqueue(send_booking_confirmation_email, 1, 'booking created', dedup_key='same')
+        outbox.enqueue(send_booking_confirmation_email, 1, 'booking created', dedup_key='same')
+
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    @patch('core.outbox.current_app')
+    def test_relay_sends_in_order_and_marks_sent(self, app):
+        first, second = self.book(), self.book()
+
+        call_command('relay_outbox', batch_size=1)
+        call_command('relay_outbox', batch_size=1)
+
+        sent = [call.kwargs['args'][0] for call in app.send_task.call_args_list]
+        self.assertEqual(sent, [first.id, second.id])
+        task_ids = [call.kwargs['task_id'] for call in app.send_task.call_args_list]
+        self.assertEqual(task_ids, [f'booking-created:{first.id}', f'booking-created:{second.id}'])
+        self.assertFalse(OutboxMessage.objects.filter(sent_at__isnull=True).exists())
+
+    @patch('core.outbox.current_app')
+    def test_relay_keeps_unsent_messages_when_broker_fails(self, app):
+        self.book()
+        self.book()
+        app.send_task.side_effect = [None, ConnectionError('broker down')]
+
+        with self.assertRaises(ConnectionError):
+            outbox.relay()
+
+        self.assertEqual(OutboxMessage.objects.filter(sent_at__isnull=True).count(), 1)
+
+        app.send_task.side_effect = None
+        self.assertEqual(outbox.relay(), 1)
+        self.assertEqual(app.send_task.call_count, 3)
+
+    def test_redelivered_task_runs_once(self):
+        """Test a task id seen before is skipped by the consumer"""
+        first = send_booking_confirmation_email.apply(args=(1, 'booking created'), task_id='booking-created:dedup-test')
+        second = send_booking_confirmation_email.apply(args=(1, 'booking created'), task_id='booking-created:dedup-test')
+
+        self.assertIsNotNone(first.result)
+        self.assertIsNone(second.result)
@@ -0,0 +1,99 @@
+"""
+Test partitioning the booking table by event
+"""
+import re
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from core.db import partitioning
+from core.models import User, Customer, Event, Ticket, EventOrganizer, Booking
+
+
+class PartitioningTests(TestCase):
+    """Partitioning is DDL, rolled back with each test"""
+
+    def setUp(self):
+        # Whatever BOOKING_PARTITIONS the test database was migrated with
+        partitioning.partition_bookings(connection, 0)
+        organizer = EventOrganizer.objects.create(
+            user=User.objects.create_user('organizer@example.com', role='organizer')
+        )
+        self.customer = Customer.objects.create(user=User.objects.create_user('customer@example.com'))
+        self.events = [Event.objects.create(organizer=organizer) for _ in range(3)]
+        self.tickets = [Ticket.objects.create(event=event, availability=100) for event in self.events]
+        self.bookings = [
+            Booking.objects.create(customer=self.customer, event=event, ticket=ticket, quantity=2)
+            for event, ticket in zip(self.events, self.tickets)
+        ]
+
+    def schema(self):
+        """Names of the booking table's indexes and constraints"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = %s::regclass '
+                'UNION SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass',
+                [partitioning.TABLE, partitioning.TABLE],
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def scanned(self, queryset):
+        """Tables the plan of a query reads"""
+        with connection.cursor() as cursor:
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plan = ' '.join(row[0] for row in cursor.fetchall())
+        return set(re.findall(rf' on ({partitioning.TABLE}(?:_p\d+)?)(?!\w)', plan))
+
+    def test_rebuilds_with_the_same_rows_and_schema(self):
+        schema = self.schema()
+
+        for partitions in (4, 2, 0):
+            partitioning.partition_bookings(connection, partitions)
+            self.assertEqual(partitioning.booking_partitions(connection), partitions)
+            self.assertEqual(self.schema(), schema)
+            self.assertEqual(Booking.objects.count(), 3)
+
+    def test_bookings_of_one_event_read_one_partition(self):
+        partitioning.partition_bookings(connection, 4)
+        event = self.events[0]
+
+        self.assertEqual(len(self.scanned(Booking.objects.filter(event=event))), 1)
+        self.assertEqual(len(self.scanned(Booking.objects.filter(pk=self.bookings[0].pk, event=event))), 1)
+        # Without the event every partition is searched
+        self.assertEqual(len(self.scanned(Booking.objects.filter(customer=self.customer))), 4)
+
+    def test_bookings_work_as_before_when_partitioned(self):
+        partitioning.partition_bookings(connection, 4)
+        booking = Booking.objects.get(pk=self.bookings[0].pk)
+
+        booking.quantity = 5
+        booking.save()
+        new = Booking.objects.create(customer=self.customer, event=self.events[1], ticket=self.tickets[1], quantity=1)
+        self.assertGreater(new.pk, max(b.pk for b in self.bookings))
+        self.bookings[2].delete()
+
+        self.assertEqual(Booking.objects.get(pk=booking.pk).quantity, 5)
+        self.assertEqual(Ticket.objects.get(pk=self.tickets[0].pk).availability, 95)
+        self.assertEqual(Ticket.objects.get(pk=self.tickets[2].pk).availability, 100)
+        self.events[1].delete()
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_refuses_unique_constraints_without_the_event(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            cursor.execute(
+                f'ALTER TABLE {partitioning.TABLE} ADD CONSTRAINT booking_once UNIQUE (customer_id, ticket_id)'
+            )
+
+        with self.assertRaisesRegex(ValueError, 'booking_once'):
+            partitioning.partition_bookings(connection, 4)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('partition_bookings', '2', stdout=out)
+        call_command('partition_bookings', '2', stdout=out)
+
+        self.assertEqual(partitioning.booking_partitions(connection), 2)
+        self.assertIn('already has 2 partitions', out.getvalue())
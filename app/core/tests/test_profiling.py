@@ -0,0 +1,73 @@
+"""
+Test the query profiling middleware and the query budget test helper
+"""
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from booking.views import BookingListView
+from core import profiling
+from core.models import User, Customer, Event, Ticket, EventOrganizer, Booking
+from core.testing import QueryBudgetTestMixin, sample
+
+
+class QueryProfileTestCase(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        organizer_user = User.objects.create_user('organizer@example.com', 'password', role='organizer')
+        event = Event.objects.create(organizer=EventOrganizer.objects.create(user=organizer_user))
+        ticket = Ticket.objects.create(event=event, availability=10)
+        self.user = User.objects.create_user('customer@example.com', 'password', role='customer')
+        customer = Customer.objects.create(user=self.user)
+        for _ in range(3):
+            Booking.objects.create(customer=customer, event=event, ticket=ticket, quantity=1)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('booking:booking-list')
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        db, serializer, total = response['Server-Timing'].split(', ')
+        self.assertRegex(db, r'^db;dur=[\d.]+;desc="queries=1"$')
+        self.assertRegex(serializer, r'^serializer;dur=[\d.]+$')
+        self.assertRegex(total, r'^total;dur=[\d.]+$')
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_can_be_turned_off(self):
+        self.assertNotIn('Server-Timing', self.client.get(self.url))
+
+    def test_serializer_time_is_recorded(self):
+        profiles = []
+        original = profiling.QueryProfileMiddleware.check_budget
+
+        def check_budget(middleware, request, profile):
+            profiles.append(profile)
+            return original(middleware, request, profile)
+
+        with patch.object(profiling.QueryProfileMiddleware, 'check_budget', check_budget):
+            self.client.get(self.url)
+
+        self.assertGreater(profiles[0].serializer_time, 0)
+        self.assertLessEqual(profiles[0].serializer_time, profiles[0].total_time)
+
+    def test_over_budget_is_flagged(self):
+        over_budget = sample('query_budget_exceeded_total', view='BookingListView')
+
+        with patch.object(BookingListView, 'query_budget', 0), self.assertLogs('core.profiling', 'WARNING'):
+            self.client.get(self.url)
+
+        self.assertEqual(sample('query_budget_exceeded_total', view='BookingListView'), over_budget + 1)
+        self.assertEqual(len(self.over_budget), 1)
+        self.assertIn('BookingListView.query_budget is 0', self.over_budget[0])
+        # The test itself is fine, only the helper's report is checked here
+        self.over_budget.clear()
+
+    def test_within_budget(self):
+        self.client.get(self.url)
+
+        self.assertEqual(self.over_budget, [])
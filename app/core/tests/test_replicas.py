@@ -0,0 +1,105 @@
+"""
+Test routing reads to replicas and pinning clients that wrote to the primary
+"""
+import time
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from core import caching
+from core.db import replicas
+from core.models import User, Customer, Event, Ticket, EventOrganizer
+
+EVENT_LIST_URL = reverse('event:event-list')
+BOOKING_LIST_URL = reverse('booking:booking-list')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(TransactionTestCase):
+    """A second connection to the test database stands in for the replica
+
+    It is added once the test runner has set up the databases, which it does
+    for the aliases in settings only.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.databases['replica'] = {**connections.databases['default']}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        organizer = EventOrganizer.objects.create(
+            user=User.objects.create_user('organizer@example.com', role='organizer')
+        )
+        self.event = Event.objects.create(organizer=organizer, title='Concert')
+        self.ticket = Ticket.objects.create(event=self.event, availability=10)
+        user = User.objects.create_user('customer@example.com', role='customer')
+        Customer.objects.create(user=user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+
+    def queries(self, request, *args, **kwargs):
+        """The response and the number of queries it ran on the primary and on the replica"""
+        with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(connections['replica']) as replica:
+            response = request(*args, **kwargs)
+        return response, len(primary), len(replica)
+
+    def book(self):
+        url = reverse('booking:booking-book', kwargs={'event_id': self.event.pk, 'ticket_id': self.ticket.pk})
+        response, _, on_replica = self.queries(self.client.post, url, {'quantity': 1})
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(on_replica, 0)
+        return response
+
+    def test_safe_requests_read_from_the_replica(self):
+        response, on_primary, on_replica = self.queries(APIClient().get, EVENT_LIST_URL)
+
+        self.assertEqual(response.data['results'][0]['title'], 'Concert')
+        self.assertEqual(on_primary, 0)
+        self.assertGreater(on_replica, 0)
+
+    def test_client_reads_its_writes_from_the_primary(self):
+        response = self.book()
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+
+        response, on_primary, on_replica = self.queries(self.client.get, BOOKING_LIST_URL)
+
+        self.assertEqual(len(response.data), 1)
+        self.assertGreater(on_primary, 0)
+        self.assertEqual(on_replica, 0)
+
+    def test_pin_header_for_clients_without_cookies(self):
+        until = self.book()[replicas.PIN_HEADER]
+        self.client.cookies.clear()
+
+        _, _, on_replica = self.queries(self.client.get, BOOKING_LIST_URL, HTTP_X_PRIMARY_UNTIL=until)
+        self.assertEqual(on_replica, 0)
+
+        _, _, on_replica = self.queries(self.client.get, BOOKING_LIST_URL)
+        self.assertGreater(on_replica, 0)
+
+    def test_ignores_expired_and_overlong_pins(self):
+        for until in (time.time() - 1, time.time() + 3600):
+            _, _, on_replica = self.queries(self.client.get, BOOKING_LIST_URL, HTTP_X_PRIMARY_UNTIL=str(int(until)))
+            self.assertGreater(on_replica, 0)
+
+    def test_response_from_the_replica_is_kept_briefly_after_a_write(self):
+        self.book()
+
+        with patch.object(caching.cache, 'set', wraps=caching.cache.set) as cache_set:
+            APIClient().get(EVENT_LIST_URL)
+
+        self.assertIn(5, [call.args[2] for call in cache_set.call_args_list if call.args[0].startswith('response:')])
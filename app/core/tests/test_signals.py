@@ -1 +1,66 @@
-# Tests for signals, if ever implemented
\ No newline at end of file
+"""
+Test signals invalidating cached tokens
+"""
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from core.authentication import _cache_key, local_tokens
+from core.models import User, Customer
+
+
+BOOKING_LIST_URL = reverse('booking:booking-list')
+
+
+class TokenInvalidationTests(TestCase):
+    """Test cached tokens stop working as soon as they are revoked"""
+
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='customer@example.com', password='password', role='customer')
+        self.customer = Customer.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.assertEqual(self.client.get(BOOKING_LIST_URL).status_code, 200)
+
+    def test_deleted_token_is_rejected(self):
+        """Test deleting a token invalidates the cached copy"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assertEqual(self.client.get(BOOKING_LIST_URL).status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        """Test deactivating a user invalidates their cached token"""
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get(BOOKING_LIST_URL).status_code, 401)
+
+    def test_deleted_user_is_rejected(self):
+        """Test deleting a user, and with it the token, invalidates the cache"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(self.client.get(BOOKING_LIST_URL).status_code, 401)
+
+    def test_invalidated_on_commit(self):
+        """Test nothing is invalidated before the change is committed"""
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.save()
+        self.assertIsNotNone(local_tokens.get(_cache_key(self.token.key)))
+
+        callbacks[0]()
+        self.assertIsNone(local_tokens.get(_cache_key(self.token.key)))
+
+    def test_other_processes_reject_revoked_token(self):
+        """Test a copy still in another process's LRU is not served after the revocation"""
+        stale = local_tokens.get(_cache_key(self.token.key))
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        local_tokens.set(_cache_key(self.token.key), stale, 30)
+
+        self.assertEqual(self.client.get(BOOKING_LIST_URL).status_code, 401)
@@ -0,0 +1,139 @@
+"""
+Test the token bucket throttle against both backends
+"""
+from unittest.mock import patch
+
+import fakeredis
+import redis
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core import throttling
+from core.models import User, Customer, Event, Ticket, EventOrganizer
+from core.testing import sample
+
+
+class TokenBucketTestMixin:
+    """Runs every test with a clock the test moves by hand"""
+
+    def setUp(self):
+        self.now = 1000.0
+        for name in ('time', 'monotonic'):
+            patcher = patch(f'core.throttling.time.{name}', side_effect=lambda: self.now)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        throttling.local_buckets.clear()
+        self.addCleanup(throttling.local_buckets.clear)
+
+    def take(self, key='throttle_booking_1', capacity=3, rate=1.0):
+        return throttling.take(key, capacity, rate)
+
+    def test_allows_a_burst_then_at_the_rate(self):
+        results = [self.take() for _ in range(4)]
+
+        self.assertEqual([allowed for allowed, _ in results], [True, True, True, False])
+        self.assertAlmostEqual(results[-1][1], 1.0)
+
+        self.now += 0.5
+        allowed, wait = self.take()
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 0.5)
+        self.now += 0.5
+        self.assertTrue(self.take()[0])
+
+    def test_idle_time_does_not_build_up_a_bigger_burst(self):
+        self.take()
+        self.now += 3600
+
+        self.assertEqual([self.take()[0] for _ in range(4)], [True, True, True, False])
+
+    def test_keys_have_separate_buckets(self):
+        for _ in range(3):
+            self.take()
+
+        self.assertTrue(self.take(key='throttle_booking_2')[0])
+
+
+@override_settings(THROTTLE_REDIS_URL=None)
+class LocalTokenBucketTests(TokenBucketTestMixin, SimpleTestCase):
+
+    def test_least_recently_used_buckets_are_dropped(self):
+        buckets = throttling.LocalBuckets(2)
+        for key in ('a', 'b', 'c'):
+            buckets.take(key, 1, 1.0)
+
+        self.assertTrue(buckets.take('a', 1, 1.0)[0])
+        self.assertFalse(buckets.take('c', 1, 1.0)[0])
+
+
+@override_settings(THROTTLE_REDIS_URL='redis://throttle')
+class RedisTokenBucketTests(TokenBucketTestMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.redis = fakeredis.FakeStrictRedis()
+        patcher = patch('core.throttling._script', self.redis.register_script(throttling.TAKE_SCRIPT))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('core.throttling.get_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_is_kept_in_redis(self):
+        self.take()
+
+        self.assertEqual(self.redis.hget('throttle_booking_1', 'tokens'), b'2')
+        self.assertGreater(self.redis.ttl('throttle_booking_1'), 0)
+
+    def test_falls_back_to_local_buckets_when_redis_fails(self):
+        fallbacks = sample('redis_fallbacks_total', component='throttle')
+
+        with patch('core.throttling._take_redis', side_effect=redis.ConnectionError), \
+                self.assertLogs('core.throttling', 'WARNING'):
+            self.assertEqual([self.take()[0] for _ in range(4)], [True, True, True, False])
+        self.assertEqual(sample('redis_fallbacks_total', component='throttle'), fallbacks + 4)
+
+
+@override_settings(
+    THROTTLE_REDIS_URL=None,
+    REST_FRAMEWORK={
+        'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+        'DEFAULT_THROTTLE_RATES': {'booking': '2/min'},
+    },
+)
+class BookingThrottleTestCase(TestCase):
+
+    def setUp(self):
+        throttling.local_buckets.clear()
+        self.addCleanup(throttling.local_buckets.clear)
+        self.client = APIClient()
+        organizer_user = User.objects.create_user('organizer@example.com', 'password', role='organizer')
+        event = Event.objects.create(organizer=EventOrganizer.objects.create(user=organizer_user))
+        ticket = Ticket.objects.create(event=event, availability=10)
+        self.url = reverse('booking:booking-book', kwargs={'event_id': event.pk, 'ticket_id': ticket.pk})
+        self.customers = []
+        for i in range(2):
+            user = User.objects.create_user(f'customer{i}@example.com', 'password', role='customer')
+            Customer.objects.create(user=user)
+            self.customers.append(user)
+
+    def book(self, user):
+        self.client.force_authenticate(user=user)
+        return self.client.post(self.url, {'quantity': 1}, format='json')
+
+    def test_throttled_with_retry_after(self):
+        allowed = sample('throttle_checks_total', scope='booking', result='allowed')
+        throttled = sample('throttle_checks_total', scope='booking', result='throttled')
+
+        responses = [self.book(self.customers[0]) for _ in range(3)]
+
+        self.assertEqual([response.status_code for response in responses], [201, 201, 429])
+        self.assertEqual(responses[-1]['Retry-After'], '30')
+        self.assertEqual(sample('throttle_checks_total', scope='booking', result='allowed'), allowed + 2)
+        self.assertEqual(sample('throttle_checks_total', scope='booking', result='throttled'), throttled + 1)
+
+    def test_buckets_are_per_user(self):
+        for _ in range(2):
+            self.book(self.customers[0])
+
+        self.assertEqual(self.book(self.customers[1]).status_code, 201)
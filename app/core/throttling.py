@@ -0,0 +1,130 @@
+"""
+Token bucket throttling for expensive endpoints
+
+Views opt in with throttle_classes = [TokenBucketThrottle] and a
+throttle_scope, the scope's rate comes from DEFAULT_THROTTLE_RATES in
+REST_FRAMEWORK ('10/min' is a bucket of 10 refilled at 10 per minute).
+Buckets are per scope and per user, or per client IP for anonymous requests.
+
+With THROTTLE_REDIS_URL set the buckets live in Redis, one Lua script per
+check, and are shared by every process. Without it, or while Redis is
+unreachable, each process keeps its own buckets, which is more lenient but
+never blocks a request on a dead Redis. The database is never touched.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+from rest_framework import throttling
+from rest_framework.settings import api_settings
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Returns {allowed, seconds until the next token}
+TAKE_SCRIPT = """
+local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local last = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(math.max(0, 1 - tokens) / rate)}
+"""
+
+_client = None
+_script = None
+
+
+class LocalBuckets:
+    """Token buckets of this process, the least recently used are dropped past size"""
+
+    def __init__(self, size):
+        self.size = size
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.size:
+                self._buckets.popitem(last=False)
+        return allowed, max(0, 1 - tokens) / rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+local_buckets = LocalBuckets(10000)
+
+
+def get_client():
+    """Return the throttle Redis client, short timeouts so a slow Redis falls back quickly"""
+    global _client, _script
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.THROTTLE_REDIS_URL, socket_timeout=0.1, socket_connect_timeout=0.1
+        )
+        _script = _client.register_script(TAKE_SCRIPT)
+    return _client
+
+
+def _take_redis(key, capacity, rate):
+    client = get_client()
+    allowed, wait = _script(keys=[key], args=[capacity, rate, time.time()], client=client)
+    return bool(allowed), float(wait)
+
+
+def take(key, capacity, rate):
+    """Take a token from the bucket, return (allowed, seconds until the next token)"""
+    if settings.THROTTLE_REDIS_URL:
+        try:
+            return _take_redis(key, capacity, rate)
+        except redis.RedisError:
+            metrics.REDIS_FALLBACKS.labels('throttle').inc()
+            logger.warning('Throttle Redis unavailable, using local buckets', exc_info=True)
+    return local_buckets.take(key, capacity, rate)
+
+
+class TokenBucketThrottle(throttling.ScopedRateThrottle):
+    """Throttle the view's throttle_scope with a token bucket, see the module docs"""
+
+    def __init__(self):
+        # ScopedRateThrottle picks the rate per request, once the view is known
+        pass
+
+    def get_rate(self):
+        # Read per call, not at import, so rate changes apply
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        self.rate = self.get_rate() if self.scope else None
+        if self.rate is None:
+            return True
+        capacity, duration = self.parse_rate(self.rate)
+
+        allowed, self.wait_seconds = take(
+            'throttle:' + self.get_cache_key(request, view), capacity, capacity / duration
+        )
+        metrics.THROTTLE_CHECKS.labels(self.scope, 'allowed' if allowed else 'throttled').inc()
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
@@ -0,0 +1,188 @@
+"""Pagination for Event API views"""
+
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class PageSizeMixin:
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+
+class EventCursorPagination(PageSizeMixin, BasePagination):
+    """Keyset pagination on (date, id), forward only
+
+    The cursor is the (date, id) of the last event on the previous page, so
+    every page is a range scan on the (date, id) ordering however deep into the
+    catalogue it is, instead of an OFFSET that reads and throws away rows.
+    """
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by('date', 'id')
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            date, pk = cursor
+            # date >= x keeps the predicate usable as an index range
+            queryset = queryset.filter(Q(date__gte=date) & (Q(date__gt=date) | Q(id__gt=pk)))
+
+        # One extra row tells us whether there is a next page without a COUNT
+        page = list(queryset[:self.page_size + 1])
+        self.next_cursor = None
+        if len(page) > self.page_size:
+            page = page[:self.page_size]
+            # Rows of .values() come as dicts (core/fast_lists.py)
+            last = page[-1]
+            self.next_cursor = (last['date'], last['id']) if isinstance(last, dict) else (last.date, last.pk)
+        return page
+
+    def decode_cursor(self, request):
+        """Return (date, id) from the cursor query param, None on the first page"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            date, pk = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            date = parse_datetime(date)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return date, pk
+
+    def encode_cursor(self, cursor):
+        date, pk = cursor
+        encoded = base64.urlsafe_b64encode(f'{date.isoformat()}|{pk}'.encode('ascii')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return self.encode_cursor(self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results to return per page, at most {self.max_page_size}.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class EventSearchPagination(PageSizeMixin, BasePagination):
+    """Numbered pages of search results, without a COUNT
+
+    Ranked results have no key to continue from, so pages are an OFFSET, kept
+    shallow by max_page. The total comes with the facets.
+    """
+    page_size = 20
+    max_page_size = 100
+    max_page = 50
+    page_query_param = 'page'
+    invalid_page_message = 'Invalid page'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        try:
+            self.page = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+        if not 1 <= self.page <= self.max_page:
+            raise NotFound(self.invalid_page_message)
+
+        offset = (self.page - 1) * self.page_size
+        page = list(queryset[offset:offset + self.page_size + 1])
+        self.has_next = len(page) > self.page_size and self.page < self.max_page
+        return page[:self.page_size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.page + 1)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.page_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Page number, at most {self.max_page}.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results to return per page, at most {self.max_page_size}.',
+                'schema': {'type': 'integer'},
+            },
+        ]
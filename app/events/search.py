@@ -0,0 +1,106 @@
+"""
+Full-text event search with facets
+
+Events match through Event.search_vector, a tsvector of the title (weight A),
+venue (B) and description (C) kept up to date by a trigger, and its GIN index.
+Matches are ranked by ts_rank, without a query they come in date order.
+
+Prices are filtered and counted on Event.min_price and max_price, which
+triggers on the ticket table keep, so neither needs a join to the tickets.
+
+facet_counts counts the events matching the same filters by venue, by month
+and by lowest ticket price in one pass over them.
+"""
+from decimal import Decimal
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+from core.models import Event
+
+# Text search configuration of the search_vector trigger (core migration 0020)
+SEARCH_CONFIG = 'english'
+# Lower price of each band in the price facet, the last band is open ended
+PRICE_BANDS = (Decimal(0), Decimal(25), Decimal(50), Decimal(100), Decimal(250))
+# Venues in the venue facet, those with the most events
+VENUE_FACETS = 20
+
+# GROUPING() of each grouping set in facet_counts, a bit is set for every
+# column the set doesn't group by
+BY_VENUE, BY_MONTH, BY_PRICE, TOTAL = 0b011, 0b101, 0b110, 0b111
+
+
+def search_events(q='', date_from=None, date_to=None, venue='', price_min=None, price_max=None):
+    """Return the events matching every filter given, best match first
+
+    An event matches a price range when its ticket prices overlap it.
+    """
+    events = Event.objects.all()
+    if date_from is not None:
+        events = events.filter(date__gte=date_from)
+    if date_to is not None:
+        events = events.filter(date__lte=date_to)
+    if venue:
+        events = events.filter(venue=venue)
+    if price_min is not None:
+        events = events.filter(max_price__gte=price_min)
+    if price_max is not None:
+        events = events.filter(min_price__lte=price_max)
+    if not q:
+        return events.order_by('date', 'id')
+
+    # Quoted phrases, OR and -word as in web search engines, never a syntax error
+    query = SearchQuery(q, config=SEARCH_CONFIG, search_type='websearch')
+    return events.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query)
+    ).order_by('-rank', 'id')
+
+
+def price_band_label(band):
+    """'25-50' for band 2, '250+' for the last"""
+    low = PRICE_BANDS[band - 1]
+    if band == len(PRICE_BANDS):
+        return f'{low}+'
+    return f'{low}-{PRICE_BANDS[band]}'
+
+
+def facet_counts(events):
+    """Count events by venue, month and band of their lowest ticket price, and in total
+
+    Events without tickets have no price band.
+    """
+    matched, params = events.order_by().values('venue', 'date', 'min_price').query.sql_with_params()
+    sql = f"""
+        SELECT kind, venue, month, band, events FROM (
+            SELECT GROUPING(venue, month, band) AS kind, venue, month, band, COUNT(*) AS events,
+                   row_number() OVER (PARTITION BY GROUPING(venue, month, band) ORDER BY COUNT(*) DESC, venue)
+                   AS position
+            FROM (
+                SELECT venue, to_char(date AT TIME ZONE %s, 'YYYY-MM') AS month,
+                       width_bucket(min_price, %s::numeric[]) AS band
+                FROM ({matched}) AS matched
+            ) AS facets
+            GROUP BY GROUPING SETS ((venue), (month), (band), ())
+        ) AS counts
+        WHERE kind <> %s OR position <= %s
+        ORDER BY kind, month, band, position
+    """
+    params = (
+        timezone.get_current_timezone_name(), list(PRICE_BANDS), *params, BY_VENUE, VENUE_FACETS,
+    )
+    with connections[events.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    facets = {'total': 0, 'venue': [], 'month': [], 'price': []}
+    for kind, venue, month, band, count in rows:
+        if kind == TOTAL:
+            facets['total'] = count
+        elif kind == BY_VENUE:
+            facets['venue'].append({'value': venue, 'count': count})
+        elif kind == BY_MONTH:
+            facets['month'].append({'value': month, 'count': count})
+        elif kind == BY_PRICE and band is not None:
+            facets['price'].append({'value': price_band_label(band), 'count': count})
+    return facets
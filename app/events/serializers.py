@@ -14,7 +14,7 @@ class EventSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Event
-        fields = ['id', 'organizer', 'date', 'venue', 'tickets', 'description', 'title']
+        fields = ['id', 'organizer', 'date', 'venue', 'tickets', 'description', 'title', 'admission_rate']
         read_only_fields = ['organizer', 'id']
 
     def create(self, validated_data):
@@ -44,3 +44,58 @@ class CreateTicketSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ticket
         fields = ['ticket_type', 'price', 'availability']
+
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # Only what was sent, in Redis inventory mode an availability left out
+        # must not overwrite Redis with the row's
+        instance.save(update_fields=list(validated_data))
+        return instance
+
+
+class BulkTicketUpdateSerializer(CreateTicketSerializer):
+    """One row of a bulk ticket update, only id is required"""
+    id = serializers.IntegerField()
+
+    class Meta(CreateTicketSerializer.Meta):
+        fields = ['id'] + CreateTicketSerializer.Meta.fields
+
+    def validate(self, attrs):
+        # partial=True makes every field optional, id included
+        if 'id' not in attrs:
+            raise serializers.ValidationError({'id': 'This field is required.'})
+        return attrs
+
+
+class TicketSalesSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    ticket_type = serializers.CharField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    sold = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=20, decimal_places=2)
+    remaining = serializers.IntegerField(source='availability')
+
+
+class EventStatsSerializer(serializers.Serializer):
+    event = serializers.IntegerField()
+    tickets_sold = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=20, decimal_places=2)
+    remaining = serializers.IntegerField()
+    ticket_types = TicketSalesSerializer(many=True)
+
+
+class EventSearchParamsSerializer(serializers.Serializer):
+    """Query parameters of the event search, see events/search.py"""
+    q = serializers.CharField(required=False, allow_blank=True, max_length=200)
+    date_from = serializers.DateTimeField(required=False)
+    date_to = serializers.DateTimeField(required=False)
+    venue = serializers.CharField(required=False, allow_blank=True, max_length=255)
+    price_min = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    price_max = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+
+    def validate(self, attrs):
+        for low, high in (('date_from', 'date_to'), ('price_min', 'price_max')):
+            if low in attrs and high in attrs and attrs[low] > attrs[high]:
+                raise serializers.ValidationError({high: f'Must not be less than {low}.'})
+        return attrs
@@ -1,10 +1,13 @@
 """Test event APIs"""
 
 from django.test import TestCase
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
+from core.testing import QueryBudgetTestMixin
 from rest_framework import status
 from django.urls import reverse
+from datetime import datetime, timedelta, timezone
 from core.models import EventOrganizer, Customer, Event, Ticket
 
 
@@ -19,8 +22,9 @@ MY_EVENTS_URL = reverse('event:event-list-myevents')
 # TICKET_UPDATE_URL = reverse('event:ticket-update', kwargs={'event_id': 1, 'pk': 2})
 
 
-class EventAPITests(TestCase):
+class EventAPITests(QueryBudgetTestMixin, TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = get_user_model().objects.create_user(
             email='test@example.com',
@@ -104,7 +108,7 @@ class EventAPITests(TestCase):
         response = self.client.get(EVENT_LIST_URL)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
 
     def test_create_event_successful(self):
@@ -195,3 +199,87 @@ class EventAPITests(TestCase):
         self.assertEqual(ticket.ticket_type, 'VIP')
         self.assertEqual(ticket.price, 20)
         self.assertEqual(ticket.availability, 50)
+
+
+class EventCatalogueTests(QueryBudgetTestMixin, TestCase):
+    """Test the cursor paginated event catalogue"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        orguser = get_user_model().objects.create_user(
+            email='organizer@example.com',
+            password='organizerpass',
+            role='organizer'
+        )
+        self.organizer = EventOrganizer.objects.create(user=orguser)
+
+    def create_events(self, count, same_date_every=1):
+        """Bulk create events, groups of same_date_every share a date, each with two tickets"""
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        events = Event.objects.bulk_create(
+            Event(organizer=self.organizer, date=start + timedelta(hours=i // same_date_every), title=f'Event {i}')
+            for i in range(count)
+        )
+        Ticket.objects.bulk_create(
+            Ticket(event=event, ticket_type=ticket_type, price=10, availability=100)
+            for event in events
+            for ticket_type in ('GA', 'VIP')
+        )
+        return events
+
+    def walk(self, page_size):
+        """Follow next links to the end, return all event ids in order"""
+        ids = []
+        url = f'{EVENT_LIST_URL}?page_size={page_size}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(event['id'] for event in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_pages_cover_every_event_once_in_date_id_order(self):
+        """Test paging through returns each event exactly once, ties on date broken by id"""
+        events = self.create_events(23, same_date_every=4)
+        expected = [event.id for event in sorted(events, key=lambda event: (event.date, event.id))]
+
+        self.assertEqual(self.walk(page_size=5), expected)
+
+    def test_events_include_their_tickets(self):
+        """Test nested tickets come from the tickets relation"""
+        self.create_events(1)
+
+        response = self.client.get(EVENT_LIST_URL)
+
+        tickets = response.data['results'][0]['tickets']
+        self.assertEqual(sorted(ticket['ticket_type'] for ticket in tickets), ['GA', 'VIP'])
+
+    def test_page_size_is_capped(self):
+        """Test page_size can't exceed the maximum"""
+        self.create_events(205)
+
+        response = self.client.get(f'{EVENT_LIST_URL}?page_size=1000')
+
+        self.assertEqual(len(response.data['results']), 200)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_invalid_cursor(self):
+        """Test a garbage cursor is a 404 not a server error"""
+        response = self.client.get(f'{EVENT_LIST_URL}?cursor=garbage')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_query_count_is_bounded_at_10k_events(self):
+        """Test any page costs two queries, events and their tickets, with 10k events"""
+        self.create_events(10000)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(f'{EVENT_LIST_URL}?page_size=200')
+        self.assertEqual(len(response.data['results']), 200)
+
+        for _ in range(5):
+            next_url = response.data['next']
+            with self.assertNumQueries(2):
+                response = self.client.get(next_url)
+        self.assertEqual(len(response.data['results']), 200)
@@ -0,0 +1,101 @@
+"""Test the versioned response cache on public event reads"""
+
+from django.test import TestCase
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from rest_framework import status
+from django.urls import reverse
+from core import caching
+from core.models import EventOrganizer, Customer, Event, Ticket, Booking
+
+
+EVENT_LIST_URL = reverse('event:event-list')
+
+
+class EventCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        orguser = get_user_model().objects.create_user(
+            email='organizer@example.com',
+            password='organizerpass',
+            role='organizer'
+        )
+        self.organizer = EventOrganizer.objects.create(user=orguser)
+        customer_user = get_user_model().objects.create_user(
+            email='customer@example.com',
+            password='customerpass',
+            role='customer'
+        )
+        self.customer = Customer.objects.create(user=customer_user)
+        self.event = Event.objects.create(organizer=self.organizer, title='Cached Event')
+        self.ticket = Ticket.objects.create(event=self.event, ticket_type='GA', price=10, availability=100)
+        self.tickets_url = reverse('event:ticket-list', kwargs={'event_id': self.event.id})
+        self.event_url = reverse('event:event-retrieve-by-id', kwargs={'pk': self.event.id})
+
+    def test_repeated_reads_hit_the_cache(self):
+        """Test a second identical read runs no queries"""
+        for url in (EVENT_LIST_URL, self.tickets_url, self.event_url):
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(second.status_code, status.HTTP_200_OK)
+            self.assertEqual(first.content, second.content)
+
+    def test_booking_invalidates_availability(self):
+        """Test a booking bumps the event so reads show the new availability"""
+        self.client.get(self.tickets_url)
+
+        Booking.objects.create(customer=self.customer, event=self.event, ticket=self.ticket, quantity=3)
+
+        response = self.client.get(self.tickets_url)
+        self.assertEqual(response.data[0]['availability'], 97)
+        response = self.client.get(EVENT_LIST_URL)
+        self.assertEqual(response.data['results'][0]['tickets'][0]['availability'], 97)
+
+    def test_event_and_ticket_writes_invalidate(self):
+        """Test event and ticket saves show up in cached reads"""
+        self.client.get(self.event_url)
+
+        self.event.title = 'Renamed'
+        self.event.save()
+        self.assertEqual(self.client.get(self.event_url).data['title'], 'Renamed')
+
+        self.ticket.price = 20
+        self.ticket.save()
+        self.assertEqual(self.client.get(self.tickets_url).data[0]['price'], '20.00')
+
+    def test_other_events_stay_cached(self):
+        """Test writes to one event don't invalidate another event's tickets"""
+        other = Event.objects.create(organizer=self.organizer)
+        other_url = reverse('event:ticket-list', kwargs={'event_id': other.id})
+        self.client.get(other_url)
+
+        self.ticket.price = 20
+        self.ticket.save()
+
+        with self.assertNumQueries(0):
+            self.client.get(other_url)
+
+    def test_if_none_match_returns_304(self):
+        """Test a matching ETag is answered with 304 and a stale one with the new body"""
+        etag = self.client.get(self.tickets_url)['ETag']
+
+        response = self.client.get(self.tickets_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        self.ticket.save()
+        response = self.client.get(self.tickets_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_evicted_version_does_not_revive_old_entries(self):
+        """Test losing a version counter never serves a response cached before it"""
+        self.client.get(self.tickets_url)
+        cache.delete(caching.event_version_key(self.event.id))
+        Ticket.objects.filter(pk=self.ticket.pk).update(availability=1)
+
+        response = self.client.get(self.tickets_url)
+        self.assertEqual(response.data[0]['availability'], 1)
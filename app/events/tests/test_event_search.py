@@ -0,0 +1,136 @@
+"""Test full-text event search, its filters and facets"""
+
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import EventOrganizer, Event, Ticket
+from core.testing import QueryBudgetTestMixin
+
+EVENT_SEARCH_URL = reverse('event:event-search')
+
+
+class EventSearchTests(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        user = get_user_model().objects.create_user('organizer@example.com', 'pass123', role='organizer')
+        self.organizer = EventOrganizer.objects.create(user=user)
+        self.jazz = self.create_event(
+            'Jazz Night', 'Blue Note', 'Quartet playing standards', datetime(2030, 5, 10, tzinfo=timezone.utc), 40
+        )
+        self.festival = self.create_event(
+            'Summer Festival', 'City Park', 'Rock, pop and a jazz stage',
+            datetime(2030, 6, 20, tzinfo=timezone.utc), 120,
+        )
+        self.comedy = self.create_event(
+            'Comedy Club', 'Blue Note', 'Stand-up all night', datetime(2030, 6, 1, tzinfo=timezone.utc), 15
+        )
+
+    def create_event(self, title, venue, description, date, price):
+        event = Event.objects.create(
+            organizer=self.organizer, title=title, venue=venue, description=description, date=date
+        )
+        Ticket.objects.create(event=event, price=Decimal(price))
+        return event
+
+    def search(self, **params):
+        response = self.client.get(EVENT_SEARCH_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response
+
+    def ids(self, response):
+        return [event['id'] for event in response.data['results']]
+
+    def test_ranks_title_matches_first(self):
+        response = self.search(q='jazz')
+
+        self.assertEqual(self.ids(response), [self.jazz.id, self.festival.id])
+        self.assertEqual(response.data['results'][0]['tickets'][0]['price'], '40.00')
+
+    def test_matches_stemmed_words_and_phrases(self):
+        self.assertEqual(self.ids(self.search(q='nights')), [self.jazz.id, self.comedy.id])
+        self.assertEqual(self.ids(self.search(q='"blue note" -comedy')), [self.jazz.id])
+
+    def test_search_vector_follows_updates(self):
+        self.jazz.title = 'Swing Night'
+        self.jazz.save()
+        Event.objects.filter(pk=self.comedy.pk).update(description='Improv')
+        Event.objects.bulk_create([Event(organizer=self.organizer, title='Jazz Brunch')])
+
+        self.assertEqual(len(self.ids(self.search(q='swing'))), 1)
+        self.assertEqual(self.ids(self.search(q='stand-up')), [])
+        self.assertEqual(len(self.ids(self.search(q='jazz'))), 2)
+
+    def test_filters(self):
+        self.assertEqual(
+            self.ids(self.search(date_from='2030-06-01T00:00:00Z', date_to='2030-06-30T00:00:00Z')),
+            [self.comedy.id, self.festival.id],
+        )
+        self.assertEqual(self.ids(self.search(venue='Blue Note')), [self.jazz.id, self.comedy.id])
+        self.assertEqual(self.ids(self.search(price_min='20', price_max='100')), [self.jazz.id])
+        self.assertEqual(self.ids(self.search(q='jazz', price_min='100')), [self.festival.id])
+
+    def test_price_range_follows_tickets(self):
+        ticket = Ticket.objects.create(event=self.jazz, price=Decimal('300'))
+        self.assertEqual(self.ids(self.search(price_min='200')), [self.jazz.id])
+
+        ticket.price = Decimal('90')
+        ticket.save()
+        self.assertEqual(self.ids(self.search(price_min='200')), [])
+        self.assertEqual(self.ids(self.search(price_min='80', price_max='100')), [self.jazz.id])
+
+        ticket.delete()
+        self.jazz.refresh_from_db()
+        self.assertEqual((self.jazz.min_price, self.jazz.max_price), (Decimal('40'), Decimal('40')))
+
+    def test_saving_an_event_keeps_its_prices(self):
+        event = Event.objects.get(pk=self.jazz.pk)
+        Ticket.objects.create(event=self.jazz, price=Decimal('10'))
+        event.title = 'Jazz Matinee'
+        event.save()
+
+        event.refresh_from_db()
+        self.assertEqual(event.min_price, Decimal('10'))
+        self.assertEqual(self.ids(self.search(q='matinee')), [self.jazz.id])
+
+    def test_facets(self):
+        Ticket.objects.create(event=self.jazz, price=Decimal('300'))
+        Event.objects.create(organizer=self.organizer, venue='City Park', date=self.jazz.date)
+
+        facets = self.search().data['facets']
+
+        self.assertEqual(facets['total'], 4)
+        self.assertEqual(facets['venue'], [{'value': 'Blue Note', 'count': 2}, {'value': 'City Park', 'count': 2}])
+        self.assertEqual(facets['month'], [{'value': '2030-05', 'count': 2}, {'value': '2030-06', 'count': 2}])
+        # By the lowest ticket price, the event without tickets has none
+        self.assertEqual(facets['price'], [
+            {'value': '0-25', 'count': 1},
+            {'value': '25-50', 'count': 1},
+            {'value': '100-250', 'count': 1},
+        ])
+
+    def test_facets_follow_the_filters(self):
+        facets = self.search(q='jazz').data['facets']
+
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(facets['venue'], [{'value': 'Blue Note', 'count': 1}, {'value': 'City Park', 'count': 1}])
+
+    def test_pages(self):
+        response = self.search(page_size=2)
+        self.assertEqual(self.ids(response), [self.jazz.id, self.comedy.id])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self.ids(response), [self.festival.id])
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get(EVENT_SEARCH_URL, {'price_min': 'free'}).status_code, 400)
+        self.assertEqual(self.client.get(EVENT_SEARCH_URL, {'price_min': 50, 'price_max': 10}).status_code, 400)
+        self.assertEqual(self.client.get(EVENT_SEARCH_URL, {'page': 51}).status_code, 404)
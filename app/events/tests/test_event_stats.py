@@ -0,0 +1,152 @@
+"""Test the organizer sales stats API"""
+
+from decimal import Decimal
+from unittest.mock import patch
+
+import fakeredis
+from django.contrib.auth import get_user_model
+from django.db.models import F, Sum
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core import inventory
+from core.models import EventOrganizer, Customer, Event, Ticket, Booking
+
+
+def stats_url(event_id):
+    return reverse('event:event-stats', kwargs={'event_id': event_id})
+
+
+class EventStatsTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.orguser = get_user_model().objects.create_user('organizer@example.com', 'pass123', role='organizer')
+        self.event = Event.objects.create(organizer=EventOrganizer.objects.create(user=self.orguser))
+        self.vip = Ticket.objects.create(event=self.event, ticket_type='VIP', price=Decimal('100.00'), availability=50)
+        self.regular = Ticket.objects.create(
+            event=self.event, ticket_type='Regular', price=Decimal('20.50'), availability=500
+        )
+        self.customers = [
+            Customer.objects.create(
+                user=get_user_model().objects.create_user(f'customer{i}@example.com', 'pass123', role='customer')
+            )
+            for i in range(3)
+        ]
+        self.client.force_authenticate(user=self.orguser)
+
+    def make_bookings(self):
+        bookings = [
+            Booking.objects.create(customer=customer, event=self.event, ticket=ticket, quantity=quantity)
+            for customer in self.customers
+            for ticket, quantity in ((self.vip, 2), (self.regular, 7))
+        ]
+        bookings[0].quantity = 5
+        bookings[0].save()
+        bookings[1].delete()
+        return bookings
+
+    def brute_force(self):
+        """Recompute the stats from every Booking row"""
+        expected = []
+        for ticket in Ticket.objects.filter(event=self.event).order_by('id'):
+            totals = Booking.objects.filter(ticket=ticket).aggregate(
+                sold=Sum('quantity'), revenue=Sum(F('quantity') * F('unit_price'))
+            )
+            expected.append({
+                'id': ticket.id,
+                'sold': totals['sold'] or 0,
+                'revenue': f'{totals["revenue"] or 0:.2f}',
+                'remaining': ticket.availability,
+            })
+        return expected
+
+    def assertMatchesBruteForce(self, data):
+        expected = self.brute_force()
+        self.assertEqual(
+            [{key: row[key] for key in ('id', 'sold', 'revenue', 'remaining')} for row in data['ticket_types']],
+            expected,
+        )
+        self.assertEqual(data['tickets_sold'], sum(row['sold'] for row in expected))
+        self.assertEqual(Decimal(data['revenue']), sum(Decimal(row['revenue']) for row in expected))
+        self.assertEqual(data['remaining'], sum(row['remaining'] for row in expected))
+
+    def test_stats_match_bookings(self):
+        """Test the stats equal a recomputation over the bookings"""
+        self.make_bookings()
+
+        response = self.client.get(stats_url(self.event.id))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['event'], self.event.id)
+        self.assertEqual(response.data['tickets_sold'], 5 + 2 + 2 + 7 + 7)
+        self.assertEqual(response.data['revenue'], '1187.00')
+        self.assertMatchesBruteForce(response.data)
+
+    def test_revenue_is_at_the_price_booked(self):
+        """Test changing a ticket's price doesn't change the revenue of bookings made before"""
+        self.make_bookings()
+        self.vip.price = Decimal('150.00')
+        self.vip.save()
+        Booking.objects.create(customer=self.customers[0], event=self.event, ticket=self.vip, quantity=1)
+
+        response = self.client.get(stats_url(self.event.id))
+
+        self.assertEqual(response.data['revenue'], '1337.00')
+        self.assertMatchesBruteForce(response.data)
+
+    def test_held_tickets_are_not_revenue(self):
+        """Test a hold only counts once confirmed"""
+        hold = Booking.objects.create(
+            customer=self.customers[0], event=self.event, ticket=self.vip, quantity=2, status=Booking.HELD
+        )
+        self.assertEqual(self.client.get(stats_url(self.event.id)).data['revenue'], '0.00')
+
+        hold.confirm()
+        self.assertEqual(self.client.get(stats_url(self.event.id)).data['revenue'], '200.00')
+
+    def test_query_count_does_not_grow_with_bookings(self):
+        """Test the stats cost the same queries however many bookings there are"""
+        self.client.get(stats_url(self.event.id))
+        with self.assertNumQueries(2):
+            self.client.get(stats_url(self.event.id))
+
+        self.make_bookings()
+        with self.assertNumQueries(2):
+            self.client.get(stats_url(self.event.id))
+
+    def test_ticket_update_keeps_sold(self):
+        """Test editing a ticket loaded before a booking doesn't reset its sales"""
+        stale = Ticket.objects.get(pk=self.vip.pk)
+        Booking.objects.create(customer=self.customers[0], event=self.event, ticket=self.vip, quantity=3)
+        stale.price = Decimal('90.00')
+        stale.save()
+
+        self.assertEqual(Ticket.objects.get(pk=self.vip.pk).sold, 3)
+
+    def test_other_users_get_404(self):
+        """Test only the event's organizer sees its stats"""
+        other = get_user_model().objects.create_user('other@example.com', 'pass123', role='organizer')
+        EventOrganizer.objects.create(user=other)
+        for user in (other, self.customers[0].user):
+            self.client.force_authenticate(user=user)
+            response = self.client.get(stats_url(self.event.id))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(INVENTORY_BACKEND='redis')
+    def test_stats_with_redis_inventory(self):
+        """Test sales held in Redis are counted before and after the flush"""
+        redis = fakeredis.FakeStrictRedis()
+        with patch('core.inventory.get_client', return_value=redis):
+            inventory._scripts.clear()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.make_bookings()
+
+            before_flush = self.client.get(stats_url(self.event.id)).data
+            inventory.flush()
+            after_flush = self.client.get(stats_url(self.event.id)).data
+
+        self.assertEqual(before_flush, after_flush)
+        self.assertEqual(after_flush['tickets_sold'], 5 + 2 + 2 + 7 + 7)
+        self.assertMatchesBruteForce(after_flush)
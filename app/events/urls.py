@@ -1,17 +1,21 @@
 # urls.py
 
 from django.urls import path
+from core.async_views import as_view
 from events.views import *
 
 app_name = 'event'
 
 urlpatterns = [
     path('create/', EventCreateView.as_view(), name='event-create'),
-    path('', EventListView.as_view(), name='event-list'),
+    path('', as_view(EventListView), name='event-list'),
+    path('search/', as_view(EventSearchView), name='event-search'),
     path('myevents/', MyEventListView.as_view(), name='event-list-myevents'),
-    path('<int:pk>/', MyEventRetrieveView.as_view(), name='event-retrieve-by-id'),
+    path('<int:pk>/', as_view(MyEventRetrieveView), name='event-retrieve-by-id'),
     path('<int:pk>/update/', MyEventUpdateView.as_view(), name='event-update'),
-    path('<int:event_id>/tickets/', TicketListView.as_view(), name='ticket-list'),
+    path('<int:event_id>/stats/', EventStatsView.as_view(), name='event-stats'),
+    path('<int:event_id>/tickets/', as_view(TicketListView), name='ticket-list'),
     path('<int:event_id>/tickets/create/', TicketCreateView.as_view(), name='ticket-create'),
+    path('<int:event_id>/tickets/bulk/', TicketBulkView.as_view(), name='ticket-bulk'),
     path('<int:event_id>/tickets/<int:pk>/update/', TicketUpdateView.as_view(), name='ticket-update'),
 ]
\ No newline at end of file
@@ -2,17 +2,25 @@
 Event Views
 """
 
-from rest_framework import generics, permissions
+from decimal import Decimal
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, permissions, serializers
 from core.models import Booking, Event, Customer, Ticket
 from events.serializers import *
 from rest_framework.response import Response
 from rest_framework import status, permissions
-from rest_framework import authentication
+from core.authentication import CachedTokenAuthentication
+from events.pagination import EventCursorPagination, EventSearchPagination
+from core import caching, inventory
+from events import search
+from core.caching import VersionedCacheMixin, CATALOGUE_VERSION_KEY, event_version_key
+from core.fast_lists import FastListMixin
 
 class EventCreateView(generics.CreateAPIView):
     queryset = Event.objects.all()
     serializer_class = EventSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
 
@@ -23,40 +31,74 @@ class EventCreateView(generics.CreateAPIView):
         context['request'] = self.request
         return context
 
-class EventListView(generics.ListAPIView):
-    queryset = Event.objects.all()
+class EventListView(VersionedCacheMixin, FastListMixin, generics.ListAPIView):
+    # Tickets for a whole page are fetched in one query
+    queryset = Event.objects.prefetch_related('tickets')
+    serializer_class = EventSerializer
+    permission_classes = [permissions.AllowAny]
+    query_budget = 2
+    pagination_class = EventCursorPagination
+
+    def get_cache_version_keys(self):
+        return [CATALOGUE_VERSION_KEY]
+
+class EventSearchView(VersionedCacheMixin, generics.ListAPIView):
+    """Full-text search of the catalogue with filters, and facet counts of all the matches"""
     serializer_class = EventSerializer
     permission_classes = [permissions.AllowAny]
+    # Page, its tickets, facets
+    query_budget = 3
+    pagination_class = EventSearchPagination
+
+    def get_cache_version_keys(self):
+        return [CATALOGUE_VERSION_KEY]
+
+    def get_queryset(self):
+        params = EventSearchParamsSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        return search.search_events(**params.validated_data)
+
+    def list(self, request, *args, **kwargs):
+        events = self.get_queryset()
+        page = self.paginate_queryset(events.prefetch_related('tickets'))
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        response.data['facets'] = search.facet_counts(events)
+        return response
 
 class MyEventListView(generics.ListAPIView):
     serializer_class = EventSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 4
 
     def get_queryset(self):
         user = self.request.user
         try:
             event_organizer = EventOrganizer.objects.get(user=user)
-            return Event.objects.filter(organizer=event_organizer)
+            return Event.objects.filter(organizer=event_organizer).prefetch_related('tickets')
         except EventOrganizer.DoesNotExist:
             return Event.objects.none()
 
 
-class MyEventRetrieveView(generics.RetrieveAPIView):
+class MyEventRetrieveView(VersionedCacheMixin, generics.RetrieveAPIView):
     serializer_class = EventSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.AllowAny]
+    query_budget = 2
+
+    def get_cache_version_keys(self):
+        return [event_version_key(self.kwargs['pk'])]
 
     def get_queryset(self):
         try:
-            return Event.objects
+            return Event.objects.prefetch_related('tickets')
         except Exception as e:
             raise e
 
 
 class MyEventUpdateView(generics.UpdateAPIView):
     serializer_class = EventSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     allowed_methods = ['PATCH']
 
@@ -69,9 +111,13 @@ class MyEventUpdateView(generics.UpdateAPIView):
             return Event.objects.none()
 
 
-class TicketListView(generics.ListAPIView):
+class TicketListView(VersionedCacheMixin, FastListMixin, generics.ListAPIView):
     serializer_class = TicketSerializer
     permission_classes = [permissions.AllowAny]
+    query_budget = 1
+
+    def get_cache_version_keys(self):
+        return [event_version_key(self.kwargs['event_id'])]
 
     def get_queryset(self):
         event_id = self.kwargs.get('event_id')
@@ -80,7 +126,7 @@ class TicketListView(generics.ListAPIView):
 class TicketCreateView(generics.CreateAPIView):
     serializer_class = CreateTicketSerializer
 
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
@@ -88,9 +134,86 @@ class TicketCreateView(generics.CreateAPIView):
         event = Event.objects.get(pk=event_id)
         serializer.save(event=event)
 
+class TicketBulkView(generics.GenericAPIView):
+    """Create (POST) or update (PATCH) many tickets of an event in one transaction
+
+    Ownership of the event is checked once for the whole list.
+    """
+    serializer_class = CreateTicketSerializer
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_event(self):
+        return get_object_or_404(Event, pk=self.kwargs['event_id'], organizer__user=self.request.user)
+
+    def post(self, request, event_id):
+        event = self.get_event()
+        serializer = CreateTicketSerializer(data=request.data, many=True, allow_empty=False)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            tickets = Ticket.objects.bulk_create(Ticket(event=event, **data) for data in serializer.validated_data)
+            # bulk_create skips Ticket.save, do what it would once for the batch
+            if inventory.is_enabled():
+                inventory.store_on_commit({ticket.pk: ticket.availability for ticket in tickets})
+            caching.bump_event(event.pk)
+
+        return Response(TicketSerializer(tickets, many=True).data, status=status.HTTP_201_CREATED)
+
+    def patch(self, request, event_id):
+        event = self.get_event()
+        serializer = BulkTicketUpdateSerializer(data=request.data, many=True, partial=True, allow_empty=False)
+        serializer.is_valid(raise_exception=True)
+        changes = {row.pop('id'): row for row in serializer.validated_data}
+        if len(changes) != len(serializer.validated_data):
+            raise serializers.ValidationError("Each ticket can only be listed once.")
+
+        with transaction.atomic():
+            tickets = list(
+                Ticket.objects.select_for_update().filter(event=event, pk__in=changes).order_by('pk')
+            )
+            if len(tickets) != len(changes):
+                raise serializers.ValidationError("Ticket not found for this event.")
+
+            fields = set()
+            for ticket in tickets:
+                for field, value in changes[ticket.pk].items():
+                    setattr(ticket, field, value)
+                    fields.add(field)
+            if fields:
+                Ticket.objects.bulk_update(tickets, sorted(fields))
+            if inventory.is_enabled():
+                inventory.store_on_commit({
+                    ticket.pk: ticket.availability for ticket in tickets if 'availability' in changes[ticket.pk]
+                })
+            caching.bump_event(event.pk)
+
+        return Response(TicketSerializer(tickets, many=True).data)
+
+
 class TicketUpdateView(generics.UpdateAPIView):
     queryset = Ticket.objects.all()
     serializer_class = CreateTicketSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     allowed_methods = ['PATCH']
+
+
+class EventStatsView(generics.GenericAPIView):
+    """Sales of an event for its organizer, from the ticket rows instead of the bookings"""
+    serializer_class = EventStatsSerializer
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 3
+
+    def get(self, request, event_id):
+        event = get_object_or_404(Event, pk=event_id, organizer__user=request.user)
+        ticket_types = Ticket.objects.sales(event.pk)
+        stats = {
+            'event': event.pk,
+            'tickets_sold': sum(ticket['sold'] for ticket in ticket_types),
+            'revenue': sum((ticket['revenue'] for ticket in ticket_types), Decimal('0')),
+            'remaining': sum(ticket['availability'] for ticket in ticket_types),
+            'ticket_types': ticket_types,
+        }
+        return Response(self.get_serializer(stats).data)
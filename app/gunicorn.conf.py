@@ -0,0 +1,72 @@
+"""
+Gunicorn config for serving the app in production
+
+    gunicorn -c gunicorn.conf.py app.wsgi
+
+or, with GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker, app.asgi.
+Every setting can be overridden from the environment.
+
+The Django app is loaded once in the master and forked into the workers
+(preload_app), so workers start fast and share memory. Because of that a
+HUP only restarts the workers on the code already loaded; to deploy new code
+send USR2 (start a new master next to the old one) and then QUIT to the old
+master once the new workers answer.
+"""
+import multiprocessing
+import os
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# sync: one request per worker at a time. gthread: `threads` requests per
+# worker, the booking views spend most of their time waiting on Postgres and
+# Redis. uvicorn.workers.UvicornWorker: ASGI, see app/asgi.py, Django runs
+# the sync views of a worker one at a time on a single thread there
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = env_int('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)
+threads = env_int('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1)
+
+preload_app = True
+
+# Longer than the load balancer's idle timeout, so the balancer closes idle
+# connections first and never sends a request down one gunicorn just closed.
+# Only gthread and uvicorn workers keep connections alive.
+keepalive = env_int('GUNICORN_KEEPALIVE', 75)
+timeout = env_int('GUNICORN_TIMEOUT', 30)
+# Time in-flight requests get to finish on shutdown or reload
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+# Recycle workers now and then, the jitter keeps them from restarting together
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 10000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', 1000)
+
+# Set to an empty string to turn the access log off
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+
+# Samples of a previous run would be added to this one's (see core/metrics.py).
+# Emptied here, before the app is preloaded, and only on the first start: this
+# file is read again on reloads, when the samples of retired workers must stay.
+# Only its files are removed, the unprivileged user gunicorn runs as can't
+# create the directory again (the image makes /vol/metrics for it)
+_metrics_directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if _metrics_directory and not os.environ.get('GUNICORN_METRICS_DIRECTORY_READY'):
+    os.makedirs(_metrics_directory, exist_ok=True)
+    for _name in os.listdir(_metrics_directory):
+        os.remove(os.path.join(_metrics_directory, _name))
+    os.environ['GUNICORN_METRICS_DIRECTORY_READY'] = '1'
+
+
+def post_fork(server, worker):
+    # Connections opened while preloading belong to the master, a worker
+    # sharing one socket with its siblings would interleave their traffic
+    from django.db import connections
+    connections.close_all()
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from core import metrics
+        metrics.mark_process_dead(worker.pid)
@@ -7,7 +7,8 @@ from rest_framework.response import Response
 from rest_framework import status, permissions
 from user.serializers import UserSerializer, CustomerSerializer, EventOrganizerSerializer, AuthTokenSerializer,UserApiCreateSerializer
 from rest_framework.authtoken.views import ObtainAuthToken
-from rest_framework import authentication
+from core.authentication import CachedTokenAuthentication
+from core.throttling import TokenBucketThrottle
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import generics, serializers
 from rest_framework.settings import api_settings
@@ -42,12 +43,14 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
     #this makes sure we get this in browsable api
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'token'
 
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     """Get to get the current user, and Patch to update user"""
     allowed_methods = ['GET', 'PATCH']